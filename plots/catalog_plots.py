@@ -1,5 +1,5 @@
 import math
-import pickle
+import sys
 import pandas as pd
 import plotly as plt
 import plotly.express as px
@@ -8,6 +8,10 @@ from datetime import datetime
 from tqdm import tqdm
 import os
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import density
+import healpix
+
 def scales(ra_range, dec_range, rabins, decbins):
     """
     Generates scales for RA and Declination based on specified ranges and number of bins.
@@ -23,34 +27,38 @@ def scales(ra_range, dec_range, rabins, decbins):
     dec = np.arange(dec_range[1],dec_range[0],-(dec_range[1] - dec_range[0]) / decbins)
     decs = []
     ras = []
+    #whole degrees print as before ("359"), finer cells keep their fraction ("359.75")
     for i in dec:
-        decs.append(str(int(i)))
+        decs.append(f"{i:g}")
     for i in ra:
-        ras.append(str(int(i)))
+        ras.append(f"{i:g}")
     return ras, decs
 
-def getSAOBins():
+def getSAOBins(resolution = 1):
     """
-    Retrieves SAO bins from the pickle file. 
+    Memory-maps the SAO bins from sao_bins_<resolution>deg.npy.
+    Args:
+        resolution (float): Cell size in degrees.
     Returns:
-        Numpy array: SAO bins.
+        Numpy memmap: SAO bins, RA x Dec.
     """
     try:
-        with open(f"{os.getcwd()}/sao_bins", "rb") as f:
-            unpickled_array = pickle.load(f)
-        return unpickled_array
+        return density.loadGrid(os.getcwd(), "sao", resolution)
     except Exception as e:
         print(e)
     
-def plotSAO():
+def plotSAO(resolution = 1):
     """
     Plots SAO Sky coverage using the SAO bins.
+    Args:
+        resolution (float): Cell size in degrees of the bins to plot.
     Returns:
         None
     """
-    a = getSAOBins()
-    b = [list(x) for x in zip(*a)]
-    ras, decs = scales([360, 0],[-90, 90],360, 180)
+    a = getSAOBins(resolution)
+    #RA x Dec bins plotted as Dec rows against RA columns; .T is a view of the memory map
+    b = a.T
+    ras, decs = scales([360, 0],[-90, 90], *a.shape)
     fig = px.imshow(
         b,
         labels=dict(x="Right Ascension", y="Declination"),
@@ -65,28 +73,30 @@ def plotSAO():
     fig.show()
     plt.offline.plot(fig, filename= f'{os.getcwd()}/sao2000.html')
 
-def getUCACBins():
+def getUCACBins(resolution = 1):
     """
-    Retrieves UCAC4 bins from the pickle file.
+    Memory-maps the UCAC4 bins from ucac_bins_<resolution>deg.npy.
+    Args:
+        resolution (float): Cell size in degrees.
     Returns:
-        Numpy array: UCAC4 bins.
+        Numpy memmap: UCAC4 bins, RA x Dec.
     """
     try:
-        with open(f"{os.getcwd()}/ucac_bins", "rb") as f:
-            unpickled_array = pickle.load(f)
-        return unpickled_array
+        return density.loadGrid(os.getcwd(), "ucac", resolution)
     except Exception as e: 
         print(e)
 
-def plotUCAC():
+def plotUCAC(resolution = 1):
     """
     Plots UCAC4 Sky coverage using the UCAC4 bins.
+    Args:
+        resolution (float): Cell size in degrees of the bins to plot.
     Returns:
         None
     """
-    bins = getUCACBins()
-    ras, decs = scales([360, 0],[-90, 90], 360, 180)
-    a = [list(x) for x in zip(*bins)]
+    bins = getUCACBins(resolution)
+    ras, decs = scales([360, 0],[-90, 90], *bins.shape)
+    a = bins.T
     fig = px.imshow(
         a,
         labels = dict(x="Right Ascension", y = "Declination"),
@@ -101,28 +111,30 @@ def plotUCAC():
     fig.show()
     plt.offline.plot(fig, filename = f'{os.getcwd()}/ucac4.html')
 
-def getGSCBins():
+def getGSCBins(resolution = 1):
     """
-    Retrieves GSC bins from the pickle file.
+    Memory-maps the GSC bins from gsc240_bins_<resolution>deg.npy.
+    Args:
+        resolution (float): Cell size in degrees.
     Returns:
-        Numpy array: GSC bins.
+        Numpy memmap: GSC bins, RA x Dec.
     """
     try:
-        with open(f"{os.getcwd()}/gsc240_bins", "rb") as f:
-            unpickled_array = pickle.load(f)
-        return unpickled_array
+        return density.loadGrid(os.getcwd(), "gsc240", resolution)
     except Exception as e: 
         print(e)
         
-def plotGSC():
+def plotGSC(resolution = 1):
     """
     Plots GSC Sky coverage using the GSC bins.
+    Args:
+        resolution (float): Cell size in degrees of the bins to plot.
     Returns:
         None
     """
-    a = getGSCBins()
-    b = [list(x) for x in zip(*a)]
-    ras, decs = scales([360,0],[-90,90],360,180)
+    a = getGSCBins(resolution)
+    b = a.T
+    ras, decs = scales([360, 0],[-90, 90], *a.shape)
     fig = px.imshow(
         b,
         labels=dict(x="Right Ascension", y = "Declination"),
@@ -138,28 +150,30 @@ def plotGSC():
     plt.offline.plot(fig, filename = f'{os.getcwd()}/gsc240.html')
 
     
-def getHIPBins():
+def getHIPBins(resolution = 1):
     """
-    Retrieves HIP bins from the pickle file.
+    Memory-maps the HIP bins from hip_bins_<resolution>deg.npy.
+    Args:
+        resolution (float): Cell size in degrees.
     Returns:
-        Numpy array: HIP bins.
+        Numpy memmap: HIP bins, RA x Dec.
     """
     try:
-        with open(f"{os.getcwd()}/hip_bins", "rb") as f:
-            unpickled_array = pickle.load(f)
-        return unpickled_array
+        return density.loadGrid(os.getcwd(), "hip", resolution)
     except Exception as e: 
         print(e)
 
-def plotHIP():
+def plotHIP(resolution = 1):
     """
     Plots HIP Sky coverage using the HIP bins.
+    Args:
+        resolution (float): Cell size in degrees of the bins to plot.
     Returns:
         None
     """
-    bins = getHIPBins()
-    ras, decs = scales([360, 0],[-90, 90], 360, 180)
-    a = [list(x) for x in zip(*bins)]
+    bins = getHIPBins(resolution)
+    ras, decs = scales([360, 0],[-90, 90], *bins.shape)
+    a = bins.T
     fig = px.imshow(
         a,
         labels = dict(x="Right Ascension", y = "Declination"),
@@ -174,29 +188,31 @@ def plotHIP():
     fig.show()
     plt.offline.plot(fig, filename = f'{os.getcwd()}/hip.html')
     
-def get2MASSBins():
+def get2MASSBins(resolution = 1):
     """
-    Retrieves 2MASS bins from the pickle file.
+    Memory-maps the 2MASS bins from 2mass_bins_<resolution>deg.npy.
+    Args:
+        resolution (float): Cell size in degrees.
     Returns:
-        Numpy array: 2MASS bins.
+        Numpy memmap: 2MASS bins, RA x Dec.
     """
     try:
-        with open(f"{os.getcwd()}/2mass_bins", "rb") as f:
-            unpickled_array = pickle.load(f)
-        return unpickled_array
+        return density.loadGrid(os.getcwd(), "2mass", resolution)
     except Exception as e: 
         print(e)
     
-def plot2MASS():
+def plot2MASS(resolution = 1):
     """
     Plots 2MASS Sky coverage using the 2MASS bins.
+    Args:
+        resolution (float): Cell size in degrees of the bins to plot.
     Returns:
         None
     """
-    bins = get2MASSBins()
+    bins = get2MASSBins(resolution)
     
-    ras, decs = scales([360, 0],[-90, 90], 360, 180)
-    a = [list(x) for x in zip(*bins)]
+    ras, decs = scales([360, 0],[-90, 90], *bins.shape)
+    a = bins.T
     # print(bins)
     fig = px.imshow(
         a,
@@ -212,30 +228,32 @@ def plot2MASS():
     fig.show()
     plt.offline.plot(fig, filename = f'{os.getcwd()}/2mass.html')
 
-def getGAIABins():
+def getGAIABins(resolution = 1):
     """
-    Retrieves GAIA bins from the pickle file
+    Memory-maps the GAIA bins from gaia_bins_<resolution>deg.npy.
+    Args:
+        resolution (float): Cell size in degrees.
     Returns:
-        Numpy array: GAIA bins.
+        Numpy memmap: GAIA bins, RA x Dec.
     """
     try:
-        with open(f"{os.getcwd()}/gaia_bins", "rb") as f:
-            unpickled_array = pickle.load(f)
-        return unpickled_array
+        return density.loadGrid(os.getcwd(), "gaia", resolution)
     except Exception as e: 
         print(e)
     
     
-def plotGAIA():
+def plotGAIA(resolution = 1):
     """
     Plots GAIA Sky coverage using the GAIA bins.
+    Args:
+        resolution (float): Cell size in degrees of the bins to plot.
     Returns:
         None
     """
-    bins = getGAIABins()
+    bins = getGAIABins(resolution)
     
-    ras, decs = scales([360, 0],[-90, 90], 360, 180)
-    a = [list(x) for x in zip(*bins)]
+    ras, decs = scales([360, 0],[-90, 90], *bins.shape)
+    a = bins.T
     fig = px.imshow(
         a,
         labels = dict(x="Right Ascension", y = "Declination"),
@@ -249,7 +267,104 @@ def plotGAIA():
     height = 600)
     fig.show()
     plt.offline.plot(fig, filename = f'{os.getcwd()}/gaia.html')
-    
+
+def healpixPixelSize(order):
+    """
+    Args:
+        order (int): HEALPix order.
+    Returns:
+        float: Side in degrees of a square with the area of one pixel.
+    """
+    return math.sqrt(4 * 180 ** 2 / math.pi / density.healpixPixels(order))
+
+def healpixOrderFor(width, height, raRange, decRange, orders):
+    """
+    Picks the finest HEALPix order whose pixels are at least as large as a screen pixel, so every map pixel in the
+    image lands under at least one screen pixel and none is skipped between the sampled ones.
+    Args:
+        width (int): Image width in screen pixels.
+        height (int): Image height in screen pixels.
+        raRange (List): RA range of the image in degrees.
+        decRange (List): Dec range of the image in degrees.
+        orders (List): Orders available, coarsest first.
+    Returns:
+        int: HEALPix order, the coarsest available if none is coarse enough.
+    """
+    screen = max((raRange[1] - raRange[0]) / width, (decRange[1] - decRange[0]) / height)
+    picked = orders[0]
+    for order in orders:
+        if healpixPixelSize(order) >= screen:
+            picked = order
+    return picked
+
+def healpixImage(counts, order, width, height, raRange, decRange, samples = None):
+    """
+    Averages a nested HEALPix map into the screen pixels of an RA/Dec image, from samples x samples points spread
+    over each screen pixel.
+    Args:
+        counts (Numpy array): Map of 12 * 4**order counts, ex: from density.loadHealpix.
+        order (int): HEALPix order of the map.
+        width (int): Image width in screen pixels.
+        height (int): Image height in screen pixels.
+        raRange (List): RA range of the image in degrees.
+        decRange (List): Dec range of the image in degrees.
+        samples (int): Points per screen pixel side (default = None, enough for the map pixels to be no smaller than the spacing of the points, at most 8).
+    Returns:
+        Tuple: (Numpy array, List, List) - height x width stars per square degree with north at the top, RA labels, Dec labels
+    """
+    raStep = (raRange[1] - raRange[0]) / width
+    decStep = (decRange[1] - decRange[0]) / height
+    if samples is None:
+        samples = min(8, max(1, math.ceil(max(raStep, decStep) / healpixPixelSize(order))))
+    ra = raRange[0] + (np.arange(width * samples) + 0.5) * raStep / samples
+    dec = decRange[1] - (np.arange(height * samples) + 0.5) * decStep / samples
+    raGrid, decGrid = np.meshgrid(ra, dec)
+    image = counts[healpix.healpixIds(raGrid.ravel(), decGrid.ravel(), order)].reshape(height, samples, width, samples).mean(axis = (1, 3))
+    #equal-area pixels, so dividing by the pixel area makes maps of different orders comparable
+    image = image / healpixPixelSize(order) ** 2
+    raCenters = raRange[0] + (np.arange(width) + 0.5) * raStep
+    decCenters = decRange[1] - (np.arange(height) + 0.5) * decStep
+    return image, [f"{value:.4g}" for value in raCenters], [f"{value:.4g}" for value in decCenters]
+
+def plotHealpix(catalog, title, fileName, width = 800, height = 400, raRange = [0, 360], decRange = [-90, 90], order = None):
+    """
+    Plots sky coverage from the HEALPix maps written by an ingest with --bins-healpix. Only a few points per screen
+    pixel are read from the memory-mapped map, at the order picked by healpixOrderFor, so an arcminute map of
+    a small field is as cheap to plot and as small an html file as the whole sky.
+    Args:
+        catalog (str): Catalog name, ex: "gaia" reads gaia_hpx_<order>.npy.
+        title (str): Plot title.
+        fileName (str): Name of the html file written, without the extension.
+        width (int): Image width in screen pixels.
+        height (int): Image height in screen pixels.
+        raRange (List): RA range to plot in degrees.
+        decRange (List): Dec range to plot in degrees.
+        order (int): HEALPix order to plot (default = None, picked from the image size).
+    Returns:
+        None
+    """
+    orders = density.healpixOrders(os.getcwd(), catalog)
+    if not orders:
+        print(f"No {catalog}_hpx_<order>.npy maps in {os.getcwd()}")
+        return
+    if order is None:
+        order = healpixOrderFor(width, height, raRange, decRange, orders)
+    counts = density.loadHealpix(os.getcwd(), catalog, order)
+    image, ras, decs = healpixImage(counts, order, width, height, raRange, decRange)
+    fig = px.imshow(
+        image,
+        labels = dict(x="Right Ascension", y = "Declination", color = "Stars per square degree"),
+        y = decs,
+        x = ras,
+        title = f"{title} (HEALPix order {order})"
+    )
+    fig.update_layout(
+    autosize = False,
+    width = width + 200,
+    height = height + 200)
+    fig.show()
+    plt.offline.plot(fig, filename = f'{os.getcwd()}/{fileName}.html')
+
 if __name__ == "__main__":
     plotSAO()
     plotUCAC()
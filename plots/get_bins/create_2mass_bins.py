@@ -1,31 +1,15 @@
-import csv
-import pickle
-import numpy as np
-from tqdm import tqdm
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+import density
+from create_bins import createBins
 
 def create2MASSBins():
-    ra_bins = 360
-    dec_bins = 180
-    bins = np.zeros(ra_bins * dec_bins).reshape(ra_bins, dec_bins)
     path = "" #path to 2mass catalog
-    for decl in tqdm(range(180)):
-        for decl_decimal in range(10):
-            for ra in range(360):
-                declf = "{:>03}".format(decl)
-                decl_decimalf = "{:>04}".format(decl_decimal)
-                raf = "{:>03}".format(ra)
-                file = f"{declf}/{decl_decimalf}/{raf}.dat"
-                try:
-                    with open(f'{path}/{file}', 'r') as f:
-                        csvFile = csv.reader(f)
-                        count = (sum(1 for row in csvFile))
-                        bins[ra][decl] += count
-                except Exception as e:
-                    if e.args[0] != 2:
-                        print(e)
-    with open(f"{os.getcwd()}/2mass_bins", "wb") as f:
-        pickle.dump(bins, f)
+    #counted in parallel by create_bins.py, which can also build several catalogs at once
+    bins, size = createBins("2mass", path)
+    density.saveGrid(os.getcwd(), "2mass", bins)
     # return bins
 
 if __name__ == "__main__":
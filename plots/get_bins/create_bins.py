@@ -0,0 +1,185 @@
+import os
+import re
+import sys
+import time
+import argparse
+import numpy as np
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+import density
+
+BUFFER_SIZE = 1 << 20
+# Slices of the file list per process, so a slow directory does not leave the other processes idle at the end
+SLICES_PER_PROCESS = 4
+
+GAIA_FOLDER = re.compile(r"ra\+(\d{3})\+\d{3}$")
+GAIA_FILE = re.compile(r"dec([+-]\d{3})[+-]\d{3}\.csv$")
+
+def countLines(path, bufferSize = BUFFER_SIZE):
+    """
+    Counts the lines of a file by scanning its bytes for newlines, reading into one reused buffer.
+    Args:
+        path (str): File path.
+        bufferSize (int): Bytes read at a time.
+    Returns:
+        int: Lines in the file, including a last line with no newline.
+    """
+    lines = 0
+    last = b"\n"
+    buffer = bytearray(bufferSize)
+    with open(path, "rb", buffering = 0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            lines += buffer.count(b"\n", 0, n)
+            last = buffer[n - 1:n]
+    return lines + (last != b"\n")
+
+def numbered(folder):
+    """
+    Args:
+        folder (str): Folder path.
+    Returns:
+        List: (int, str) - the number and name of each entry whose name is a number, ex: (12, "012")
+    """
+    if not os.path.isdir(folder):
+        return []
+    return sorted((int(name), name) for name in os.listdir(folder) if name.isdigit())
+
+def zoneFiles(path, extension):
+    """
+    Lists the files of a 2mass or gsc240 folder, laid out <Dec + 90>/<Dec decimal>/<RA>.<extension>.
+    Args:
+        path (str): Catalog folder.
+        extension (str): File extension, ex: ".dat".
+    Returns:
+        List: (str, int, int) - file path, RA cell, Dec cell
+    """
+    files = []
+    for decl, declName in numbered(path):
+        for _, decimalName in numbered(os.path.join(path, declName)):
+            folder = os.path.join(path, declName, decimalName)
+            for name in sorted(os.listdir(folder)):
+                root, ext = os.path.splitext(name)
+                if ext == extension and root.isdigit():
+                    files.append((os.path.join(folder, name), int(root) % density.RA_BINS, decl))
+    return files
+
+def twoMassFiles(path):
+    """
+    Args:
+        path (str): 2mass data folder.
+    Returns:
+        List: (str, int, int) - file path, RA cell, Dec cell
+    """
+    return zoneFiles(path, ".dat")
+
+def gscFiles(path):
+    """
+    Args:
+        path (str): gsc240 csv folder.
+    Returns:
+        List: (str, int, int) - file path, RA cell, Dec cell
+    """
+    return zoneFiles(path, ".csv")
+
+def gaiaFiles(path):
+    """
+    Lists the files of the gaia folder, laid out ra+<RA>+<RA + 1>/dec<low>< high>.csv, ex: ra+012+013/dec-001-000.csv.
+    Args:
+        path (str): gaia data folder.
+    Returns:
+        List: (str, int, int) - file path, RA cell, Dec cell (low Dec + 90)
+    """
+    files = []
+    for folderName in sorted(os.listdir(path)):
+        folderMatch = GAIA_FOLDER.match(folderName)
+        if not folderMatch or not os.path.isdir(os.path.join(path, folderName)):
+            continue
+        for name in sorted(os.listdir(os.path.join(path, folderName))):
+            fileMatch = GAIA_FILE.match(name)
+            if fileMatch:
+                files.append((os.path.join(path, folderName, name), int(folderMatch.group(1)) % density.RA_BINS, int(fileMatch.group(1)) + 90))
+    return files
+
+# Catalogs whose bins count the lines of one file per cell: {catalog: function listing the files}
+CATALOGS = {"2mass": twoMassFiles, "gsc240": gscFiles, "gaia": gaiaFiles}
+
+def countFiles(files):
+    """
+    Counts the lines of a slice of the file list into a grid; runs in a pool process.
+    Args:
+        files (List): (file path, RA cell, Dec cell) tuples.
+    Returns:
+        Tuple: (Numpy array, int) - RA_BINS x DEC_BINS partial grid, bytes read
+    """
+    bins = np.zeros((density.RA_BINS, density.DEC_BINS), dtype = np.int64)
+    size = 0
+    for path, ra, dec in files:
+        try:
+            bins[ra][dec] += countLines(path)
+            size += os.path.getsize(path)
+        except OSError as e:
+            print(e)
+    return bins, size
+
+def createBins(catalog, path, processes = None):
+    """
+    Counts a catalog's stars per 1 x 1 degree cell by counting the lines of its files in a process pool, and adds
+    up the pool's partial grids.
+    Args:
+        catalog (str): Catalog in CATALOGS.
+        path (str): Catalog data folder.
+        processes (int): Processes counting at once (default = None, one per CPU).
+    Returns:
+        Tuple: (Numpy array, int) - RA_BINS x DEC_BINS grid, bytes read
+    """
+    files = CATALOGS[catalog](path)
+    processes = processes or os.cpu_count()
+    #interleaved, so each slice gets files from every part of the sky
+    slices = [files[i::processes * SLICES_PER_PROCESS] for i in range(processes * SLICES_PER_PROCESS)]
+    bins = np.zeros((density.RA_BINS, density.DEC_BINS), dtype = np.int64)
+    size = 0
+    with multiprocessing.Pool(processes) as pool:
+        for partial, partialSize in pool.imap_unordered(countFiles, [s for s in slices if s]):
+            bins += partial
+            size += partialSize
+    return bins, size
+
+def parseArguments(in_args):
+    """
+    Parses command-line arguments.
+    Args:
+        in_args (List): List of command-line arguments.
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    description = "Counts the stars of the 2mass, gsc240 and gaia folders per 1 x 1 degree cell in parallel and writes <catalog>_bins_1deg.npy"
+    usage = "\n{} [--2mass folder] [--gsc240 folder] [--gaia folder] [-p processes] [-o output folder]\n".format(in_args[0])
+    epilog = ""
+    parser = argparse.ArgumentParser(description = description, usage = usage, epilog = epilog)
+    parser.add_argument("--2mass", dest = "twoMass", type = str, help = "2mass data folder (default = None)", default = "")
+    parser.add_argument("--gsc240", dest = "gsc240", type = str, help = "gsc240 csv folder (default = None)", default = "")
+    parser.add_argument("--gaia", dest = "gaia", type = str, help = "gaia data folder (default = None)", default = "")
+    parser.add_argument("-p", "--processes", dest = "processes", type = int, help = "Processes counting files at once (default = one per CPU)", default = None)
+    parser.add_argument("-o", "--output", dest = "output", type = str, help = "Folder the grids are written to (default = the current folder)", default = os.getcwd())
+    args = None
+    try:
+        args = parser.parse_args(in_args[1:])
+    except Exception as e:
+        print(e)
+        parser.print_help()
+        sys.exit(0)
+    return args
+
+if __name__ == "__main__":
+    args = parseArguments(sys.argv)
+    for catalog, path in (("2mass", args.twoMass), ("gsc240", args.gsc240), ("gaia", args.gaia)):
+        if not path:
+            continue
+        start = time.perf_counter()
+        bins, size = createBins(catalog, path, args.processes)
+        seconds = time.perf_counter() - start
+        print(f"{density.saveGrid(args.output, catalog, bins)}: {int(bins.sum())} stars, {size / 2 ** 20:.0f} MB in {seconds:.1f}s ({size / 2 ** 20 / max(seconds, 1e-9):.0f} MB/s)")
@@ -1,25 +1,38 @@
 import numpy as np
-import math
-import pickle
+import pandas as pd
+import sys
 import os
-from tqdm import tqdm 
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+import density
+
+# RAdeg and DEdeg columns of hip_main.csv
+RA_DEG = 8
+DEC_DEG = 9
+# Lines parsed at a time; only one chunk is in memory
+CHUNK_LINES = 100000
+
+def hipPositions(path, chunkLines = CHUNK_LINES):
+    """
+    Streams the RA and Dec of the stars in hip_main.csv with pandas' C csv reader, reading only the two columns.
+    Args:
+        path (str): Path to hip_main.csv.
+        chunkLines (int): Lines parsed at a time.
+    Returns:
+        Iterator: (Numpy array, Numpy array) - RA and Dec in degrees of a chunk's stars, NaN where blank or not a number
+    """
+    chunks = pd.read_csv(path, header = None, usecols = [RA_DEG, DEC_DEG], dtype = str, chunksize = chunkLines, on_bad_lines = "skip")
+    for chunk in chunks:
+        yield (pd.to_numeric(chunk[RA_DEG], errors = "coerce").to_numpy(np.float64),
+               pd.to_numeric(chunk[DEC_DEG], errors = "coerce").to_numpy(np.float64))
 
 def createHIPBins():
-    a = np.zeros(shape=(360,180))
+    a = np.zeros((density.RA_BINS, density.DEC_BINS), dtype = np.int64)
     path = ""#path to hip csv file
-    with open(f'{path}/hip_main.csv', 'r') as f:
-        lines = f.readlines()
-        i = 0
-        for line in lines:
-            line = line.split(",")
-            try: 
-                r,d = float(line[8]), float(line[9])
-                a[floor(r)][floor(d)-90] += 1
-            except:
-                pass
-    with open(f"{os.getcwd()}/hip_bins", "wb") as f:
-        pickle.dump(a, f)
+    for ra, dec in hipPositions(f'{path}/hip_main.csv'):
+        valid = np.isfinite(ra) & np.isfinite(dec)
+        a += np.histogram2d(ra[valid], dec[valid], bins = a.shape, range = [[0, 360], [-90, 90]])[0].astype(np.int64)
+    density.saveGrid(os.getcwd(), "hip", a)
     # return a
 if __name__ == "__main__":
     createHIPBins()
-            
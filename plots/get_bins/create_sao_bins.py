@@ -1,27 +1,80 @@
 import numpy as np
-import math
-import pickle
+import sys
 import os
-from tqdm import tqdm 
 
-def radToDeg(radians):
-    return math.degrees(radians)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+import density
+
+# Line width of sao.dat and its RA_rad and Dec_rad columns (SAO_FIELDS in scripts/sao2000.py)
+SAO_WIDTH = 204
+RA_RAD = slice(183, 193)
+DEC_RAD = slice(193, 204)
+# Bytes read at a time; only one block of lines is in memory
+BLOCK_SIZE = 1 << 24
+
+def readBlocks(f, blockSize = BLOCK_SIZE):
+    """
+    Reads a file in blocks that end on a line boundary.
+    Args:
+        f (file): File opened in binary mode.
+        blockSize (int): Bytes read at a time.
+    Returns:
+        Iterator: bytes blocks of whole lines; the last may lack its final newline.
+    """
+    rest = b""
+    while True:
+        data = f.read(blockSize)
+        if not data:
+            if rest:
+                yield rest
+            return
+        block = rest + data
+        end = block.rfind(b"\n") + 1
+        rest = block[end:]
+        if end:
+            yield block[:end]
+
+def radians(column):
+    """
+    Args:
+        column (Numpy array): lines x width uint8 bytes of a fixed-width number field.
+    Returns:
+        Numpy array: The field in degrees, NaN where it is blank.
+    """
+    text = np.ascontiguousarray(column).view(f"S{column.shape[1]}").ravel()
+    text = np.where(np.char.strip(text) == b"", b"nan", text)
+    return np.degrees(text.astype(np.float64))
+
+def saoPositions(path, blockSize = BLOCK_SIZE):
+    """
+    Streams the RA and Dec of the stars in sao.dat, one block of lines at a time.
+    Args:
+        path (str): Path to sao.dat.
+        blockSize (int): Bytes read at a time.
+    Returns:
+        Iterator: (Numpy array, Numpy array) - RA and Dec in degrees of a block's stars
+    """
+    with open(path, "rb") as f:
+        for block in readBlocks(f, blockSize):
+            raw = np.frombuffer(block, dtype = np.uint8)
+            if len(raw) % (SAO_WIDTH + 1) == 0 and (raw[SAO_WIDTH::SAO_WIDTH + 1] == ord("\n")).all():
+                #every line is full width: the columns are views of the block
+                lines = raw.reshape(-1, SAO_WIDTH + 1)
+            else:
+                lines = np.array([line for line in block.splitlines() if line.strip()], dtype = f"S{SAO_WIDTH}")
+                lines = lines.view(np.uint8).reshape(-1, SAO_WIDTH)
+                #short lines are padded with NUL bytes, which read as blanks
+                lines[lines == 0] = ord(" ")
+            yield radians(lines[:, RA_RAD]), radians(lines[:, DEC_RAD])
 
 def createSAOBins():
-    a = np.zeros(shape=(360,180))
+    a = np.zeros((density.RA_BINS, density.DEC_BINS), dtype = np.int64)
     path = os.getcwd() #path to sao.dat file
-    with open(f'{path}/sao.dat', 'r') as f:
-        lines = f.readlines()
-        for line in tqdm(lines): 
-            line = str.encode(line)
-            r = floor(radToDeg(float(line[183:193].decode())))
-            d = -floor(radToDeg(float(line[193:204].decode())))
-            if(d > -50 or d < -20):
-                a[r][-d-90] += 1
-    
-    with open("./sao_bins", "wb") as f:
-            pickle.dump(a, f)
+    for ra, dec in saoPositions(f'{path}/sao.dat'):
+        valid = np.isfinite(ra) & np.isfinite(dec)
+        a += np.histogram2d(ra[valid], dec[valid], bins = a.shape, range = [[0, 360], [-90, 90]])[0].astype(np.int64)
+    density.saveGrid(os.getcwd(), "sao", a)
     # return a
 
 if __name__ == "__main__":
-    createSAOBins()
\ No newline at end of file
+    createSAOBins()
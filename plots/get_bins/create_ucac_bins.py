@@ -1,10 +1,13 @@
 import numpy as np
 import math
-import pickle
+import sys
 from tqdm import tqdm
 import os
 from math import floor
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+import density
+
 def createUCACBins():
     ra_bins = 360
     dec_bins = 180
@@ -21,8 +24,7 @@ def createUCACBins():
             dec = floor(-90 + 0.2*(int(x[2])))
             ra = floor((int(x[3])-1) / 4)
             bins[ra][dec+89] = count
-    with open(f"ucac_bins", "wb") as f:
-        pickle.dump(bins, f)
+    density.saveGrid(os.getcwd(), "ucac", bins)
     # return bins
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import zlib
+import struct
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import density
+
+PLOTS = os.path.dirname(os.path.abspath(__file__))
+
+# (catalog name of the grid files, image name used by index.html)
+MAPS = [("sao", "sao2000"), ("ucac", "ucac4"), ("gsc240", "gsc240"), ("hip", "hip"), ("2mass", "2mass"), ("gaia", "gaia")]
+
+# plotly's Plasma scale, the one px.imshow used for the html figures
+PLASMA = ["#0d0887", "#46039f", "#7201a8", "#9c179e", "#bd3786", "#d8576b", "#ed7953", "#fb9f3a", "#fdca26", "#f0f921"]
+FORMATS = ["png", "webp"]
+
+def palette(colors = PLASMA):
+    """
+    Interpolates a color scale to the 256 entries of an 8 bit palette.
+    Args:
+        colors (List): Hex colors from the low to the high end of the scale.
+    Returns:
+        Numpy array: 256 x 3 uint8 RGB palette.
+    """
+    stops = np.array([[int(color[i:i + 2], 16) for i in (1, 3, 5)] for color in colors], dtype = np.float64)
+    positions = np.linspace(0, 1, len(colors))
+    levels = np.linspace(0, 1, 256)
+    return np.stack([np.interp(levels, positions, stops[:, channel]) for channel in range(3)], axis = 1).round().astype(np.uint8)
+
+def mapImage(counts, scale = 2, log = False):
+    """
+    Turns an RA x Dec grid into palette indices with north at the top and RA increasing to the right, each cell
+    scale x scale pixels.
+    Args:
+        counts (Numpy array): RA cells x Dec cells grid, ex: from density.loadGrid.
+        scale (int): Pixels per cell side.
+        log (bool): Color by log(1 + count) instead of count, for catalogs with a large range of densities.
+    Returns:
+        Numpy array: Dec cells * scale x RA cells * scale uint8 palette indices, 255 for the densest cell.
+    """
+    values = np.asarray(counts, dtype = np.float64).T[::-1]
+    if log:
+        values = np.log1p(values)
+    top = values.max()
+    indices = np.zeros(values.shape, dtype = np.uint8) if top == 0 else np.rint(values * (255 / top)).astype(np.uint8)
+    return np.repeat(np.repeat(indices, scale, axis = 0), scale, axis = 1)
+
+def pngBytes(indices, colors):
+    """
+    Encodes an 8 bit palette PNG with zlib; no imaging library is needed.
+    Args:
+        indices (Numpy array): Height x width uint8 palette indices.
+        colors (Numpy array): 256 x 3 uint8 RGB palette.
+    Returns:
+        bytes: The PNG file.
+    """
+    height, width = indices.shape
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    #every row starts with filter type 0 (none); the upscaled cells leave long runs for zlib
+    rows = np.zeros((height, width + 1), dtype = np.uint8)
+    rows[:, 1:] = indices
+    header = struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"PLTE", colors.tobytes())
+            + chunk(b"IDAT", zlib.compress(rows.tobytes(), 9)) + chunk(b"IEND", b""))
+
+def writeImage(path, indices, colors, format = "png"):
+    """
+    Writes palette indices as an image file, through a temporary file so a page never loads a partial image.
+    Args:
+        path (str): Output path.
+        indices (Numpy array): Height x width uint8 palette indices.
+        colors (Numpy array): 256 x 3 uint8 RGB palette.
+        format (str): "png", or "webp" (needs Pillow).
+    Returns:
+        int: Bytes written.
+    """
+    if format == "webp":
+        from PIL import Image
+        image = Image.fromarray(indices, mode = "P")
+        image.putpalette(colors.tobytes())
+        image.convert("RGB").save(f"{path}.tmp", format = "WEBP", lossless = True, method = 6)
+    else:
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(pngBytes(indices, colors))
+    os.replace(f"{path}.tmp", path)
+    return os.path.getsize(path)
+
+def renderMap(catalog, name, binsFolder, outputFolder, resolution = 1, scale = 2, log = False, format = "png"):
+    """
+    Renders one catalog's grid to <outputFolder>/<name>.<format>.
+    Args:
+        catalog (str): Catalog name of the grid files, ex: "sao".
+        name (str): Image name, ex: "sao2000".
+        binsFolder (str): Folder of the grid files.
+        outputFolder (str): Folder the image is written to.
+        resolution (float): Cell size in degrees of the grid to render.
+        scale (int): Pixels per cell side.
+        log (bool): Color by log(1 + count).
+        format (str): "png" or "webp".
+    Returns:
+        Tuple: (str, int, float) - path written, bytes, seconds
+    """
+    start = time.perf_counter()
+    counts = density.loadGrid(binsFolder, catalog, resolution)
+    path = os.path.join(outputFolder, f"{name}.{format}")
+    size = writeImage(path, mapImage(counts, scale, log), palette(), format)
+    return path, size, time.perf_counter() - start
+
+def renderMaps(binsFolder, outputFolder, resolution = 1, scale = 2, log = False, format = "png", threads = None):
+    """
+    Renders every catalog in MAPS that has a grid in binsFolder. The maps are rendered by a thread pool in this
+    process; zlib and most of NumPy release the GIL, so the threads run in parallel.
+    Args:
+        binsFolder (str): Folder of the grid files.
+        outputFolder (str): Folder the images are written to.
+        resolution (float): Cell size in degrees of the grids to render.
+        scale (int): Pixels per cell side.
+        log (bool): Color by log(1 + count).
+        format (str): "png" or "webp".
+        threads (int): Threads rendering at once (default = None, one per CPU).
+    Returns:
+        List: (path, bytes, seconds) of each image written.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"image format must be one of {FORMATS}")
+    os.makedirs(outputFolder, exist_ok = True)
+    maps = [(catalog, name) for catalog, name in MAPS if os.path.exists(density.gridPath(binsFolder, catalog, resolution))]
+    with ThreadPoolExecutor(max_workers = threads) as pool:
+        futures = [pool.submit(renderMap, catalog, name, binsFolder, outputFolder, resolution, scale, log, format) for catalog, name in maps]
+        return [future.result() for future in futures]
+
+def parseArguments(in_args):
+    """
+    Parses command-line arguments.
+    Args:
+        in_args (List): List of command-line arguments.
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    description = "Renders the density grids in plots/bins as static heatmap images for index.html, with no browser"
+    usage = "\n{} [-b bins folder] [-o output folder] [-s scale] [--format png|webp]\n".format(in_args[0])
+    epilog = ""
+    parser = argparse.ArgumentParser(description = description, usage = usage, epilog = epilog)
+    parser.add_argument("-b", "--bins", dest = "bins", type = str, help = "Folder of the <catalog>_bins_<resolution>deg.npy grids (default = plots/bins)", default = os.path.join(PLOTS, "bins"))
+    parser.add_argument("-o", "--output", dest = "output", type = str, help = "Folder the images are written to (default = plots/figures)", default = os.path.join(PLOTS, "figures"))
+    parser.add_argument("-r", "--resolution", dest = "resolution", type = float, help = "Cell size in degrees of the grids to render (default = 1)", default = 1)
+    parser.add_argument("-s", "--scale", dest = "scale", type = int, help = "Pixels per cell side (default = 2)", default = 2)
+    parser.add_argument("-l", "--log", dest = "log", type = bool, help = "Color by log(1 + stars) instead of stars (default = False)", default = False)
+    parser.add_argument("-p", "--threads", dest = "threads", type = int, help = "Maps rendered at once (default = one per CPU)", default = None)
+    parser.add_argument("--format", dest = "format", type = str, help = f"Image format: {', '.join(FORMATS)}; webp needs Pillow (default = 'png')", default = "png")
+    args = None
+    try:
+        args = parser.parse_args(in_args[1:])
+    except Exception as e:
+        print(e)
+        parser.print_help()
+        sys.exit(0)
+    return args
+
+if __name__ == "__main__":
+    args = parseArguments(sys.argv)
+    start = time.perf_counter()
+    for path, size, seconds in renderMaps(args.bins, args.output, args.resolution, args.scale, args.log, args.format, args.threads):
+        print(f"{path}: {size / 1024:.0f} KB in {seconds:.3f}s")
+    print(f"Rendered in {time.perf_counter() - start:.3f}s")
@@ -8,6 +8,14 @@ import os.path
 import random
 import configparser
 import csv
+import multiprocessing
+import bulkload
+import healpix
+import connpool
+import fastload
+import density
+import instrument
+from sexagesimal import fillSexag
 
 def connectionParameters():
     """
@@ -23,19 +31,20 @@ def connectionParameters():
     db_password = config['2MASS']['password']
     return db_host, db_port, db_user, db_password
 
-def connectToDatabase(db_name = None):
+def connectToDatabase(db_name = None, local_infile = False):
     """
     Returns a connection to the MySQL database.
     Args:
         db_name (str): Name of the database.
+        local_infile (bool): Allow LOAD DATA LOCAL INFILE on the connection.
     Returns:
         pymysql.Connection: MySQL database connection.
     """
     db_host, db_port, db_user, db_password = connectionParameters()
     if db_name == None:
-        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password)
+        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, local_infile = local_infile)
     else:
-        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name)
+        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name, local_infile = local_infile)
     return conn
     
     
@@ -56,16 +65,19 @@ def createDatabase(databaseName = "2MASS_dev"):
         pass
         
     
-def createTable(databaseName = "2MASS_dev", tableName = "2mass"): 
+def createTable(databaseName = "2MASS_dev", tableName = "2mass", spatial = False, deferKeys = False): 
     """
     Creates the specified table.
     Args:
         databaseName (str): Name of the database.
         tableName (str): Name of the table.
+        spatial (bool): Add the indexed HPX (HEALPix pixel id) column.
+        deferKeys (bool): Leave out the primary key and HPX index; fastload.finishTable builds them after the load.
     """
     conn = connectToDatabase(db_name = databaseName)
     cur = conn.cursor()
-    cur.execute(f'CREATE TABLE {tableName} (2mass_ID VARCHAR(20) PRIMARY KEY);')
+    primaryKey = "" if deferKeys else " PRIMARY KEY"
+    cur.execute(f'CREATE TABLE {tableName} (2mass_ID VARCHAR(20){primaryKey});')
     if tableName == '2mass' or tableName == '2mass_not_visible':
         query = f"""ALTER TABLE {tableName} \
             ADD RA VARCHAR(13), \
@@ -81,6 +93,8 @@ def createTable(databaseName = "2MASS_dev", tableName = "2mass"):
             ADD rd_flg INT; \
             """
         cur.execute(query)
+        if spatial:
+            healpix.addSpatialColumn(cur, tableName, index = not deferKeys)
     conn.commit()
     conn.close()
 
@@ -116,7 +130,58 @@ def cnm(value):
         return None
     return float(value)
         
-def insertTable(databaseName = "2MASS_dev", tableNames = ['2mass', '2mass_not_visible'], path = "", dec1="000", dec2="0000", ra="000", verbose = False):  
+COLUMNS = ['2mass_ID', 'RA', 'Decl', 'RA_deg', 'Decl_deg', 'RA_rad', 'Decl_rad', 'JMag', 'HMag', 'KMag', 'ph_qual', 'rd_flg']
+
+def parseFile(path = "", dec1 = "000", dec2 = "0000", ra = "000", spatial = False):
+    """
+    Parses the dec1 dec2 ra file into 2mass and 2mass_not_visible row tuples.
+    Args:
+        path (str): Path to the CSV files.
+        dec1 (str): Declination degree.
+        dec2 (str): Declination decimal.
+        ra (str): Right ascension.
+        spatial (bool): Append the HPX pixel id to each row
+    Returns:
+        Tuple: (List, List) - 2mass rows, 2mass_not_visible rows
+    """
+    rows, rows_nv = [], []
+    file = f"{dec1}/{dec2}/{ra}.dat"
+    stats = instrument.current()
+    with stats.stage('open'):
+        f = open(f'{path}/{file}', 'r')
+    with f:
+        csvFile = stats.reader(f)
+        for line in csvFile:
+            try:
+                ra_deg = float(line[0])
+                dec_deg = float(line[1])
+                twomass_id = line[2]
+                ra_rad = degToRad(ra_deg)
+                dec_rad = degToRad(dec_deg)
+                JMag = cnm(line[3])
+                HMag = cnm(line[4])
+                KMag = cnm(line[5])
+                ph_qual = line[6]
+                rd_flg = float(line[7])
+                #RA and Decl strings are filled in for the whole file below
+                values = (twomass_id, None, None, ra_deg, dec_deg, ra_rad, dec_rad, JMag, HMag, KMag, ph_qual, rd_flg)
+                if spatial:
+                    values += (healpix.healpixId(ra_deg, dec_deg),)
+                if dec_deg < -70.:
+                    rows_nv.append(values)
+                else:
+                    rows.append(values)
+            except Exception as e:
+                stats.count('rejects')
+                print(e)
+                print(line)
+    density.addRows("2mass", rows, 3, 4)
+    density.addRows("2mass", rows_nv, 3, 4)
+    rows = fillSexag(rows, 1, 2, 3, 4)
+    rows_nv = fillSexag(rows_nv, 1, 2, 3, 4)
+    return rows, rows_nv
+
+def insertTable(databaseName = "2MASS_dev", tableNames = ['2mass', '2mass_not_visible'], path = "", dec1="000", dec2="0000", ra="000", verbose = False, bulk = False, conn = None, spatial = False, fastLoad = False):  
     """
     Inserts data from the dec1 dec2 ra file.
     Args:
@@ -127,119 +192,123 @@ def insertTable(databaseName = "2MASS_dev", tableNames = ['2mass', '2mass_not_vi
         dec2 (str): Declination decimal.
         ra (str): Right ascension.
         verbose (bool): Whether to print flags
+        bulk (bool): Load the file with LOAD DATA LOCAL INFILE instead of one INSERT per star
+        conn (pymysql.Connection): Open connection to reuse; it is committed but left open (default = borrow one from the connection pool)
+        spatial (bool): Also insert the HPX pixel id of each star
+        fastLoad (bool): Insert over connections with relaxed session checks (tables created with deferKeys)
     Returns:
-        None
+        Tuple: (int, int) - stars inserted, duplicates
     """
-    conn = connectToDatabase(db_name = databaseName)
-    cur = conn.cursor() 
+    pool = None
+    if conn is None:
+        #reuse a pooled connection across files instead of logging in for each one
+        pool = connpool.getPool(connectToDatabase, setup = fastload.relaxSession if fastLoad else None, db_name = databaseName, local_infile = bulk)
+        conn = pool.acquire()
+    stats = instrument.start("2mass", f"{dec1}/{dec2}/{ra}.dat")
+    cur = stats.cursor(conn.cursor())
     try:
+        hpxColumn, hpxValue = (", HPX", ", %s") if spatial else ("", "")
         sql = f"""INSERT INTO 2mass ( \
-        2mass_ID, RA, Decl, RA_deg, Decl_deg, RA_rad, Decl_rad, JMag, HMag, KMag, ph_qual, rd_flg)\
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s); \
+        2mass_ID, RA, Decl, RA_deg, Decl_deg, RA_rad, Decl_rad, JMag, HMag, KMag, ph_qual, rd_flg{hpxColumn})\
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s{hpxValue}); \
             """
         sql_nv= f"""INSERT INTO 2mass_not_visible ( \
-                2mass_ID, RA, Decl, RA_deg, Decl_deg, RA_rad, Decl_rad, JMag, HMag, KMag, ph_qual, rd_flg)\
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s); \
+                2mass_ID, RA, Decl, RA_deg, Decl_deg, RA_rad, Decl_rad, JMag, HMag, KMag, ph_qual, rd_flg{hpxColumn})\
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s{hpxValue}); \
             """
-        file = f"{dec1}/{dec2}/{ra}.dat"
+        columns = COLUMNS + ['HPX'] if spatial else COLUMNS
         count = 0
         countdup = 0
-        with open(f'{path}/{file}', 'r') as f:
-            csvFile = csv.reader(f)
-            for line in csvFile:
-                try:
-                    ra_deg = float(line[0])
-                    dec_deg = float(line[1])
-                    twomass_id = line[2]
-                    ra_rad = degToRad(ra_deg)
-                    dec_rad = degToRad(dec_deg)
-                    RA = deg2SexagHrs(ra_deg)
-                    Decl = deg2Sexag(dec_deg)
-                    JMag = cnm(line[3])
-                    HMag = cnm(line[4])
-                    KMag = cnm(line[5])
-                    ph_qual = line[6]
-                    rd_flg = float(line[7])
-                    if dec_deg < -70.:
-                        cur.execute(sql_nv,(
-                            twomass_id, RA, Decl, ra_deg, dec_deg, ra_rad, dec_rad, JMag, HMag, KMag, ph_qual, rd_flg))
-                    else:
-                        cur.execute(sql,(
-                            twomass_id, RA, Decl, ra_deg, dec_deg, ra_rad, dec_rad, JMag, HMag, KMag, ph_qual, rd_flg))
-                    count+=1
-                except Exception as e:
-                    #This exception will print all error messages that are not a duplicate primary key
-                    #--------------------------#
-                    if int(e.args[0]) != 1062:
-                        print(e)
-                        print(line)
-                    # elif verbose:
-                    #     if int(e.args[0]) == 1062:
-                    #         print(e)
-                    #-------------------------#
-                    
-                    countdup+=1
+        rows, rows_nv = parseFile(path, dec1, dec2, ra, spatial)
+        if bulk:
+            #LOAD DATA skips duplicate keys, so duplicates are the rows that were not inserted
+            for tableName, data in ((tableNames[0], rows), (tableNames[1], rows_nv)):
+                c, cd = bulkload.bulkInsert(cur, tableName, columns, data)
+                count += c
+                countdup += cd
+        else:
+            for query, data in ((sql, rows), (sql_nv, rows_nv)):
+                for values in data:
+                    try:
+                        cur.execute(query, values)
+                        count+=1
+                    except Exception as e:
+                        #This exception will print all error messages that are not a duplicate primary key
+                        #--------------------------#
+                        if e.args[0] != 1062:
+                            print(e)
+                        #-------------------------#
+                        countdup+=1
     except Exception as e:
         #this exception catches files that do not exist
+        if isinstance(e, FileNotFoundError):
+            stats = instrument.NULL
         if(verbose):
             print(e)
         pass
-    conn.ping()
-    conn.commit()
-    conn.close()
-    if(verbose):
-        #print(f"{count} stars inserted | {countdup} duplicates")
-        return count, countdup
+    try:
+        with stats.stage('db'):
+            conn.commit()
+    finally:
+        if pool is not None:
+            pool.release(conn, broken = not conn.open)
+    stats.finish(rows = count, duplicates = countdup)
+    return count, countdup
                     
-def deg2Sexag(deg):
+def degToRad(degrees):
     """
-    Converts degrees to sexagesimal format (degs:mins:secs).
+    Converts degrees to radians.
     Args:
-        deg (float): Degree value.
+        degrees (float): Degree value.
     Returns:
-        str: Sexagesimal formatted string.
+        float: Radian value.
     """
-    sign = " "
-    if deg < 0:
-        sign = "-"
-        deg = -deg
-    dd = int(deg)
-    rest = (deg - dd) * 60
-    mm = int(rest)
-    rest = (rest - mm) * 60
-    ss = int(rest)
-    rest = (rest - ss) * 1000
-    ms = int(rest)
-    return "%c%02d:%02d:%02d.%03d" % (sign, dd, mm, ss, ms)   
-    
-def deg2SexagHrs(deg):
+    return math.radians(degrees)
+        
+
+def insertBand(band):
     """
-    Converts degrees to sexagesimal format for RA (hrs:mins:secs).
+    Inserts the 360 RA files of one declination band, reusing the worker process's pooled connection.
     Args:
-        deg (float): Degree value.
+        band (Tuple): (databaseName, tableNames, path, dec1, dec2, verbose, bulk, spatial, fastLoad)
     Returns:
-        str: Sexagesimal formatted string.
+        Tuple: (str, str, int, int, Dict) - dec1, dec2, stars inserted, duplicates, density counts of the band (density.take())
     """
-    deg = (deg / 360) * 24
-    hrs = int(deg)
-    rest = (deg - hrs) * 60
-    mins = int(rest)
-    rest = (rest - mins) * 60
-    secs = int(rest)
-    rest = (rest - secs) * 1000
-    ms = int(rest)
-    return "%02d:%02d:%02d.%03d" % (hrs, mins, secs, ms)   
-    
-def degToRad(degrees):
+    databaseName, tableNames, path, dec1, dec2, verbose, bulk, spatial, fastLoad = band
+    count, countdup = 0, 0
+    for Ra in range(360):
+        ra = "{:>03}".format(Ra)
+        c,cd = insertTable(databaseName = databaseName, tableNames = tableNames, path = path, dec1 = dec1, dec2 = dec2, ra = ra, verbose = verbose, bulk = bulk, spatial = spatial, fastLoad = fastLoad)
+        count+=c
+        countdup+=cd
+    return dec1, dec2, count, countdup, density.take()
+
+def insertBandsParallel(databaseName = "2MASS_dev", tableNames = ['2mass', '2mass_not_visible'], path = "", bands = [], workers = 1, verbose = False, bulk = False, spatial = False, fastLoad = False):
     """
-    Converts degrees to radians.
+    Splits (dec, decdec) bands across a process pool and combines the per band totals.
     Args:
-        degrees (float): Degree value.
+        databaseName (str): Name of the database.
+        tableNames (List): List of table names.
+        path (str): Path to the 2mass data folder.
+        bands (List): List of (dec1, dec2) folder names, ex: ("012", "0003").
+        workers (int): Number of worker processes.
+        verbose (bool): Whether to print flags
+        bulk (bool): Load each file with LOAD DATA LOCAL INFILE
+        spatial (bool): Also insert the HPX pixel id of each star
+        fastLoad (bool): Insert over connections with relaxed session checks
     Returns:
-        float: Radian value.
+        Tuple: (int, int) - stars inserted, duplicates
     """
-    return math.radians(degrees)
-        
+    tasks = [(databaseName, tableNames, path, dec1, dec2, verbose, bulk, spatial, fastLoad) for dec1, dec2 in bands]
+    count, countdups = 0, 0
+    with multiprocessing.Pool(processes = workers) as pool:
+        for dec1, dec2, c, cd, bins in tqdm(pool.imap_unordered(insertBand, tasks), total = len(tasks)):
+            count+=c
+            countdups+=cd
+            density.merge(bins)
+            if(verbose):
+                print(f"{dec1}/{dec2}: {c} stars inserted | {cd} duplicate stars")
+    return count, countdups
 
 def dropTable(databaseName = "2MASS_dev", tableName = "2mass"):
     """
@@ -298,6 +367,16 @@ def parseArguments(in_args):
     parser.add_argument("-k", "--dropTables", dest = "kill", type = bool, help = "Drop Current tables and restart DB ingestion? (default = False)", default = False)
     parser.add_argument("-mr", "--manualRange", dest = "mr", type = str, help = "Manually insert a set of files (1,180--insert dec files 0-179) (default = None)", default = "")
     parser.add_argument("-v", "--verbose", dest = "verbose", type = bool, help = "Print number of duplicate/new stars to command line (default = False)", default = False)
+    parser.add_argument("-w", "--workers", dest = "workers", type = int, help = "Number of worker processes; each inserts whole (dec, decdec) bands over its own connection (default = 1)", default = 1)
+    parser.add_argument("-s", "--spatial", dest = "spatial", type = bool, help = "Store an indexed HEALPix pixel id (HPX) with each star for cone searches; the tables must be created with it (-k) (default = False)", default = False)
+    parser.add_argument("-b", "--bulk", dest = "bulk", type = bool, help = "Load each file with LOAD DATA LOCAL INFILE instead of row by row inserts (default = False)", default = False)
+    parser.add_argument("--fast-initial-load", dest = "fastLoad", type = bool, help = "Create the tables (-k) without keys or indexes, load with relaxed session checks, then remove duplicates and build the keys at the end (default = False)", default = False)
+    parser.add_argument("--metrics", dest = "metrics", type = str, help = "Write per file stage timings and row, reject and duplicate counts to this file (default = None)", default = None)
+    parser.add_argument("--metrics-format", dest = "metricsFormat", type = str, choices = instrument.FORMATS, help = "Metrics file format: 'json' appends one JSON line per file, 'prometheus' rewrites running totals as Prometheus text (default = 'json')", default = "json")
+    parser.add_argument("--bins", dest = "bins", type = str, help = "Folder to write the sky density grid to at the end of the ingest: <catalog>_bins_<resolution>deg.npy and .json, stars per cell like the files in plots/bins (default = None)", default = None)
+    parser.add_argument("--bins-resolution", dest = "binsResolution", type = float, help = "Cell size of the --bins grid in degrees; finer grids are also written added up to 1 degree (default = 1)", default = 1)
+    parser.add_argument("--bins-healpix", dest = "binsHealpix", type = int, help = "Also count --bins HEALPix maps at this order (0 - 12) and write every coarser order too: <catalog>_hpx_<order>.npy and .json (default = None)", default = None)
+    parser.add_argument("--pool-size", dest = "poolSize", type = int, help = "Most connections each process's connection pool has checked out at once (default = 4)", default = None)
     args = None
     try:
         args = parser.parse_args(in_args[1:])
@@ -314,17 +393,37 @@ def ingestDB():
         None
     """
     args = parseArguments(sys.argv) 
+    if args.metrics:
+        instrument.configure(args.metrics, args.metricsFormat)
+    if args.bins:
+        density.configure(args.bins, args.binsResolution, args.binsHealpix)
+    if args.poolSize:
+        connpool.setPoolSize(args.poolSize)
     numFiles = args.fNum
     killConnections()
     createDatabase(args.dName)
     tNames = ['2mass', '2mass_not_visible']
+    if args.fastLoad and not args.kill:
+        print("--fast-initial-load creates the tables, use it with -k")
+        return
     if args.kill:
-        for i in range(len(args.tNames)):
+        for i in range(len(tNames)):
             print("Dropping Tables")
             dropTable(databaseName = args.dName, tableName = tNames[i])
-            createTable(databaseName = args.dName, tableName = tNames[i])
+            createTable(databaseName = args.dName, tableName = tNames[i], spatial = args.spatial, deferKeys = args.fastLoad)
     files = []
-    if len(args.mr) > 0:
+    if args.workers > 1 and args.mIns == None and not args.rIns:
+        print(f"Parallel Insertion ({args.workers} workers)")
+        if len(args.mr) > 0:
+            text = args.mr.split(",")
+            decRange = range(int(text[0]),int(text[1]))
+        else:
+            decRange = range(0,args.fNum)
+        bands = [("{:>03}".format(decDeg), "{:>04}".format(decDec)) for decDeg in decRange for decDec in range(10)]
+        count,countdups = insertBandsParallel(databaseName = args.dName, tableNames = tNames, path = args.fPath, bands = bands, workers = args.workers, verbose = args.verbose, bulk = args.bulk, spatial = args.spatial, fastLoad = args.fastLoad)
+        files.extend([list(band) for band in bands])
+        print(f"{count} stars inserted | {countdups} duplicate stars")
+    elif len(args.mr) > 0:
         print("Manual Range Insertion")
         text = args.mr.split(",")
         for decDeg in tqdm(range(int(text[0]),int(text[1]))):
@@ -334,7 +433,7 @@ def ingestDB():
                     dec = "{:>03}".format(decDeg)
                     decdec = "{:>04}".format(decDec)
                     ra = "{:>03}".format(Ra)
-                    c,cd = insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose)
+                    c,cd = insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose, bulk = args.bulk, spatial = args.spatial, fastLoad = args.fastLoad)
                     count+=c
                     countdups+=cd
                 files.append([dec,decdec])   
@@ -362,7 +461,7 @@ def ingestDB():
                     dec = "{:>03}".format(decDeg)
                     decdec = "{:>04}".format(decDec)
                     ra = "{:>03}".format(Ra)
-                    c,cd = insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose)
+                    c,cd = insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose, bulk = args.bulk, spatial = args.spatial, fastLoad = args.fastLoad)
                     count+=c
                     countdups+=cd
                     files.append([dec,decdec,ra])
@@ -376,7 +475,7 @@ def ingestDB():
             dec = "{:>03}".format(dec)
             decdec = "{:>04}".format(decdec)
             ra = "{:>03}".format(ra)
-            insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose)
+            insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose, bulk = args.bulk, spatial = args.spatial, fastLoad = args.fastLoad)
             files.append([dec,decdec,ra])
         print(files)
     else:
@@ -388,11 +487,19 @@ def ingestDB():
                     dec = "{:>03}".format(decDeg)
                     decdec = "{:>04}".format(decDec)
                     ra = "{:>03}".format(Ra)
-                    c,cd = insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose)
+                    c,cd = insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose, bulk = args.bulk, spatial = args.spatial, fastLoad = args.fastLoad)
                     count+=c
                     countdups+=cd
                 files.append([dec,decdec])
                 print(f"{decDeg}: {count} stars inserted | {countdups} duplicate stars")
+    if args.fastLoad:
+        print("Removing duplicates and building keys")
+        conn = connectToDatabase(db_name = args.dName)
+        removed = fastload.finishTables(conn, [(tableName, '2mass_ID', True) for tableName in tNames], spatial = args.spatial)
+        conn.close()
+        print(f"{sum(removed.values())} duplicate stars removed")
+    for path in density.save():
+        print(f"Density bins written to {path}")
     if(args.verbose):
         for file in files:
             print(file)
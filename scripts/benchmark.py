@@ -0,0 +1,747 @@
+import argparse
+import csv
+import gzip
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import numpy as np
+import pymysql
+import connpool
+import pipeline
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Stars per generated 2mass/gsc240/gaia file
+STARS_PER_FILE = 5000
+# Slowdown (fraction of the baseline rows/sec) reported as a regression by --compare
+REGRESSION = 0.10
+
+#------------------------------------------------------------------------------------------#
+# Synthetic catalog files                                                                  #
+#------------------------------------------------------------------------------------------#
+
+def randomPositions(rng, stars):
+    """
+    Returns positions spread evenly over the sky.
+    Args:
+        rng (numpy.random.Generator): Random number generator.
+        stars (int): Number of positions.
+    Returns:
+        Tuple: (Numpy array, Numpy array) - RA and Dec in degrees
+    """
+    ra = rng.uniform(0., 360., stars)
+    dec = np.degrees(np.arcsin(rng.uniform(-1., 1., stars)))
+    return ra, dec
+
+def fileSizes(stars):
+    """
+    Splits a number of stars into files of at most STARS_PER_FILE stars.
+    Args:
+        stars (int): Number of stars.
+    Returns:
+        List: Stars in each file.
+    """
+    sizes = [STARS_PER_FILE] * (stars // STARS_PER_FILE)
+    if stars % STARS_PER_FILE:
+        sizes.append(stars % STARS_PER_FILE)
+    return sizes
+
+def generateUcac4(path, stars, seed = 0):
+    """
+    Writes two 78 byte record UCAC4 zone files, one below the visibility limit (z050) and one above (z450).
+    Args:
+        path (str): Folder to write the u4b zone files to.
+        stars (int): Number of stars.
+        seed (int): Random seed.
+    Returns:
+        List: Zone numbers written.
+    """
+    import ucac4
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok = True)
+    zones = {50: stars // 2, 450: stars - stars // 2}
+    first = 1
+    for zone, count in zones.items():
+        records = np.zeros(count, dtype = ucac4.ZONE_DTYPE)
+        records['ra'] = np.sort(rng.integers(0, 360 * 3600 * 1000, count))
+        records['spd'] = rng.integers(int((zone - 1) * 0.2 * 3600 * 1000), int(zone * 0.2 * 3600 * 1000), count)
+        for name in ('magm', 'maga', 'j_m', 'h_m', 'k_m'):
+            records[name] = rng.integers(8000, 20001, count)
+        records['apasm'] = rng.integers(8000, 20001, (count, 5))
+        records['apase'] = rng.integers(0, 100, (count, 5))
+        for name in ('sigmag', 'objt', 'cdf', 'na1', 'nu1', 'cu1'):
+            records[name] = rng.integers(0, 10, count)
+        for name in ('sigra', 'sigdc', 'sigpmr', 'sigpmd', 'gcflg', 'leda', 'x2m'):
+            records[name] = rng.integers(0, 100, count)
+        records['icqflg'] = rng.integers(0, 6, (count, 3))
+        records['e2mpho'] = rng.integers(0, 30, (count, 3))
+        records['cepra'] = rng.integers(0, 2000, count)
+        records['cepdc'] = rng.integers(0, 2000, count)
+        records['pmrac'] = rng.integers(-5000, 5000, count)
+        records['pmdc'] = rng.integers(-5000, 5000, count)
+        records['pts_key'] = rng.integers(0, 2 ** 31, count)
+        records['icf'] = rng.integers(0, 10 ** 9, count)
+        records['rnm'] = np.arange(first, first + count)
+        records['zn2'] = zone
+        records['rn2'] = np.arange(1, count + 1)
+        first += count
+        records.tofile(os.path.join(path, "z{:>03}".format(zone)))
+    return list(zones)
+
+def generate2mass(path, stars, seed = 0):
+    """
+    Writes 2MASS .dat CSV files (ra, dec, id, J, H, K, ph_qual, rd_flg) as path/dec1/dec2/ra.dat.
+    Args:
+        path (str): Folder to write the dec folders to.
+        stars (int): Number of stars.
+        seed (int): Random seed.
+    Returns:
+        List: (dec1, dec2, ra) of each file written.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(path, "000", "0000"), exist_ok = True)
+    files, first = [], 0
+    for number, count in enumerate(fileSizes(stars)):
+        ra, dec = randomPositions(rng, count)
+        mags = rng.uniform(5., 17., (count, 3)).round(3)
+        fileName = "{:>03}".format(number)
+        with open(os.path.join(path, "000", "0000", f"{fileName}.dat"), 'w', newline = '') as f:
+            writer = csv.writer(f)
+            for i in range(count):
+                writer.writerow(["%.6f" % ra[i], "%.6f" % dec[i], "%016d" % (first + i), mags[i, 0], mags[i, 1], mags[i, 2], "AAA", 222])
+        files.append(("000", "0000", fileName))
+        first += count
+    return files
+
+def generateGsc240(path, stars, seed = 0):
+    """
+    Writes 53 column GSC 2.4 CSV files as path/dec1/dec2/ra.csv, half in a not visible dec folder (000)
+    and half in a visible one (030).
+    Args:
+        path (str): Folder to write the dec folders to.
+        stars (int): Number of stars.
+        seed (int): Random seed.
+    Returns:
+        List: (dec1, dec2, ra) of each file written.
+    """
+    rng = np.random.default_rng(seed)
+    files, first = [], 0
+    for number, count in enumerate(fileSizes(stars)):
+        dec1 = "000" if number % 2 == 0 else "030"
+        os.makedirs(os.path.join(path, dec1, "0000"), exist_ok = True)
+        ra, dec = randomPositions(rng, count)
+        values = rng.uniform(0., 20., (count, 53)).round(4)
+        fileName = "{:>03}".format(number)
+        with open(os.path.join(path, dec1, "0000", f"{fileName}.csv"), 'w', newline = '') as f:
+            writer = csv.writer(f)
+            for i in range(count):
+                line = values[i].tolist()
+                line[0] = first + i
+                line[1] = "___NULL___" if i % 3 == 0 else "N%09d" % (first + i)
+                line[2] = "H%010d" % (first + i)
+                line[3] = math.radians(ra[i])
+                line[4] = math.radians(dec[i])
+                #magnitude codes, classification, source status and flags are integers
+                for column in list(range(15, 46, 3)) + [46, 50, 51, 52]:
+                    line[column] = int(line[column])
+                writer.writerow(line)
+        files.append((dec1, "0000", fileName))
+        first += count
+    return files
+
+def generateHip(path, stars, seed = 0):
+    """
+    Writes a 78 column hip_main.csv.
+    Args:
+        path (str): Folder to write hip_main.csv to.
+        stars (int): Number of stars.
+        seed (int): Random seed.
+    Returns:
+        str: Path of the file written.
+    """
+    from sexagesimal import deg2Sexag, deg2SexagHrs
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok = True)
+    ra, dec = randomPositions(rng, stars)
+    values = rng.uniform(-5., 15., (stars, 78)).round(3)
+    strings = set([2, 6, 7, 10, 36, 39, 42, 43, 48] + list(range(51, 58)) + list(range(59, 71)) + list(range(72, 78)))
+    integers = (47, 58, 71)
+    fileName = os.path.join(path, "hip_main.csv")
+    with open(fileName, 'w', newline = '') as f:
+        writer = csv.writer(f)
+        for i in range(stars):
+            line = values[i].tolist()
+            for column in strings:
+                line[column] = "X"
+            for column in integers:
+                line[column] = int(abs(line[column]))
+            line[0] = "H"
+            line[1] = i + 1
+            line[3] = deg2SexagHrs(ra[i]).replace(":", " ")
+            line[4] = deg2Sexag(dec[i]).strip().replace(":", " ")
+            line[8] = round(ra[i], 8)
+            line[9] = round(dec[i], 8)
+            line[31] = ""
+            writer.writerow(line)
+    return fileName
+
+def saoLine(number, ra, dec, rng):
+    """
+    Formats one 204 character sao.dat line; the 1950 and 2000 positions are both set to ra, dec.
+    Args:
+        number (int): SAO number.
+        ra (float): Right ascension in degrees.
+        dec (float): Declination in degrees.
+        rng (numpy.random.Generator): Random number generator.
+    Returns:
+        str: Fixed width line.
+    """
+    hrs = ra / 15
+    h, m = int(hrs), int((hrs * 60) % 60)
+    s = (hrs * 3600) % 60
+    raText = "%02d%02d%02d%s" % (h, m, int(s), ("%.3f" % (s % 1))[1:5])
+    sign = "-" if dec < 0 else "+"
+    d = abs(dec)
+    dd, dm = int(d), int((d * 60) % 60)
+    ds = (d * 3600) % 60
+    decText = "%s%02d%02d%02d%s" % (sign, dd, dm, int(ds), ("%.2f" % (ds % 1))[1:4])
+    raRad, decRad = "%10.8f" % math.radians(ra), "%11.8f" % math.radians(dec)
+    pmra, pmdec = "%7.4f" % rng.uniform(-0.1, 0.1), "%6.3f" % rng.uniform(-0.9, 0.9)
+    line = ("%6d" % number + " " + raText + pmra + "%2d" % 1 + " " + "%6.3f" % rng.uniform(0, 9) + "%2d" % 1 +
+            "%6.1f" % 1950. + decText + pmdec + "%2d" % 1 + " " + "%5.2f" % rng.uniform(0, 9) + "%2d" % 1 +
+            "%6.1f" % 1950. + "%3d" % 1 + "%4.1f" % rng.uniform(5, 12) + "%4.1f" % rng.uniform(5, 12) + "G0 " +
+            "%2d" % 1 + "%2d" % 1 + "111111" + "%2d" % 1 + "%5d" % (number % 100000) + "%-13s" % "BD+00 0001" +
+            "%6d" % number + " " + "%5s" % "" + raRad + decRad + raText + pmra + decText + pmdec + raRad + decRad)
+    return line
+
+def generateSao(path, stars, seed = 0):
+    """
+    Writes a fixed width sao.dat.
+    Args:
+        path (str): Folder to write sao.dat to.
+        stars (int): Number of stars.
+        seed (int): Random seed.
+    Returns:
+        str: Path of the file written.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok = True)
+    ra, dec = randomPositions(rng, stars)
+    fileName = os.path.join(path, "sao.dat")
+    with open(fileName, 'w') as f:
+        for i in range(stars):
+            f.write(saoLine(i + 1, ra[i], dec[i], rng) + "\n")
+    return fileName
+
+def generateGaia(path, stars, seed = 0, gz = False):
+    """
+    Writes 94 column Gaia CSV files (with the header line) into path/file-aa-dir.
+    Args:
+        path (str): Folder to write the directory to.
+        stars (int): Number of stars.
+        seed (int): Random seed.
+        gz (bool): Write .csv.gz files instead of .csv.
+    Returns:
+        List: Directories written.
+    """
+    rng = np.random.default_rng(seed)
+    directory = os.path.join(path, "file-aa-dir")
+    os.makedirs(directory, exist_ok = True)
+    header = ["solution_id", "designation", "source_id"] + [f"column_{i}" for i in range(3, 94)]
+    first = 0
+    for number, count in enumerate(fileSizes(stars)):
+        ra, dec = randomPositions(rng, count)
+        values = rng.uniform(0., 20., (count, 94)).round(4)
+        fileName = os.path.join(directory, "GaiaSource_%03d.csv" % number)
+        f = gzip.open(fileName + ".gz", 'wt', newline = '') if gz else open(fileName, 'w', newline = '')
+        with f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for i in range(count):
+                line = values[i].tolist()
+                line[0] = 1635721458409799680
+                line[1] = "Gaia DR2 %d" % (first + i)
+                line[2] = first + i
+                line[5] = round(ra[i], 10)
+                line[7] = round(dec[i], 10)
+                writer.writerow(line)
+        first += count
+    return [directory]
+
+#------------------------------------------------------------------------------------------#
+# Database stand-ins                                                                       #
+#------------------------------------------------------------------------------------------#
+
+class SQLiteCursor:
+    """
+    pymysql style cursor over SQLite: %s placeholders, error 1062 for duplicate keys.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.cur = conn.db.cursor()
+
+    def execute(self, query, args = None):
+        try:
+            self.cur.execute(self.conn.standIn.translate(query, self.conn.db), tuple(args) if args is not None else ())
+        except sqlite3.IntegrityError as e:
+            raise pymysql.err.IntegrityError(1062, str(e))
+        return self.cur.rowcount
+
+    def executemany(self, query, args):
+        try:
+            self.cur.executemany(self.conn.standIn.translate(query, self.conn.db), [tuple(values) for values in args])
+        except sqlite3.IntegrityError as e:
+            raise pymysql.err.IntegrityError(1062, str(e))
+        return self.cur.rowcount
+
+    @property
+    def rowcount(self):
+        return self.cur.rowcount
+
+    @property
+    def description(self):
+        return self.cur.description
+
+    def fetchone(self):
+        return self.cur.fetchone()
+
+    def fetchmany(self, size = 1):
+        return self.cur.fetchmany(size)
+
+    def fetchall(self):
+        return self.cur.fetchall()
+
+    def close(self):
+        self.cur.close()
+
+class SQLiteConnection:
+    """
+    pymysql style connection to the SQLite stand-in database.
+    """
+    def __init__(self, standIn):
+        self.standIn = standIn
+        self.db = sqlite3.connect(standIn.path, timeout = 60, check_same_thread = False)
+        self.db.execute("PRAGMA journal_mode = WAL;")
+        self.db.execute("PRAGMA synchronous = NORMAL;")
+        self.open = True
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def ping(self, reconnect = False):
+        return True
+
+    def close(self):
+        self.open = False
+        self.db.close()
+
+class SQLiteStandIn:
+    """
+    Throwaway SQLite file standing in for a catalog database. Tables are created from the column
+    list of the first INSERT into them, keyed on the first column like the catalog tables.
+    """
+    insertPattern = re.compile(r"^\s*(?:INSERT|REPLACE)(?:\s+IGNORE)?\s+INTO\s+(\w+)\s*\(([^)]*)\)", re.I)
+    #MySQL allows unquoted names that start with a digit (2mass_ID), SQLite needs them quoted
+    digitName = re.compile(r"(?<![\w\"'.])(\d+[A-Za-z_]\w*)")
+
+    def __init__(self, folder, name):
+        """
+        Args:
+            folder (str): Folder for the database file.
+            name (str): Name of the database file.
+        """
+        self.path = os.path.join(folder, f"{name}.sqlite")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.tables = set()
+
+    def connect(self, db_name = None, local_infile = False):
+        """
+        Stands in for a script's connectToDatabase.
+        Returns:
+            SQLiteConnection: Connection to the stand-in database.
+        """
+        return SQLiteConnection(self)
+
+    def translate(self, query, db):
+        """
+        Rewrites a MySQL statement for SQLite, creating the target table of an INSERT on first use.
+        Args:
+            query (str): MySQL statement.
+            db (sqlite3.Connection): Connection the statement will run on.
+        Returns:
+            str: SQLite statement.
+        """
+        match = self.insertPattern.match(query)
+        if match and match.group(1) not in self.tables:
+            columns = [column.strip() for column in match.group(2).split(",")]
+            create = f"CREATE TABLE IF NOT EXISTS {match.group(1)} ({', '.join(columns)}, PRIMARY KEY ({columns[0]}));"
+            db.execute(self.digitName.sub(r'"\1"', create))
+            self.tables.add(match.group(1))
+        query = re.sub(r"INSERT\s+IGNORE", "INSERT OR IGNORE", query, flags = re.I)
+        #a no-op update of a duplicate key is SQLite's DO NOTHING upsert; both leave the row and count 0 rows
+        query = re.sub(r"ON\s+DUPLICATE\s+KEY\s+UPDATE\s+[^;]*", "ON CONFLICT DO NOTHING", query, flags = re.I)
+        query = re.sub(r"SHOW\s+COLUMNS\s+FROM\s+(\w+)\s+LIKE\s+('\w+')", r"SELECT name FROM pragma_table_info('\1') WHERE name = \2", query, flags = re.I)
+        return self.digitName.sub(r'"\1"', query).replace("%s", "?")
+
+    def prepare(self, module, catalog):
+        pass
+
+    def count(self, tableName):
+        """
+        Returns the number of rows stored in a table (0 if nothing was inserted into it).
+        """
+        conn = self.connect()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT COUNT(*) FROM {tableName};")
+            return cur.fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+        finally:
+            conn.close()
+
+    def cleanup(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+class MySQLStandIn:
+    """
+    Throwaway bench_* database on the MySQL/MariaDB server of the script's catalogs.conf section.
+    The tables are created with the script's own createTable.
+    """
+    def __init__(self, connect, name):
+        """
+        Args:
+            connect (function): The script's original connectToDatabase.
+            name (str): Suffix of the database name.
+        """
+        self.original = connect
+        self.database = f"bench_{name}"
+
+    def connect(self, db_name = None, local_infile = False):
+        return self.original(db_name = self.database if db_name is not None else None, local_infile = local_infile)
+
+    def prepare(self, module, catalog):
+        """
+        Creates the database and the catalog's tables (module.connectToDatabase must already point here).
+        """
+        conn = self.original()
+        conn.cursor().execute(f"DROP DATABASE IF EXISTS {self.database};")
+        conn.cursor().execute(f"CREATE DATABASE {self.database};")
+        conn.close()
+        for create, kwargs in TABLES[catalog]:
+            getattr(module, create)(databaseName = self.database, **kwargs)
+
+    def count(self, tableName):
+        conn = self.connect(db_name = self.database)
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT COUNT(*) FROM {tableName};")
+            return cur.fetchone()[0]
+        except Exception:
+            return 0
+        finally:
+            conn.close()
+
+    def cleanup(self):
+        conn = self.original()
+        conn.cursor().execute(f"DROP DATABASE IF EXISTS {self.database};")
+        conn.close()
+
+# createTable calls that build each catalog's tables on a MySQL stand-in
+TABLES = {
+    'ucac4': [('createTable', {'tableName': name}) for name in ('ucac4', 'ucac4_errors_flags', 'ucac4_not_visible', 'ucac4_errors_flags_not_visible')],
+    '2mass': [('createTable', {'tableName': name}) for name in ('2mass', '2mass_not_visible')],
+    'gsc240': [('createTable', {'tableName': name}) for name in ('gsc240', 'gsc240_errors_flags', 'gsc240_not_visible', 'gsc240_errors_flags_not_visible')],
+    'hip': [('createTable', {'tableName': name}) for name in ('hip', 'hip_errors_flags')],
+    'sao2000': [('createTable1950', {}), ('createTable2000', {})],
+    'gaia_batch': [('createTable', {'tableName': name}) for name in ('gaia', 'gaia_errors_flags', 'gaia_not_visible', 'gaia_errors_flags_not_visible')],
+}
+TABLES['gaia_single'] = TABLES['gaia_batch']
+
+#------------------------------------------------------------------------------------------#
+# Stages                                                                                   #
+#------------------------------------------------------------------------------------------#
+
+def peakRss():
+    """
+    Returns the peak resident memory of this process in MB.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def runStage(results, catalog, stage, function):
+    """
+    Times one stage and records its rows/sec and the peak RSS so far.
+    Args:
+        results (List): Stage results to append to.
+        catalog (str): Catalog name.
+        stage (str): Stage name.
+        function (function): function() returns (value, rows handled).
+    Returns:
+        The value returned by function.
+    """
+    start = time.perf_counter()
+    value, rows = function()
+    seconds = time.perf_counter() - start
+    results.append({'catalog': catalog, 'stage': stage, 'rows': rows, 'seconds': round(seconds, 4),
+                    'rowsPerSec': round(rows / seconds, 1) if seconds > 0 else None, 'peakRssMB': peakRss()})
+    return value
+
+def insertBatches(standIn, batches, batchRows = 0):
+    """
+    Insert stage: inserts parsed (tableName, columns, rows) batches one row at a time like the scripts do, or with
+    multi-row statements of batchRows rows.
+    Returns:
+        Tuple: (None, int) - rows inserted
+    """
+    conn = standIn.connect(db_name = "bench")
+    cur = conn.cursor()
+    count = 0
+    for tableName, columns, rows in batches:
+        c, _ = pipeline.insertRows(cur, tableName, columns, rows, batchRows = batchRows)
+        count += c
+    conn.commit()
+    conn.close()
+    return None, count
+
+def ingest(module, catalog, standIn, tables, function):
+    """
+    Ingest stage: runs the script's own insert function with its connectToDatabase pointed at the stand-in.
+    Returns:
+        Tuple: (None, int) - rows stored in the tables
+    """
+    original = module.connectToDatabase
+    module.connectToDatabase = standIn.connect
+    try:
+        standIn.prepare(module, catalog)
+        function()
+        connpool.closePools()
+        return None, sum(standIn.count(tableName) for tableName in tables)
+    finally:
+        module.connectToDatabase = original
+
+def parsedRows(batches):
+    return batches, sum(len(rows) for _, _, rows in batches)
+
+def benchUcac4(module, folder, stars, makeStandIn, spatial):
+    results = []
+    path = os.path.join(folder, "u4b")
+    zones = runStage(results, 'ucac4', 'generate', lambda: (generateUcac4(path, stars), stars))
+    batches = runStage(results, 'ucac4', 'parse', lambda: parsedRows([batch for zone in zones for batch in module.parseBatches(zone, path = path, spatial = spatial)]))
+    runStage(results, 'ucac4', 'insert', lambda: insertBatches(makeStandIn('insert'), batches))
+    runStage(results, 'ucac4', 'ingest', lambda: ingest(module, 'ucac4', makeStandIn('ingest'), ['ucac4', 'ucac4_not_visible'],
+        lambda: [module.insertTable(databaseName = "bench", fileNum = zone, path = path, spatial = spatial) for zone in zones]))
+    return results
+
+def bench2mass(module, folder, stars, makeStandIn, spatial):
+    results = []
+    path = os.path.join(folder, "2mass")
+    files = runStage(results, '2mass', 'generate', lambda: (generate2mass(path, stars), stars))
+    tableNames = ['2mass', '2mass_not_visible']
+    def parse():
+        batches = []
+        columns = module.COLUMNS + ['HPX'] if spatial else module.COLUMNS
+        for dec1, dec2, ra in files:
+            rows, rows_nv = module.parseFile(path, dec1, dec2, ra, spatial)
+            batches += [(tableNames[0], columns, rows), (tableNames[1], columns, rows_nv)]
+        return parsedRows(batches)
+    batches = runStage(results, '2mass', 'parse', parse)
+    runStage(results, '2mass', 'insert', lambda: insertBatches(makeStandIn('insert'), batches))
+    runStage(results, '2mass', 'ingest', lambda: ingest(module, '2mass', makeStandIn('ingest'), tableNames,
+        lambda: [module.insertTable(databaseName = "bench", tableNames = tableNames, path = path, dec1 = dec1, dec2 = dec2, ra = ra, spatial = spatial) for dec1, dec2, ra in files]))
+    return results
+
+def benchGsc240(module, folder, stars, makeStandIn, spatial, batchRows = 0):
+    catalog = "gsc240" + ("_batched" if batchRows else "")
+    results = []
+    path = os.path.join(folder, catalog)
+    files = runStage(results, catalog, 'generate', lambda: (generateGsc240(path, stars), stars))
+    tableNames = ['gsc240', 'gsc240_errors_flags', 'gsc240_not_visible', 'gsc240_errors_flags_not_visible']
+    batches = runStage(results, catalog, 'parse', lambda: parsedRows([batch for task in files for batch in module.parseBatches(task, tableNames, path, spatial)]))
+    runStage(results, catalog, 'insert', lambda: insertBatches(makeStandIn('insert'), batches, batchRows))
+    runStage(results, catalog, 'ingest', lambda: ingest(module, 'gsc240', makeStandIn('ingest'), [tableNames[0], tableNames[2]],
+        lambda: [module.insertTable(databaseName = "bench", tableNames = tableNames, path = path, dec1 = dec1, dec2 = dec2, ra = ra, spatial = spatial, batchRows = batchRows) for dec1, dec2, ra in files]))
+    return results
+
+def benchHip(module, folder, stars, makeStandIn, spatial):
+    results = []
+    path = os.path.join(folder, "hip") + os.sep
+    runStage(results, 'hip', 'generate', lambda: (generateHip(path, stars), stars))
+    runStage(results, 'hip', 'ingest', lambda: ingest(module, 'hip', makeStandIn('ingest'), ['hip'],
+        lambda: module.insertTable(databaseName = "bench", path = path, spatial = spatial)))
+    return results
+
+def benchSao(module, folder, stars, makeStandIn, spatial):
+    results = []
+    fileName = runStage(results, 'sao2000', 'generate', lambda: (generateSao(os.path.join(folder, "sao"), stars), stars))
+    runStage(results, 'sao2000', 'parse', lambda: (module.readSao(fileName, stars), stars))
+    runStage(results, 'sao2000', 'ingest', lambda: ingest(module, 'sao2000', makeStandIn('ingest'), ['sao2000'],
+        lambda: module.insertTables(databaseName = "bench", numRows = stars, fileName = fileName, spatial = spatial)))
+    return results
+
+def benchGaia(module, folder, stars, makeStandIn, spatial, gz = False, readers = 1, columnar = False):
+    catalog = module.__name__ + ("_gz" if gz else "") + (f"_p{readers}" if readers > 1 else "") + ("_columnar" if columnar else "")
+    results = []
+    path = os.path.join(folder, catalog)
+    directories = runStage(results, catalog, 'generate', lambda: (generateGaia(path, stars, gz = gz), stars))
+    tableNames = ['gaia', 'gaia_errors_flags', 'gaia_not_visible', 'gaia_errors_flags_not_visible']
+    if module.__name__ == 'gaia_batch':
+        function = lambda: module.insertTable(databaseName = "bench", tableNames = tableNames, directories = directories, unzipped = not gz, spatial = spatial, readers = readers, columnar = columnar)
+    else:
+        function = lambda: [module.insertTable(databaseName = "bench", tableNames = tableNames, directName = directory, spatial = spatial) for directory in directories]
+    runStage(results, catalog, 'ingest', lambda: ingest(module, module.__name__, makeStandIn('ingest'), ['gaia', 'gaia_not_visible'], function))
+    return results
+
+# catalog: (script module, benchmark function)
+BENCHMARKS = {
+    'ucac4': ('ucac4', benchUcac4),
+    '2mass': ('2mass', bench2mass),
+    'gsc240': ('gsc240', benchGsc240),
+    'gsc240_batched': ('gsc240', lambda *args: benchGsc240(*args, batchRows = 1000)),
+    'hip': ('hip', benchHip),
+    'sao2000': ('sao2000', benchSao),
+    'gaia_batch': ('gaia_batch', benchGaia),
+    'gaia_batch_gz': ('gaia_batch', lambda *args: benchGaia(*args, gz = True)),
+    'gaia_batch_gz_p4': ('gaia_batch', lambda *args: benchGaia(*args, gz = True, readers = 4)),
+    'gaia_batch_columnar': ('gaia_batch', lambda *args: benchGaia(*args, columnar = True)),
+    'gaia_single': ('gaia_single', benchGaia),
+}
+
+def benchCatalog(catalog, folder, stars, mysql, spatial, results):
+    """
+    Runs one catalog's benchmark (in its own process, so the peak RSS is the catalog's own).
+    Args:
+        catalog (str): Catalog name, one of BENCHMARKS.
+        folder (str): Folder for the generated files and SQLite stand-ins.
+        stars (int): Number of stars to generate.
+        mysql (bool): Use a throwaway MySQL database instead of SQLite.
+        spatial (bool): Also compute the HPX column.
+        results (multiprocessing.Queue): Receives the list of stage results.
+    """
+    moduleName, function = BENCHMARKS[catalog]
+    module = importlib.import_module(moduleName)
+    catalogFolder = os.path.join(folder, catalog)
+    os.makedirs(catalogFolder, exist_ok = True)
+    standIns = []
+    def makeStandIn(stage):
+        standIn = MySQLStandIn(module.connectToDatabase, f"{catalog}_{stage}") if mysql else SQLiteStandIn(catalogFolder, stage)
+        standIns.append(standIn)
+        return standIn
+    try:
+        results.put(function(module, catalogFolder, stars, makeStandIn, spatial))
+    except Exception as e:
+        print(f"Benchmark Error {catalog}: {e}")
+        results.put([])
+    finally:
+        connpool.closePools()
+        for standIn in standIns:
+            standIn.cleanup()
+
+def printResults(results, baseline = None):
+    """
+    Prints the stage results, with the change against a baseline run when one is given.
+    Args:
+        results (List): Stage results.
+        baseline (List): Stage results of an earlier run (from -o).
+    Returns:
+        int: Number of stages slower than the baseline by more than REGRESSION.
+    """
+    previous = {(result['catalog'], result['stage']): result for result in baseline or []}
+    regressions = 0
+    print(f"{'catalog':<20}{'stage':<10}{'rows':>10}{'seconds':>10}{'rows/sec':>12}{'peak MB':>10}{'vs base':>10}")
+    for result in results:
+        change = ""
+        before = previous.get((result['catalog'], result['stage']))
+        if before and before['rowsPerSec'] and result['rowsPerSec']:
+            ratio = result['rowsPerSec'] / before['rowsPerSec']
+            change = f"{(ratio - 1) * 100:+.1f}%"
+            if ratio < 1 - REGRESSION and result['stage'] != 'generate':
+                change += " !"
+                regressions += 1
+        print(f"{result['catalog']:<20}{result['stage']:<10}{result['rows']:>10}{result['seconds']:>10.3f}{result['rowsPerSec'] or 0:>12.0f}{result['peakRssMB'] or 0:>10.1f}{change:>10}")
+    return regressions
+
+def parseArguments(in_args):
+    """
+    Parses command-line arguments.
+    Args:
+        in_args (List): List of command-line arguments.
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    description = "Benchmarks the parse and insert stages of each catalog script on synthetic files"
+    usage = "\n{} [-c catalogs] [-n stars] [-o results.json] [--compare baseline.json]\n".format(in_args[0])
+    epilog = ""
+    parser = argparse.ArgumentParser(description = description, usage = usage, epilog = epilog)
+    parser.add_argument("-c", "--catalogs", dest = "catalogs", type = str, help = f"Comma separated catalogs to benchmark: {', '.join(BENCHMARKS)} or all (default = 'all')", default = "all")
+    parser.add_argument("-n", "--stars", dest = "stars", type = int, help = "Number of synthetic stars per catalog (default = 20000)", default = 20000)
+    parser.add_argument("-f", "--folder", dest = "folder", type = str, help = "Folder for the generated files; it is deleted afterwards unless given (default = a temporary folder)", default = "")
+    parser.add_argument("-m", "--mysql", dest = "mysql", type = bool, help = "Insert into throwaway bench_* databases on the catalogs.conf server instead of SQLite (default = False)", default = False)
+    parser.add_argument("-s", "--spatial", dest = "spatial", type = bool, help = "Also compute the HPX column (default = False)", default = False)
+    parser.add_argument("-o", "--output", dest = "output", type = str, help = "Write the results to a JSON file (default = None)", default = "")
+    parser.add_argument("--compare", dest = "compare", type = str, help = "JSON results of an earlier run to compare rows/sec against (default = None)", default = "")
+    args = None
+    try:
+        args = parser.parse_args(in_args[1:])
+    except Exception as e:
+        print(e)
+        parser.print_help()
+        sys.exit(0)
+    return args
+
+def runBenchmarks():
+    """
+    Runs the benchmarks selected on the command line. Exits with status 1 if --compare finds a regression.
+    Returns:
+        None
+    """
+    args = parseArguments(sys.argv)
+    catalogs = list(BENCHMARKS) if args.catalogs == "all" else args.catalogs.split(",")
+    folder = args.folder or tempfile.mkdtemp(prefix = "catalog_bench_")
+    results = []
+    try:
+        for catalog in catalogs:
+            queue = multiprocessing.Queue()
+            proc = multiprocessing.Process(target = benchCatalog, args = (catalog, folder, args.stars, args.mysql, args.spatial, queue))
+            proc.start()
+            results += queue.get()
+            proc.join()
+    finally:
+        if not args.folder:
+            shutil.rmtree(folder, ignore_errors = True)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    regressions = printResults(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'stars': args.stars, 'mysql': args.mysql, 'spatial': args.spatial, 'results': results}, f, indent = 1)
+    if regressions:
+        print(f"{regressions} stages are more than {REGRESSION:.0%} slower than the baseline")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    runBenchmarks()
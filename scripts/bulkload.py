@@ -0,0 +1,76 @@
+import os
+import tempfile
+
+def escapeField(value):
+    """
+    Converts a python value to its LOAD DATA text form (tabs, newlines and backslashes escaped, None as \\N).
+    Args:
+        value: The value to be written to the chunk file.
+    Returns:
+        str: The escaped field.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    value = str(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+def writeChunk(rows, fileName):
+    """
+    Writes a list of row tuples to a tab separated chunk file.
+    Args:
+        rows (List): List of row tuples.
+        fileName (str): Path of the chunk file to write.
+    Returns:
+        int: Number of rows written.
+    """
+    with open(fileName, 'w', newline = '\n') as f:
+        for row in rows:
+            f.write("\t".join(escapeField(value) for value in row))
+            f.write("\n")
+    return len(rows)
+
+def loadChunk(cur, fileName, tableName, columns):
+    """
+    Loads a chunk file into a table with LOAD DATA LOCAL INFILE. Duplicate primary keys are skipped.
+    Args:
+        cur (pymysql.cursors.Cursor): Cursor of a connection opened with local_infile = True.
+        fileName (str): Path of the chunk file.
+        tableName (str): Name of the table.
+        columns (List): Column names in the same order as the row tuples.
+    Returns:
+        int: Number of rows inserted.
+    """
+    fileName = os.path.abspath(fileName).replace('\\', '/')
+    sql = f"""LOAD DATA LOCAL INFILE '{fileName}' IGNORE INTO TABLE {tableName} \
+            CHARACTER SET utf8mb4 \
+            FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' \
+            LINES TERMINATED BY '\\n' \
+            ({', '.join(columns)});"""
+    cur.execute(sql)
+    return cur.rowcount
+
+def bulkInsert(cur, tableName, columns, rows, chunkRows = 500000, tmpDir = None):
+    """
+    Inserts rows into a table by writing them to chunk files and loading each with LOAD DATA LOCAL INFILE.
+    Args:
+        cur (pymysql.cursors.Cursor): Cursor of a connection opened with local_infile = True.
+        tableName (str): Name of the table.
+        columns (List): Column names in the same order as the row tuples.
+        rows (List): List of row tuples.
+        chunkRows (int): Maximum number of rows per chunk file.
+        tmpDir (str): Directory for the chunk files (default = system temp directory).
+    Returns:
+        Tuple: (int, int) - rows inserted, duplicate rows skipped
+    """
+    inserted = 0
+    for start in range(0, len(rows), chunkRows):
+        fd, fileName = tempfile.mkstemp(suffix = ".tsv", prefix = f"{tableName}_", dir = tmpDir)
+        os.close(fd)
+        try:
+            writeChunk(rows[start:start + chunkRows], fileName)
+            inserted += loadChunk(cur, fileName, tableName, columns)
+        finally:
+            os.remove(fileName)
+    return inserted, len(rows) - inserted
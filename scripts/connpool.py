@@ -0,0 +1,195 @@
+import os
+import time
+import queue
+import atexit
+import threading
+import contextlib
+import pymysql
+
+# Default number of connections a pool keeps open
+POOL_SIZE = 4
+# The pool size set by setPoolSize is kept in the environment so worker processes started by an ingest use it too
+POOL_SIZE_VARIABLE = "CATALOG_POOL_SIZE"
+# Seconds a connection may sit idle before it is pinged on checkout
+PING_INTERVAL = 30
+
+class ConnectionPool:
+    """
+    Keeps database connections open between uses so each insertTable call does not pay for a new
+    TCP connection and login. Connections are health checked when they are checked out.
+    """
+    def __init__(self, connect, size = None, pingInterval = PING_INTERVAL, setup = None):
+        """
+        Args:
+            connect (function): connect() returns a new database connection.
+            size (int): Maximum number of connections checked out at once (default = None, poolSize()).
+            pingInterval (float): Seconds a connection may sit idle before it is pinged on checkout.
+            setup (function): setup(conn) runs once on each new connection, ex: to set session variables.
+        """
+        self.connect = connect
+        self.setup = setup
+        size = size or poolSize()
+        self.size = size
+        self.pingInterval = pingInterval
+        self.pid = os.getpid()
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def healthy(self, conn, lastUsed):
+        """
+        Checks an idle connection before it is lent out again.
+        Args:
+            conn (pymysql.Connection): Idle connection.
+            lastUsed (float): time.monotonic() when the connection was returned.
+        Returns:
+            bool: Whether the connection can be used.
+        """
+        if not conn.open:
+            return False
+        if time.monotonic() - lastUsed < self.pingInterval:
+            return True
+        try:
+            #a reconnect would lose the session settings, so a dead connection is replaced instead
+            conn.ping(reconnect = False)
+            return True
+        except Exception:
+            return False
+
+    def newConnection(self):
+        """
+        Opens a connection and runs the setup function on it.
+        Returns:
+            pymysql.Connection: Database connection.
+        """
+        conn = self.connect()
+        if self.setup is not None:
+            try:
+                self.setup(conn)
+            except:
+                closeQuietly(conn)
+                raise
+        return conn
+
+    def acquire(self):
+        """
+        Checks out a connection, reusing an idle one when possible. Blocks while size connections are checked out.
+        Returns:
+            pymysql.Connection: Database connection.
+        """
+        self.slots.acquire()
+        try:
+            while True:
+                try:
+                    conn, lastUsed = self.idle.get_nowait()
+                except queue.Empty:
+                    return self.newConnection()
+                if self.healthy(conn, lastUsed):
+                    return conn
+                closeQuietly(conn)
+        except:
+            self.slots.release()
+            raise
+
+    def release(self, conn, broken = False):
+        """
+        Returns a checked out connection to the pool.
+        Args:
+            conn (pymysql.Connection): Connection from acquire().
+            broken (bool): Close the connection instead of keeping it.
+        """
+        try:
+            if broken or not conn.open:
+                closeQuietly(conn)
+            else:
+                self.idle.put((conn, time.monotonic()))
+        finally:
+            self.slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Lends a connection for the body of a with block. A connection that fails with a connection
+        error is closed instead of being returned to the pool.
+        Returns:
+            Context manager: yields a pymysql.Connection
+        """
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken)
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+        while True:
+            try:
+                conn, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            closeQuietly(conn)
+
+def closeQuietly(conn):
+    """
+    Closes a connection, ignoring errors from connections that are already dead.
+    Args:
+        conn (pymysql.Connection): Connection to close.
+    """
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+pools = {}
+poolsLock = threading.Lock()
+
+def getPool(connect, size = None, setup = None, **kwargs):
+    """
+    Returns the shared pool for a connect function and its arguments, creating it on first use.
+    Pools are per process, so worker processes never share a parent's sockets.
+    Args:
+        connect (function): The script's connectToDatabase.
+        size (int): Pool size used if the pool is created (default = None, poolSize()).
+        setup (function): setup(conn) runs once on each new connection; pools with different setups are kept apart.
+        kwargs: Arguments for connect, ex: db_name = "GSC240_dev", local_infile = True.
+    Returns:
+        ConnectionPool: Shared pool.
+    """
+    key = (connect, setup, tuple(sorted(kwargs.items())))
+    with poolsLock:
+        pool = pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool = ConnectionPool(lambda: connect(**kwargs), size, setup = setup)
+            pools[key] = pool
+        return pool
+
+def poolSize():
+    """
+    Returns:
+        int: Size of the pools created from now on, set by setPoolSize (default = POOL_SIZE).
+    """
+    return int(os.environ.get(POOL_SIZE_VARIABLE, POOL_SIZE))
+
+def setPoolSize(size):
+    """
+    Sets the size of the pools created from now on, in this process and the worker processes it starts.
+    Args:
+        size (int): Maximum number of connections checked out at once per pool.
+    """
+    os.environ[POOL_SIZE_VARIABLE] = str(int(size))
+
+@atexit.register
+def closePools():
+    """
+    Closes the idle connections of every pool this process created.
+    """
+    with poolsLock:
+        for pool in pools.values():
+            if pool.pid == os.getpid():
+                pool.close()
+        pools.clear()
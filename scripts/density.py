@@ -0,0 +1,439 @@
+import os
+import glob
+import json
+import numpy as np
+import healpix
+
+# Sky density grids: star counts in cells of resolution x resolution degrees, indexed
+# [floor(RA / resolution)][floor((Dec + 90) / resolution)] like the grids in plots/bins, so catalog_plots.py can
+# plot them without rescanning the catalog. At the default 1 degree a grid is RA_BINS x DEC_BINS.
+RA_BINS = 360
+DEC_BINS = 180
+
+# HEALPix maps: star counts per nested pixel (equal area) at one order, 12 * 4**order pixels. A pixel of one order
+# is the 4 pixels of the next with ids 4 * id .. 4 * id + 3, so every coarser order is added up from the finest.
+# Order 10 pixels are about 3.4 arcmin across, order 12 (the HPX column's) 0.86 arcmin.
+MAX_HEALPIX_ORDER = 12
+
+# The output folder, resolution and HEALPix order are kept in the environment so worker processes started by an
+# ingest count their stars too
+PATH_VARIABLE = "CATALOG_BINS"
+RESOLUTION_VARIABLE = "CATALOG_BINS_RESOLUTION"
+HEALPIX_VARIABLE = "CATALOG_BINS_HEALPIX"
+
+# Grids of this process: {catalog: flat int64 array of the configured resolution's counts}
+grids = {}
+# HEALPix maps of this process: {catalog: uint32 array of counts at the configured order}
+maps = {}
+# Pixel ids counted since the last take() or fold: {catalog: [int64 arrays]}. A map has 12 * 4**order pixels
+# (805 MB at order 12), so a worker that takes its counts after every file sends the ids it saw instead of
+# allocating and scanning a whole map; the ids are only folded into a map past PENDING_IDS
+pending = {}
+PENDING_IDS = 1 << 22
+
+def configure(directory, resolution = 1, healpixOrder = None):
+    """
+    Turns density counting on for this process and the worker processes it starts.
+    Args:
+        directory (str): Folder the grid files are written to by save().
+        resolution (float): Cell size in degrees; 1 must be a whole number of cells, ex: 1, 0.5, 0.25, 0.1.
+        healpixOrder (int): Finest order of the HEALPix maps to count as well, up to MAX_HEALPIX_ORDER (default = None, no maps).
+    """
+    cellsPerDegree(resolution)
+    if healpixOrder is not None and not 0 <= healpixOrder <= MAX_HEALPIX_ORDER:
+        raise ValueError(f"HEALPix order must be between 0 and {MAX_HEALPIX_ORDER}, not {healpixOrder}")
+    #absolute, since the gaia scripts change directory while they read
+    os.environ[PATH_VARIABLE] = os.path.abspath(directory)
+    os.environ[RESOLUTION_VARIABLE] = repr(float(resolution))
+    if healpixOrder is None:
+        os.environ.pop(HEALPIX_VARIABLE, None)
+    else:
+        os.environ[HEALPIX_VARIABLE] = str(healpixOrder)
+
+def enabled():
+    """
+    Returns:
+        bool: Whether an output folder is configured.
+    """
+    return bool(os.environ.get(PATH_VARIABLE))
+
+def cellsPerDegree(resolution):
+    """
+    Args:
+        resolution (float): Cell size in degrees.
+    Returns:
+        int: Cells along one degree of RA or Dec.
+    """
+    perDegree = round(1 / resolution)
+    if resolution <= 0 or abs(perDegree * resolution - 1) > 1e-9:
+        raise ValueError(f"bin resolution must divide 1 degree evenly, not {resolution}")
+    return perDegree
+
+def resolution():
+    """
+    Returns:
+        float: The configured cell size in degrees (default = 1).
+    """
+    return float(os.environ.get(RESOLUTION_VARIABLE, 1))
+
+def healpixOrder():
+    """
+    Returns:
+        int: The configured HEALPix order, or None when no maps are counted.
+    """
+    order = os.environ.get(HEALPIX_VARIABLE)
+    return None if order is None else int(order)
+
+def gridShape(resolution = 1):
+    """
+    Args:
+        resolution (float): Cell size in degrees.
+    Returns:
+        Tuple: (RA cells, Dec cells) of a grid.
+    """
+    perDegree = cellsPerDegree(resolution)
+    return RA_BINS * perDegree, DEC_BINS * perDegree
+
+def cells(ra, dec, resolution = 1):
+    """
+    Returns the flat grid cell of each position. Positions that are not numbers are left out.
+    Args:
+        ra (Numpy array): Right ascensions in degrees.
+        dec (Numpy array): Declinations in degrees.
+        resolution (float): Cell size in degrees.
+    Returns:
+        Numpy array: int64 cell numbers, RA cell * Dec cells + Dec cell.
+    """
+    perDegree = cellsPerDegree(resolution)
+    raCells, decCells = gridShape(resolution)
+    ra = np.asarray(ra, dtype = np.float64)
+    dec = np.asarray(dec, dtype = np.float64)
+    valid = np.isfinite(ra) & np.isfinite(dec)
+    raCell = np.floor(ra[valid] * perDegree).astype(np.int64) % raCells
+    #Dec +90 exactly goes in the top row
+    decCell = np.clip(np.floor((dec[valid] + 90) * perDegree).astype(np.int64), 0, decCells - 1)
+    return raCell * decCells + decCell
+
+def add(catalog, ra, dec):
+    """
+    Counts a batch of stars into the catalog's grid.
+    Args:
+        catalog (str): Catalog name, used in the file name, ex: "2mass" writes 2mass_bins_1deg.npy.
+        ra (Numpy array): Right ascensions in degrees.
+        dec (Numpy array): Declinations in degrees.
+    """
+    if not enabled():
+        return
+    ra = np.asarray(ra, dtype = np.float64)
+    dec = np.asarray(dec, dtype = np.float64)
+    np.add.at(grid(catalog), cells(ra, dec, resolution()), 1)
+    order = healpixOrder()
+    if order is not None:
+        valid = np.isfinite(ra) & np.isfinite(dec)
+        ids = pending.setdefault(catalog, [])
+        ids.append(healpix.healpixIds(ra[valid], np.clip(dec[valid], -90, 90), order))
+        if sum(len(part) for part in ids) > PENDING_IDS:
+            fold(catalog)
+
+def grid(catalog):
+    """
+    Args:
+        catalog (str): Catalog name.
+    Returns:
+        Numpy array: The catalog's flat grid in this process, created empty at the configured resolution.
+    """
+    counts = grids.get(catalog)
+    if counts is None:
+        raCells, decCells = gridShape(resolution())
+        counts = grids[catalog] = np.zeros(raCells * decCells, dtype = np.int64)
+    return counts
+
+def healpixMap(catalog):
+    """
+    Args:
+        catalog (str): Catalog name.
+    Returns:
+        Numpy array: The catalog's HEALPix map in this process, created empty at the configured order.
+    """
+    counts = maps.get(catalog)
+    if counts is None:
+        counts = maps[catalog] = np.zeros(healpixPixels(healpixOrder()), dtype = np.uint32)
+    return counts
+
+def fold(catalog):
+    """
+    Adds the catalog's pending pixel ids to its HEALPix map.
+    Args:
+        catalog (str): Catalog name.
+    """
+    ids = pending.pop(catalog, [])
+    if ids:
+        pixels, counts = np.unique(np.concatenate(ids), return_counts = True)
+        healpixMap(catalog)[pixels] += counts.astype(np.uint32)
+
+def addRows(catalog, rows, raIndex, decIndex):
+    """
+    Counts row tuples into the catalog's grid.
+    Args:
+        catalog (str): Catalog name.
+        rows (List): Row tuples.
+        raIndex (int): Position of the RA degree column.
+        decIndex (int): Position of the Dec degree column.
+    """
+    if not enabled() or len(rows) == 0:
+        return
+    #None (NULL) becomes NaN and is left out
+    ra = np.array([row[raIndex] for row in rows], dtype = np.float64)
+    dec = np.array([row[decIndex] for row in rows], dtype = np.float64)
+    add(catalog, ra, dec)
+
+def take():
+    """
+    Returns and clears this process's counts, so a worker process can send them to the process that saves them.
+    Returns:
+        Dict: {"grids": {catalog: (cells, counts)}, "maps": {catalog: (pixels, counts)}} - the non-empty cells of each grid and map
+    """
+    partial = {"grids": {}, "maps": {}}
+    for catalog, counts in grids.items():
+        cells = np.flatnonzero(counts)
+        partial["grids"][catalog] = (cells, counts[cells])
+    grids.clear()
+    for catalog in set(pending) | set(maps):
+        #a whole map is only scanned if the ids outgrew PENDING_IDS since the last take
+        ids = pending.pop(catalog, [])
+        pixels, counts = np.unique(np.concatenate(ids), return_counts = True) if ids else (np.zeros(0, np.int64), np.zeros(0, np.int64))
+        if catalog in maps:
+            counted = maps.pop(catalog)
+            cells = np.flatnonzero(counted)
+            pixels, inverse = np.unique(np.concatenate([pixels, cells]), return_inverse = True)
+            counts = np.bincount(inverse, weights = np.concatenate([counts, counted[cells]]), minlength = len(pixels)).astype(np.int64)
+        partial["maps"][catalog] = (pixels, counts)
+    return partial
+
+def merge(partial):
+    """
+    Adds counts taken from another process to this process's grids.
+    Args:
+        partial (Dict): Result of take().
+    """
+    for catalog, (cells, counts) in partial["grids"].items():
+        np.add.at(grid(catalog), cells, counts)
+    for catalog, (pixels, counts) in partial["maps"].items():
+        #pixels are unique, so a plain indexed add is enough
+        healpixMap(catalog)[pixels] += counts.astype(np.uint32)
+
+def downsample(counts, factor):
+    """
+    Adds up blocks of factor x factor cells, ex: a 0.25 degree grid with factor 4 becomes a 1 degree grid.
+    Args:
+        counts (Numpy array): RA cells x Dec cells grid.
+        factor (int): Cells per side of a block; must divide both sides.
+    Returns:
+        Numpy array: The coarser grid.
+    """
+    raCells, decCells = counts.shape
+    return counts.reshape(raCells // factor, factor, decCells // factor, factor).sum(axis = (1, 3))
+
+def gridPath(folder, catalog, resolution = 1):
+    """
+    Args:
+        folder (str): Folder of the grid files.
+        catalog (str): Catalog name.
+        resolution (float): Cell size in degrees.
+    Returns:
+        str: Path of the .npy counts; the metadata is the same path with .json, ex: bins/gaia_bins_1deg.npy.
+    """
+    return os.path.join(folder, f"{catalog}_bins_{resolution:g}deg.npy")
+
+def saveGrid(folder, catalog, counts, resolution = 1):
+    """
+    Writes a grid as a .npy file of uint32 counts (uint64 if a cell does not fit) with a .json file of metadata
+    next to it. Both are written through temporary files, so a reader never sees a partial grid.
+    Args:
+        folder (str): Folder of the grid files.
+        catalog (str): Catalog name.
+        counts (Numpy array): RA cells x Dec cells grid of whole counts.
+        resolution (float): Cell size in degrees.
+    Returns:
+        str: Path of the .npy file.
+    """
+    counts = np.asarray(counts)
+    if counts.shape != gridShape(resolution):
+        raise ValueError(f"a {resolution:g} degree grid is {gridShape(resolution)}, not {counts.shape}")
+    dtype = np.uint32 if counts.max(initial = 0) <= np.iinfo(np.uint32).max else np.uint64
+    path = gridPath(folder, catalog, resolution)
+    root = os.path.splitext(path)[0]
+    os.makedirs(folder, exist_ok = True)
+    with open(f"{path}.tmp", "wb") as f:
+        np.save(f, counts.astype(dtype))
+    metadata = {"catalog": catalog, "resolution": resolution, "shape": list(counts.shape), "dtype": np.dtype(dtype).name,
+                "stars": int(counts.sum()), "index": "[floor(RA / resolution)][floor((Dec + 90) / resolution)]"}
+    with open(f"{root}.json.tmp", "w") as f:
+        json.dump(metadata, f, indent = 1)
+    os.replace(f"{path}.tmp", path)
+    os.replace(f"{root}.json.tmp", f"{root}.json")
+    return path
+
+def gridInfo(folder, catalog, resolution = 1):
+    """
+    Args:
+        folder (str): Folder of the grid files.
+        catalog (str): Catalog name.
+        resolution (float): Cell size in degrees.
+    Returns:
+        Dict: The grid's metadata: catalog, resolution, shape, dtype, stars and index.
+    """
+    with open(os.path.splitext(gridPath(folder, catalog, resolution))[0] + ".json") as f:
+        return json.load(f)
+
+def gridResolutions(folder, catalog):
+    """
+    Args:
+        folder (str): Folder of the grid files.
+        catalog (str): Catalog name.
+    Returns:
+        List: Cell sizes in degrees the catalog has grids for, finest first.
+    """
+    paths = glob.glob(os.path.join(glob.escape(folder), f"{glob.escape(catalog)}_bins_*deg.npy"))
+    return sorted(float(os.path.basename(path)[len(catalog) + 6:-7]) for path in paths)
+
+def loadGrid(folder, catalog, resolution = 1):
+    """
+    Memory-maps a grid written by saveGrid. Nothing is read until cells are used, and slicing or transposing the
+    result (ex: .T for plotting Dec against RA) gives views of the file rather than copies.
+    Args:
+        folder (str): Folder of the grid files.
+        catalog (str): Catalog name.
+        resolution (float): Cell size in degrees.
+    Returns:
+        Numpy memmap: Read-only RA cells x Dec cells grid of counts.
+    """
+    counts = np.load(gridPath(folder, catalog, resolution), mmap_mode = "r", allow_pickle = False)
+    if counts.shape != gridShape(resolution):
+        raise ValueError(f"{gridPath(folder, catalog, resolution)} is {counts.shape}, not a {resolution:g} degree grid")
+    return counts
+
+def healpixPixels(order):
+    """
+    Args:
+        order (int): HEALPix order.
+    Returns:
+        int: Pixels of a map, 12 * 4**order.
+    """
+    return 12 << (2 * order)
+
+def downgrade(counts, levels = 1):
+    """
+    Adds up a nested HEALPix map to a coarser order, each level adding the 4 pixels inside each coarser pixel.
+    Args:
+        counts (Numpy array): Map of 12 * 4**order counts.
+        levels (int): Orders to go down.
+    Returns:
+        Numpy array: Map of 12 * 4**(order - levels) counts.
+    """
+    return counts.reshape(-1, 4 ** levels).sum(axis = 1, dtype = counts.dtype)
+
+def healpixPath(folder, catalog, order):
+    """
+    Args:
+        folder (str): Folder of the map files.
+        catalog (str): Catalog name.
+        order (int): HEALPix order.
+    Returns:
+        str: Path of the .npy counts; the metadata is the same path with .json, ex: bins/gaia_hpx_8.npy.
+    """
+    return os.path.join(folder, f"{catalog}_hpx_{order}.npy")
+
+def saveHealpix(folder, catalog, counts, order):
+    """
+    Writes a nested HEALPix map as a .npy file of uint32 counts with a .json file of metadata next to it.
+    Args:
+        folder (str): Folder of the map files.
+        catalog (str): Catalog name.
+        counts (Numpy array): Map of 12 * 4**order counts.
+        order (int): HEALPix order.
+    Returns:
+        str: Path of the .npy file.
+    """
+    counts = np.asarray(counts)
+    if counts.shape != (healpixPixels(order),):
+        raise ValueError(f"an order {order} HEALPix map has {healpixPixels(order)} pixels, not {counts.shape}")
+    path = healpixPath(folder, catalog, order)
+    root = os.path.splitext(path)[0]
+    os.makedirs(folder, exist_ok = True)
+    with open(f"{path}.tmp", "wb") as f:
+        np.save(f, counts.astype(np.uint32))
+    #41252.96 square degrees on the sky
+    metadata = {"catalog": catalog, "order": order, "nside": 1 << order, "scheme": "nested", "pixels": healpixPixels(order),
+                "pixelArea": 4 * 180 ** 2 / np.pi / healpixPixels(order), "dtype": "uint32", "stars": int(counts.sum())}
+    with open(f"{root}.json.tmp", "w") as f:
+        json.dump(metadata, f, indent = 1)
+    os.replace(f"{path}.tmp", path)
+    os.replace(f"{root}.json.tmp", f"{root}.json")
+    return path
+
+def healpixInfo(folder, catalog, order):
+    """
+    Args:
+        folder (str): Folder of the map files.
+        catalog (str): Catalog name.
+        order (int): HEALPix order.
+    Returns:
+        Dict: The map's metadata: catalog, order, nside, scheme, pixels, pixelArea (square degrees), dtype and stars.
+    """
+    with open(os.path.splitext(healpixPath(folder, catalog, order))[0] + ".json") as f:
+        return json.load(f)
+
+def healpixOrders(folder, catalog):
+    """
+    Args:
+        folder (str): Folder of the map files.
+        catalog (str): Catalog name.
+    Returns:
+        List: HEALPix orders the catalog has maps for, coarsest first.
+    """
+    paths = glob.glob(os.path.join(glob.escape(folder), f"{glob.escape(catalog)}_hpx_*.npy"))
+    return sorted(int(os.path.basename(path)[len(catalog) + 5:-4]) for path in paths)
+
+def loadHealpix(folder, catalog, order):
+    """
+    Memory-maps a HEALPix map written by saveHealpix; indexing it reads only the pages of the pixels used.
+    Args:
+        folder (str): Folder of the map files.
+        catalog (str): Catalog name.
+        order (int): HEALPix order.
+    Returns:
+        Numpy memmap: Read-only counts of the 12 * 4**order nested pixels.
+    """
+    counts = np.load(healpixPath(folder, catalog, order), mmap_mode = "r", allow_pickle = False)
+    if counts.shape != (healpixPixels(order),):
+        raise ValueError(f"{healpixPath(folder, catalog, order)} is {counts.shape}, not an order {order} HEALPix map")
+    return counts
+
+def save():
+    """
+    Writes each grid of this process to the configured folder with saveGrid, at the configured resolution and,
+    when that is finer, also added up to 1 degree. Each HEALPix map is written with saveHealpix at the configured
+    order and every coarser order down to 0. A file covers the stars read by this ingest only.
+    Returns:
+        List: Paths of the .npy files written.
+    """
+    if not enabled():
+        return []
+    directory = os.environ[PATH_VARIABLE]
+    cellSize = resolution()
+    paths = []
+    for catalog, counts in grids.items():
+        counts = counts.reshape(gridShape(cellSize))
+        paths.append(saveGrid(directory, catalog, counts, cellSize))
+        if cellSize != 1:
+            paths.append(saveGrid(directory, catalog, downsample(counts, cellsPerDegree(cellSize)), 1))
+    order = healpixOrder()
+    for catalog in list(pending):
+        fold(catalog)
+    for catalog, counts in maps.items():
+        for level in range(order, -1, -1):
+            paths.append(saveHealpix(directory, catalog, counts, level))
+            if level:
+                counts = downgrade(counts)
+    return paths
@@ -0,0 +1,69 @@
+def relaxSession(conn):
+    """
+    Turns off the per-row checks that an initial load into unkeyed tables does not need.
+    sql_log_bin can only be changed by privileged users, so it is left on when that is not allowed.
+    Args:
+        conn (pymysql.Connection): New database connection.
+    Returns:
+        None
+    """
+    cur = conn.cursor()
+    cur.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0;")
+    try:
+        cur.execute("SET SESSION sql_log_bin = 0;")
+    except Exception as e:
+        print(f"sql_log_bin left on: {e}")
+    cur.close()
+
+def finishTable(cur, tableName, key, spatial = False):
+    """
+    Ends a fast initial load: copies the table into a keyed copy in primary key order, which drops the
+    duplicate stars and builds the primary key in one sorted pass, swaps the copy in, then builds the
+    HPX index in a single ALTER.
+    Args:
+        cur (pymysql.cursors.Cursor): Database cursor.
+        tableName (str): Name of the table loaded without keys.
+        key (str): Primary key column.
+        spatial (bool): Build the HPX index.
+    Returns:
+        int: Duplicate rows removed.
+    """
+    if cur.execute(f"SHOW KEYS FROM {tableName} WHERE Key_name = 'PRIMARY';") > 0:
+        #already finished by an earlier run
+        return 0
+    cur.execute(f"SELECT COUNT(*) FROM {tableName};")
+    loaded = cur.fetchone()[0]
+    cur.execute(f"DROP TABLE IF EXISTS {tableName}_keyed;")
+    cur.execute(f"CREATE TABLE {tableName}_keyed LIKE {tableName};")
+    cur.execute(f"ALTER TABLE {tableName}_keyed ADD PRIMARY KEY ({key});")
+    #one row of each key is kept, the rest are the duplicates the 1062 catches used to count
+    kept = cur.execute(f"INSERT IGNORE INTO {tableName}_keyed SELECT * FROM {tableName} ORDER BY {key};")
+    cur.execute(f"RENAME TABLE {tableName} TO {tableName}_unkeyed, {tableName}_keyed TO {tableName};")
+    cur.execute(f"DROP TABLE {tableName}_unkeyed;")
+    if spatial:
+        cur.execute(f"ALTER TABLE {tableName} ADD INDEX {tableName}_hpx (HPX);")
+    return loaded - kept
+
+def finishTables(conn, tables, spatial = False, verbose = True):
+    """
+    Runs finishTable on each table of a catalog and reports the duplicates removed.
+    Args:
+        conn (pymysql.Connection): Database connection.
+        tables (List): List of (tableName, key column, has HPX column) tuples.
+        spatial (bool): Build the HPX index on the tables that have the column.
+        verbose (bool): Print the duplicates removed from each table.
+    Returns:
+        Dict: {tableName: duplicates removed}
+    """
+    removed = {}
+    cur = conn.cursor()
+    for tableName, key, hasHpx in tables:
+        try:
+            removed[tableName] = finishTable(cur, tableName, key, spatial and hasHpx)
+            conn.commit()
+            if verbose:
+                print(f"{tableName}: {removed[tableName]} duplicates removed")
+        except Exception as e:
+            print(f"Key Build Error {tableName}: {e}")
+    cur.close()
+    return removed
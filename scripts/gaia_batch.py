@@ -12,6 +12,30 @@ import random
 import configparser
 import csv
 import gzip
+import queue
+import threading
+import itertools
+import functools
+import collections
+import multiprocessing
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
+import bulkload
+import healpix
+import connpool
+import fastload
+import density
+import instrument
+from sexagesimal import fillSexag
+#faster gzip bindings with the same interface as gzip; zlib is the fallback
+try:
+    from isal import igzip as fastgzip
+except ImportError:
+    try:
+        from zlib_ng import gzip_ng as fastgzip
+    except ImportError:
+        fastgzip = gzip
 
 
 def connectionParameters():
@@ -31,19 +55,20 @@ def connectionParameters():
     db_password = config['GAIA']['password']
     return db_host, db_port, db_user, db_password
 
-def connectToDatabase(db_name = None):
+def connectToDatabase(db_name = None, local_infile = False):
     """
     Returns a connection to the MySQL database.
     Args:
         db_name (str): Name of the database.
+        local_infile (bool): Allow LOAD DATA LOCAL INFILE on the connection.
     Returns:
         pymysql.Connection: MySQL database connection.
     """
     db_host, db_port, db_user, db_password = connectionParameters()
     if db_name == None:
-        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password,autocommit=True)
+        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password,autocommit=True, local_infile = local_infile)
     else:
-        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name,autocommit=True)
+        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name,autocommit=True, local_infile = local_infile)
     return conn
     
 def cnm(mag):
@@ -78,18 +103,21 @@ def createDatabase(databaseName = "GAIA_dev"):
         print("DB already created")
         pass
     
-def createTable(databaseName = "GAIA_dev", tableName = "gaia"): 
+def createTable(databaseName = "GAIA_dev", tableName = "gaia", spatial = False, deferKeys = False): 
     """
     Creates the specified table.
     Args:
         databaseName (str): Name of the database.
         tableName (str): Name of the table.
+        spatial (bool): Add the indexed HPX (HEALPix pixel id) column to the star tables.
+        deferKeys (bool): Leave out the primary key and HPX index; fastload.finishTable builds them after the load.
     """
     conn = connectToDatabase(db_name = databaseName)
     cur = conn.cursor()
+    primaryKey = "" if deferKeys else " PRIMARY KEY"
     if tableName == 'gaia' or tableName == 'gaia_not_visible':
         query = f"""CREATE TABLE {tableName} (\
-                GAIA_ID VARCHAR(30) PRIMARY KEY,\
+                GAIA_ID VARCHAR(30){primaryKey},\
                 RA VARCHAR(13),\
                 Decl VARCHAR(13),\
                 Ra_deg DOUBLE,\
@@ -107,10 +135,12 @@ def createTable(databaseName = "GAIA_dev", tableName = "gaia"):
                 );\
             """
         cur.execute(query)
+        if spatial:
+            healpix.addSpatialColumn(cur, tableName, index = not deferKeys)
         print(f"{tableName} created")
     elif tableName == 'gaia_errors_flags' or tableName == 'gaia_errors_flags_not_visible':
         query = f"""CREATE TABLE {tableName} (\
-        GAIA_ID VARCHAR(30) PRIMARY KEY,\
+        GAIA_ID VARCHAR(30){primaryKey},\
         source_id BIGINT,\
         solution_id BIGINT,\
         random_index BIGINT,\
@@ -252,6 +282,483 @@ def cpvf(value):
     return str(value)
 
 
+def openFile(filename, unzipped = True, text = True):
+    """
+    Opens a Gaia csv file; .csv.gz files are decompressed with the fastest gzip module installed.
+    Args:
+        filename (str): Path of the file.
+        unzipped (bool): The file is a plain .csv rather than .csv.gz.
+        text (bool): Open in text mode rather than binary.
+    Returns:
+        file: File object.
+    """
+    mode = 'rt' if text else 'rb'
+    if unzipped:
+        return open(filename, mode)
+    return fastgzip.open(filename, mode)
+
+def parseFile(filename, ef = False, spatial = False, unzipped = True):
+    """
+    Parses one Gaia csv file into row tuples for the four tables. The RA and Decl strings of the gaia rows are
+    left as None for flush to fill in for the whole batch.
+    Args:
+        filename (str): Path of the file.
+        ef (bool): Parse the errors flags columns instead of the gaia columns.
+        spatial (bool): Append the HPX pixel id to each gaia row.
+        unzipped (bool): The file is a plain .csv rather than .csv.gz.
+    Returns:
+        Tuple: (List, List, List, List, int) - gaia, gaia_not_visible, gaia_errors_flags, gaia_errors_flags_not_visible rows, stars
+    """
+    gaia, gaia_nv, gaia_ef, gaia_ef_nv = [], [], [], []
+    count = 0
+    stats = instrument.current()
+    with stats.stage('open'):
+        f = openFile(filename, unzipped)
+    with f:
+        for line in stats.reader(f):
+            try:
+                check = line[2]
+                if check == 'source_id':
+                    pass #this is the first line of each file with the headers
+                else:
+                    dec_deg = cbf(line[7])
+                    if dec_deg < -70.:
+                        if ef:
+                            solution_id = cbi(line[0])
+                            source_id = cbi(line[2])
+                            random_index = cbi(line[3])
+                            ra_error = cbf(line[6])
+                            dec_error = cbf(line[8])
+                            parallax_error = cbf(line[10])
+                            parallax_over_error = cbf(line[11])
+                            pmra_error = cbf(line[13])
+                            pmdec_error = cbf(line[15])
+                            ra_dec_corr = cbf(line[16])
+                            ra_parallax_corr = cbf(line[17])
+                            ra_pmra_corr = cbf(line[18])
+                            ra_pmdec_corr = cbf(line[19])
+                            dec_parallax_corr = cbf(line[20])
+                            dec_pmra_corr = cbf(line[21])
+                            dec_pmdec_corr = cbf(line[22])
+                            parallax_pmra_corr = cbf(line[23])
+                            parallax_pmdec_corr = cbf(line[24])
+                            pmra_pmdec_corr = cbf(line[25])
+                            astrometric_n_obs_al = cbi(line[26])
+                            astrometric_n_obs_ac = cbi(line[27])
+                            astrometric_n_good_obs_al = cbi(line[28])
+                            astrometric_n_bad_obs_al = cbi(line[29])
+                            astrometric_gof_al = cbf(line[30])
+                            astrometric_chi2_al = cbf(line[31])
+                            astrometric_excess_noise = cbf(line[32])
+                            astrometric_excess_noise_sig = cbf(line[33])
+                            astrometric_params_solved = cbi(line[34])
+                            astrometric_primary_flag = cbb(line[35])
+                            astrometric_weight_al = cbf(line[36])
+                            astrometric_pseudo_colour = cbf(line[37])
+                            astrometric_pseudo_colour_error = cbf(line[38])
+                            mean_varpi_factor_al = cbf(line[39])
+                            astrometric_matched_observations = cbi(line[40])
+                            visibility_periods_used = cbi(line[41])
+                            astrometric_sigma5d_max = cbf(line[42])
+                            frame_rotator_object_type = cbi(line[43])
+                            matched_observations = cbi(line[44])
+                            duplicated_source = cbb(line[45])
+                            phot_g_n_obs = cbi(line[46])
+                            phot_g_mean_flux = cbf(line[47])
+                            phot_g_mean_flux_error = cbf(line[48])
+                            phot_g_mean_flux_over_error = cbf(line[49])
+                            phot_bp_n_obs = cbi(line[51])
+                            phot_bp_mean_flux = cbf(line[52])
+                            phot_bp_mean_flux_error = cbf(line[53])
+                            phot_bp_mean_flux_over_error = cbf(line[54])
+                            phot_rp_n_obs = cbi(line[56])
+                            phot_rp_mean_flux = cbf(line[57])
+                            phot_rp_mean_flux_error = cbf(line[58])
+                            phot_rp_mean_flux_over_error = cbf(line[59])
+                            phot_bp_rp_excess_factor = cbf(line[61])
+                            phot_proc_mode = str(line[62])
+                            bp_rp = cbf(line[63])
+                            bp_g = cbf(line[64])
+                            g_rp = cbf(line[65])
+                            radial_velocity_error = cbf(line[67])
+                            rv_nb_transits = cbf(line[68])
+                            rv_template_teff = cbf(line[69])
+                            rv_template_logg = cbf(line[70])
+                            rv_template_fe_h = cbf(line[71])
+                            phot_variable_flag = cpvf(line[72])
+                            l = cbf(line[73])
+                            b = cbf(line[74])
+                            ecl_lon = cbf(line[75])
+                            ecl_lat = cbf(line[76])
+                            priam_flags = cbf(line[77])
+                            teff_val = cbf(line[78])
+                            teff_percentile_lower = cbf(line[79])
+                            teff_percentile_upper = cbf(line[80])
+                            a_g_val = cbf(line[81])
+                            a_g_percentile_lower = cbf(line[82])
+                            a_g_percentile_upper = cbf(line[83])
+                            e_bp_min_rp_val = cbf(line[84])
+                            e_bp_min_rp_percentile_lower = cbf(line[85])
+                            e_bp_min_rp_percentile_upper = cbf(line[86])
+                            flame_flags = cbf(line[87])
+                            radius_val = cbf(line[88])
+                            radius_percentile_lower = cbf(line[89])
+                            radius_percentile_upper = cbf(line[90])
+                            lum_val = cbf(line[91])
+                            lum_percentile_lower = cbf(line[92])
+                            lum_percentile_upper = cbf(line[93])
+                            designation = line[1]
+                            #store each line as a tuple
+                            values = (designation, solution_id, source_id, random_index, ra_error, dec_error, parallax_error, parallax_over_error, pmra_error, pmdec_error, ra_dec_corr, ra_parallax_corr, ra_pmra_corr, ra_pmdec_corr, dec_parallax_corr, dec_pmra_corr, dec_pmdec_corr, parallax_pmra_corr, parallax_pmdec_corr, pmra_pmdec_corr, astrometric_n_obs_al, astrometric_n_obs_ac, astrometric_n_good_obs_al, astrometric_n_bad_obs_al, astrometric_gof_al, astrometric_chi2_al, astrometric_excess_noise, astrometric_excess_noise_sig, astrometric_params_solved, astrometric_primary_flag, astrometric_weight_al, astrometric_pseudo_colour, astrometric_pseudo_colour_error, mean_varpi_factor_al, astrometric_matched_observations, visibility_periods_used, astrometric_sigma5d_max, frame_rotator_object_type, matched_observations, duplicated_source, phot_g_n_obs, phot_g_mean_flux, phot_g_mean_flux_error, phot_g_mean_flux_over_error, phot_bp_n_obs, phot_bp_mean_flux, phot_bp_mean_flux_error, phot_bp_mean_flux_over_error, phot_rp_n_obs, phot_rp_mean_flux, phot_rp_mean_flux_error, phot_rp_mean_flux_over_error, phot_bp_rp_excess_factor, phot_proc_mode, bp_rp, bp_g, g_rp, radial_velocity_error, rv_nb_transits, rv_template_teff, rv_template_logg, rv_template_fe_h, phot_variable_flag, l, b, ecl_lon, ecl_lat, priam_flags, teff_val, teff_percentile_lower, teff_percentile_upper, a_g_val, a_g_percentile_lower, a_g_percentile_upper, e_bp_min_rp_val, e_bp_min_rp_percentile_lower, e_bp_min_rp_percentile_upper,flame_flags, radius_val, radius_percentile_lower, radius_percentile_upper, lum_val, lum_percentile_lower, lum_percentile_upper)
+                            #create an array of tuples, each representing a line to be inserted later
+                            gaia_ef_nv.append(values)
+                        else:
+                            designation = line[1]
+                            ref_epoch = cbf(line[4])
+                            ra_deg = cbf(line[5])
+                            dec_deg = cbf(line[7])
+                            ra_rad = degToRad(ra_deg)
+                            dec_rad = degToRad(dec_deg)
+                            #ra and dec strings are filled in for the whole batch by flush
+                            ra, dec = None, None
+                            pmra = cbf(line[12])
+                            pmdec = cbf(line[14])
+                            parallax = cbf(line[9])
+                            radial_velocity = cbf(line[66])
+                            phot_bp_mean_mag = cbf(line[55])
+                            phot_g_mean_mag = cbf(line[50])
+                            phot_rp_mean_mag = cbf(line[60])
+                            values = (designation,ra,dec,ra_deg,dec_deg,ra_rad,dec_rad,ref_epoch,pmra,pmdec,phot_g_mean_mag,phot_bp_mean_mag,phot_rp_mean_mag,radial_velocity, parallax)
+                            if spatial:
+                                values += (healpix.healpixId(ra_deg, dec_deg),)
+                            gaia_nv.append(values)
+                    else: #Gaia visible stars
+                        if ef:
+                            designation = line[1]
+                            solution_id = cbi(line[0])
+                            source_id = cbi(line[2])
+                            random_index = cbi(line[3])
+                            ra_error = cbf(line[6])
+                            dec_error = cbf(line[8])
+                            parallax_error = cbf(line[10])
+                            parallax_over_error = cbf(line[11])
+                            pmra_error = cbf(line[13])
+                            pmdec_error = cbf(line[15])
+                            ra_dec_corr = cbf(line[16])
+                            ra_parallax_corr = cbf(line[17])
+                            ra_pmra_corr = cbf(line[18])
+                            ra_pmdec_corr = cbf(line[19])
+                            dec_parallax_corr = cbf(line[20])
+                            dec_pmra_corr = cbf(line[21])
+                            dec_pmdec_corr = cbf(line[22])
+                            parallax_pmra_corr = cbf(line[23])
+                            parallax_pmdec_corr = cbf(line[24])
+                            pmra_pmdec_corr = cbf(line[25])
+                            astrometric_n_obs_al = cbi(line[26])
+                            astrometric_n_obs_ac = cbi(line[27])
+                            astrometric_n_good_obs_al = cbi(line[28])
+                            astrometric_n_bad_obs_al = cbi(line[29])
+                            astrometric_gof_al = cbf(line[30])
+                            astrometric_chi2_al = cbf(line[31])
+                            astrometric_excess_noise = cbf(line[32])
+                            astrometric_excess_noise_sig = cbf(line[33])
+                            astrometric_params_solved = cbi(line[34])
+                            astrometric_primary_flag = cbb(line[35])
+                            astrometric_weight_al = cbf(line[36])
+                            astrometric_pseudo_colour = cbf(line[37])
+                            astrometric_pseudo_colour_error = cbf(line[38])
+                            mean_varpi_factor_al = cbf(line[39])
+                            astrometric_matched_observations = cbi(line[40])
+                            visibility_periods_used = cbi(line[41])
+                            astrometric_sigma5d_max = cbf(line[42])
+                            frame_rotator_object_type = cbi(line[43])
+                            matched_observations = cbi(line[44])
+                            duplicated_source = cbb(line[45])
+                            phot_g_n_obs = cbi(line[46])
+                            phot_g_mean_flux = cbf(line[47])
+                            phot_g_mean_flux_error = cbf(line[48])
+                            phot_g_mean_flux_over_error = cbf(line[49])
+                            phot_bp_n_obs = cbi(line[51])
+                            phot_bp_mean_flux = cbf(line[52])
+                            phot_bp_mean_flux_error = cbf(line[53])
+                            phot_bp_mean_flux_over_error = cbf(line[54])
+                            phot_rp_n_obs = cbi(line[56])
+                            phot_rp_mean_flux = cbf(line[57])
+                            phot_rp_mean_flux_error = cbf(line[58])
+                            phot_rp_mean_flux_over_error = cbf(line[59])
+                            phot_bp_rp_excess_factor = cbf(line[61])
+                            phot_proc_mode = str(line[62])
+                            bp_rp = cbf(line[63])
+                            bp_g = cbf(line[64])
+                            g_rp = cbf(line[65])
+                            radial_velocity_error = cbf(line[67])
+                            rv_nb_transits = cbf(line[68])
+                            rv_template_teff = cbf(line[69])
+                            rv_template_logg = cbf(line[70])
+                            rv_template_fe_h = cbf(line[71])
+                            phot_variable_flag = cpvf(line[72])
+                            l = cbf(line[73])
+                            b = cbf(line[74])
+                            ecl_lon = cbf(line[75])
+                            ecl_lat = cbf(line[76])
+                            priam_flags = cbf(line[77])
+                            teff_val = cbf(line[78])
+                            teff_percentile_lower = cbf(line[79])
+                            teff_percentile_upper = cbf(line[80])
+                            a_g_val = cbf(line[81])
+                            a_g_percentile_lower = cbf(line[82])
+                            a_g_percentile_upper = cbf(line[83])
+                            e_bp_min_rp_val = cbf(line[84])
+                            e_bp_min_rp_percentile_lower = cbf(line[85])
+                            e_bp_min_rp_percentile_upper = cbf(line[86])
+                            flame_flags = cbf(line[87])
+                            radius_val = cbf(line[88])
+                            radius_percentile_lower = cbf(line[89])
+                            radius_percentile_upper = cbf(line[90])
+                            lum_val = cbf(line[91])
+                            lum_percentile_lower = cbf(line[92])
+                            lum_percentile_upper = cbf(line[93])
+                            values = (designation, solution_id, source_id, random_index, ra_error, dec_error, parallax_error, parallax_over_error, pmra_error, pmdec_error, ra_dec_corr, ra_parallax_corr, ra_pmra_corr, ra_pmdec_corr, dec_parallax_corr, dec_pmra_corr, dec_pmdec_corr, parallax_pmra_corr, parallax_pmdec_corr, pmra_pmdec_corr, astrometric_n_obs_al, astrometric_n_obs_ac, astrometric_n_good_obs_al, astrometric_n_bad_obs_al, astrometric_gof_al, astrometric_chi2_al, astrometric_excess_noise, astrometric_excess_noise_sig, astrometric_params_solved, astrometric_primary_flag, astrometric_weight_al, astrometric_pseudo_colour, astrometric_pseudo_colour_error, mean_varpi_factor_al, astrometric_matched_observations, visibility_periods_used, astrometric_sigma5d_max, frame_rotator_object_type, matched_observations, duplicated_source, phot_g_n_obs, phot_g_mean_flux, phot_g_mean_flux_error, phot_g_mean_flux_over_error, phot_bp_n_obs, phot_bp_mean_flux, phot_bp_mean_flux_error, phot_bp_mean_flux_over_error, phot_rp_n_obs, phot_rp_mean_flux, phot_rp_mean_flux_error, phot_rp_mean_flux_over_error, phot_bp_rp_excess_factor, phot_proc_mode, bp_rp, bp_g, g_rp, radial_velocity_error, rv_nb_transits, rv_template_teff, rv_template_logg, rv_template_fe_h, phot_variable_flag, l, b, ecl_lon, ecl_lat, priam_flags, teff_val, teff_percentile_lower, teff_percentile_upper, a_g_val, a_g_percentile_lower, a_g_percentile_upper, e_bp_min_rp_val, e_bp_min_rp_percentile_lower, e_bp_min_rp_percentile_upper,flame_flags, radius_val, radius_percentile_lower, radius_percentile_upper,lum_val, lum_percentile_lower, lum_percentile_upper)
+                            gaia_ef.append(values)
+                        else: #We are creating the normal gaia table
+                            designation = line[1]
+                            ref_epoch = cbf(line[4])
+                            ra_deg = cbf(line[5])
+                            dec_deg = cbf(line[7])
+                            ra_rad = degToRad(ra_deg)
+                            dec_rad = degToRad(dec_deg)
+                            #ra and dec strings are filled in for the whole batch by flush
+                            ra, dec = None, None
+                            pmra = cbf(line[12])
+                            pmdec = cbf(line[14])
+                            parallax = cbf(line[9])
+                            radial_velocity = cbf(line[66])
+                            phot_bp_mean_mag = cbf(line[55])
+                            phot_g_mean_mag = cbf(line[50])
+                            phot_rp_mean_mag = cbf(line[60])
+                            values = (designation,ra,dec,ra_deg,dec_deg,ra_rad,dec_rad,ref_epoch,pmra,pmdec,phot_g_mean_mag,phot_bp_mean_mag,phot_rp_mean_mag,radial_velocity, parallax)
+                            if spatial:
+                                values += (healpix.healpixId(ra_deg, dec_deg),)
+                            gaia.append(values)
+                        count+=1 #We have successfully added a star
+            except Exception as e:
+                stats.count('rejects')
+    density.addRows("gaia", gaia, 3, 4)
+    density.addRows("gaia", gaia_nv, 3, 4)
+    return gaia, gaia_nv, gaia_ef, gaia_ef_nv, count
+
+# Gaia csv columns the columnar parser reads as exact integers, as integers truncated from floats (cbi),
+# as present or blank flags (cbb) and as strings
+ID_COLUMNS = [0, 2]
+INT_COLUMNS = [3, 26, 27, 28, 29, 34, 40, 41, 43, 44, 46, 51, 56]
+FLAG_COLUMNS = [35, 45]
+STR_COLUMNS = [1, 62, 72]
+# csv positions of the gaia table values (RA and Decl strings are filled in by flush) and of the errors flags values
+GAIA_POSITIONS = [1, 5, 7, 4, 12, 14, 50, 55, 60, 66, 9]
+EF_POSITIONS = [1, 0, 2, 3, 6, 8, 10, 11, 13, 15] + list(range(16, 50)) + list(range(51, 55)) + list(range(56, 60)) + list(range(61, 66)) + list(range(67, 94))
+
+def readColumns(f, positions):
+    """
+    Reads a Gaia csv file into typed columns with pyarrow. Only blank fields are null, as in cbf.
+    Args:
+        f (file): File opened in binary mode.
+        positions (List): csv positions of the columns to read.
+    Returns:
+        pyarrow.Table: One column per position, named c<position>.
+    """
+    names = [f"c{position}" for position in range(94)]
+    types = {}
+    for position in positions:
+        if position in ID_COLUMNS:
+            types[names[position]] = pa.int64()
+        elif position in FLAG_COLUMNS or position in STR_COLUMNS:
+            types[names[position]] = pa.string()
+        else:
+            types[names[position]] = pa.float64()
+    return pacsv.read_csv(f, read_options = pacsv.ReadOptions(column_names = names, skip_rows = 1),
+                          convert_options = pacsv.ConvertOptions(include_columns = [names[position] for position in positions],
+                                                                 column_types = types, null_values = [''], strings_can_be_null = False))
+
+def columnValues(table, position):
+    """
+    Converts one column of a table from readColumns to a list of python values, with the same values
+    cbf, cbi, cbb and cpvf give.
+    Args:
+        table (pyarrow.Table): Table from readColumns.
+        position (int): csv position of the column.
+    Returns:
+        List: The column's values.
+    """
+    column = table.column(f"c{position}")
+    if position in INT_COLUMNS:
+        return pc.cast(pc.trunc(column), pa.int64()).to_pylist()
+    if position in FLAG_COLUMNS:
+        #cbb: any text is True
+        return [True if value else None for value in column.to_pylist()]
+    if position == 72:
+        return [None if value == "NOT_AVAILABLE" else value for value in column.to_pylist()]
+    return column.to_pylist()
+
+def parseFileColumnar(filename, ef = False, spatial = False, unzipped = True):
+    """
+    Columnar version of parseFile: reads the file as typed columns with pyarrow, splits the stars at
+    Decl_deg -70 with a mask and builds the rows from whole columns. A file pyarrow cannot parse (ex: a
+    malformed number) is parsed line by line with parseFile instead, which rejects only the bad lines.
+    Args:
+        filename (str): Path of the file.
+        ef (bool): Parse the errors flags columns instead of the gaia columns.
+        spatial (bool): Append the HPX pixel id to each gaia row.
+        unzipped (bool): The file is a plain .csv rather than .csv.gz.
+    Returns:
+        Tuple: (List, List, List, List, int) - gaia, gaia_not_visible, gaia_errors_flags, gaia_errors_flags_not_visible rows, stars
+    """
+    stats = instrument.current()
+    positions = sorted(set(EF_POSITIONS + [7])) if ef else sorted(GAIA_POSITIONS)
+    try:
+        with stats.stage('open'):
+            f = openFile(filename, unzipped, text = False)
+        with f, stats.stage('parse'):
+            table = readColumns(f, positions)
+    except pa.ArrowInvalid:
+        return parseFile(filename, ef, spatial, unzipped)
+    #parseFile rejects the stars it cannot place (and, for the gaia table, convert)
+    dec_deg = table.column("c7").to_numpy(zero_copy_only = False)
+    valid = ~np.isnan(dec_deg)
+    if not ef:
+        valid &= ~np.isnan(table.column("c5").to_numpy(zero_copy_only = False))
+    stats.count('rejects', int((~valid).sum()))
+    tables = []
+    for mask in (valid & (dec_deg >= -70.), valid & (dec_deg < -70.)):
+        rows = table.filter(pa.array(mask))
+        if ef:
+            tables.append(list(zip(*[columnValues(rows, position) for position in EF_POSITIONS])))
+            continue
+        ra = rows.column("c5").to_numpy()
+        dec = rows.column("c7").to_numpy()
+        blank = [None] * len(rows)
+        columns = [columnValues(rows, 1), blank, blank, ra.tolist(), dec.tolist(), np.radians(ra).tolist(), np.radians(dec).tolist()]
+        columns += [columnValues(rows, position) for position in (4, 12, 14, 50, 55, 60, 66, 9)]
+        if spatial:
+            columns.append(healpix.healpixIds(ra, dec).tolist())
+        density.add("gaia", ra, dec)
+        tables.append(list(zip(*columns)))
+    visible, notVisible = tables
+    if ef:
+        return [], [], visible, notVisible, len(visible)
+    return visible, notVisible, [], [], len(visible)
+
+def parseWorker(task):
+    """
+    Reader process step: parses one file and reports its metrics record.
+    Args:
+        task (Tuple): (path, name used in the metrics record, ef, spatial, unzipped, columnar)
+    Returns:
+        Tuple: (Tuple, Dict) - parseFile's result, the file's density counts (density.take())
+    """
+    path, name, ef, spatial, unzipped, columnar = task
+    stats = instrument.start("gaia", name)
+    stars = 0
+    try:
+        parsed = (parseFileColumnar if columnar else parseFile)(path, ef, spatial, unzipped)
+        stars = parsed[4]
+    finally:
+        #a file that fails to parse still gets its record, with parsed = 0
+        stats.finish(parsed = stars)
+    return parsed, density.take()
+
+def collectParsed(result):
+    """
+    Waits for a reader process's file and adds its density counts to this process's grid.
+    Args:
+        result (multiprocessing.pool.AsyncResult): Result of parseWorker.
+    Returns:
+        Tuple: parseFile's result.
+    """
+    parsed, bins = result.get()
+    density.merge(bins)
+    return parsed
+
+def readFiles(tasks, readerPool = None, window = 2):
+    """
+    Parses files in order, in the reader processes when a pool is given. At most window files are being
+    parsed or waiting to be collected at once, so the readers cannot run far ahead of the writer.
+    Args:
+        tasks (List): parseWorker tasks.
+        readerPool (multiprocessing.Pool): Reader processes (default = parse in this process when each result is collected).
+        window (int): Maximum number of files in flight.
+    Returns:
+        Iterator: One function per task that returns its parseFile result (or raises its error).
+    """
+    if readerPool is None:
+        for path, name, ef, spatial, unzipped, columnar in tasks:
+            yield functools.partial(parseFileColumnar if columnar else parseFile, path, ef, spatial, unzipped)
+        return
+    tasks = iter(tasks)
+    pending = collections.deque(readerPool.apply_async(parseWorker, (task,)) for task in itertools.islice(tasks, window))
+    while pending:
+        result = pending.popleft()
+        for task in itertools.islice(tasks, 1):
+            pending.append(readerPool.apply_async(parseWorker, (task,)))
+        yield functools.partial(collectParsed, result)
+
+def createLedger(databaseName = "GAIA_dev", ledgerName = "gaia_ingest_ledger"):
+    """
+    Creates the ledger table that records each source file once its stars are committed. The gaia and errors flags
+    tables are loaded in separate runs (-ef), so a file is recorded once for each.
+    Args:
+        databaseName (str): Name of the database.
+        ledgerName (str): Name of the ledger table.
+    Returns:
+        None
+    """
+    conn = connectToDatabase(db_name = databaseName)
+    cur = conn.cursor()
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS {ledgerName} (\
+                directory VARCHAR(64),\
+                filename VARCHAR(255),\
+                stars INT,\
+                loaded_at DATETIME,\
+                errors_flags BOOLEAN NOT NULL DEFAULT FALSE,\
+                PRIMARY KEY (directory, filename, errors_flags)\
+                );\
+            """)
+    #ledgers created before the errors_flags column keyed a file by its name only; their files were gaia loads
+    cur.execute(f"SHOW COLUMNS FROM {ledgerName} LIKE 'errors_flags';")
+    if cur.fetchone() is None:
+        cur.execute(f"ALTER TABLE {ledgerName} ADD errors_flags BOOLEAN NOT NULL DEFAULT FALSE, DROP PRIMARY KEY, ADD PRIMARY KEY (directory, filename, errors_flags);")
+    conn.commit()
+    conn.close()
+
+def completedFiles(cur, directory, ef = False, ledgerName = "gaia_ingest_ledger"):
+    """
+    Returns the files of a directory that the ledger marks as committed.
+    Args:
+        cur (pymysql.cursors.Cursor): Database cursor.
+        directory (str): Directory name, ex: file-aa-dir.
+        ef (bool): Files committed to the errors flags tables instead of the gaia tables.
+        ledgerName (str): Name of the ledger table.
+    Returns:
+        Set: Committed file names.
+    """
+    cur.execute(f"SELECT filename FROM {ledgerName} WHERE directory = %s AND errors_flags = %s;", (directory, ef))
+    return set(row[0] for row in cur.fetchall())
+
+def recordFiles(cur, directory, files, ef = False, ledgerName = "gaia_ingest_ledger"):
+    """
+    Marks files as committed in the ledger.
+    Args:
+        cur (pymysql.cursors.Cursor): Database cursor.
+        directory (str): Directory name, ex: file-aa-dir.
+        files (List): List of (filename, stars) tuples.
+        ef (bool): The files were committed to the errors flags tables instead of the gaia tables.
+        ledgerName (str): Name of the ledger table.
+    Returns:
+        None
+    """
+    loadedAt = datetime.datetime.now()
+    cur.executemany(f"REPLACE INTO {ledgerName} (directory, filename, stars, loaded_at, errors_flags) VALUES (%s, %s, %s, %s, %s);",
+                    [(directory, filename, stars, loadedAt, ef) for filename, stars in files])
+
 def viewTable(databaseName = "GAIA_dev", tableName = "gaia"):
     """
     Queries the database for the specified table.
@@ -272,7 +779,7 @@ def viewTable(databaseName = "GAIA_dev", tableName = "gaia"):
     except:
         print("Cannot View: That table doesn't exist")
           
-def insertTable(databaseName = "GAIA_dev", tableNames = [], directories = "file-aa-dir", verbose = False, ef = False, unzipped = True): 
+def insertTable(databaseName = "GAIA_dev", tableNames = [], directories = "file-aa-dir", verbose = False, ef = False, unzipped = True, bulk = False, spatial = False, resume = False, batchRows = 100000, fastLoad = False, readers = 1, columnar = False): 
     """
     description:
         Inserts data into four tables based on the provided catalog files in the specified directory.
@@ -282,16 +789,25 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directories = "file-
         directName (str): Name of the directory containing CSV files (default is "file-aa-dir").
         verbose (bool): Print error messages
         ef (bool): insert into the errors flags table
+        unzipped (bool): read plain .csv files instead of .csv.gz
+        bulk (bool): load each directory with LOAD DATA LOCAL INFILE instead of executemany
+        spatial (bool): also insert the HPX pixel id of each star
+        resume (bool): skip the files (and whole directories) that the ledger marks as committed
+        batchRows (int): rows a table list may hold before it is handed to the writer thread
+        fastLoad (bool): insert over connections with relaxed session checks (tables created with deferKeys)
+        readers (int): processes that decompress and parse the files of a directory concurrently
+        columnar (bool): parse each file as typed columns with pyarrow (parseFileColumnar) instead of line by line
     returns:
         None
     """
+    hpxColumn, hpxValue = (", HPX", ", %s") if spatial else ("", "")
     sql_gaia = f"""INSERT IGNORE INTO gaia (\
-        GAIA_ID, RA, Decl, Ra_deg, Decl_deg, Ra_rad, Decl_rad, Epoch, pmra, pmdec, gmag, bpmag, rpmag, radial_velocity, parallax) \
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);\
+        GAIA_ID, RA, Decl, Ra_deg, Decl_deg, Ra_rad, Decl_rad, Epoch, pmra, pmdec, gmag, bpmag, rpmag, radial_velocity, parallax{hpxColumn}) \
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s{hpxValue});\
         """
     sql_gaia_nv = f"""INSERT IGNORE INTO gaia_not_visible (\
-        GAIA_ID, RA, Decl, Ra_deg, Decl_deg, Ra_rad, Decl_rad, Epoch, pmra, pmdec, gmag, bpmag, rpmag, radial_velocity, parallax) \
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);\
+        GAIA_ID, RA, Decl, Ra_deg, Decl_deg, Ra_rad, Decl_rad, Epoch, pmra, pmdec, gmag, bpmag, rpmag, radial_velocity, parallax{hpxColumn}) \
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s{hpxValue});\
         """
     sql_gaia_ef = f"""INSERT IGNORE INTO gaia_errors_flags (\
         GAIA_ID, solution_id, source_id, random_index, ra_error, dec_error, parallax_error, parallax_over_error,\
@@ -333,335 +849,183 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directories = "file-
         e_bp_min_rp_percentile_lower, e_bp_min_rp_percentile_upper, flame_flags, radius_val,\
         radius_percentile_lower, radius_percentile_upper, lum_val, lum_percentile_lower, lum_percentile_upper) VALUES (%s, %s, %s,%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s); \
         """
+    columns_gaia = ['GAIA_ID', 'RA', 'Decl', 'Ra_deg', 'Decl_deg', 'Ra_rad', 'Decl_rad', 'Epoch', 'pmra', 'pmdec', 'gmag', 'bpmag', 'rpmag', 'radial_velocity', 'parallax']
+    if spatial:
+        columns_gaia.append('HPX')
+    columns_gaia_ef = ['GAIA_ID', 'solution_id', 'source_id', 'random_index', 'ra_error', 'dec_error', 'parallax_error',
+        'parallax_over_error', 'pmra_error', 'pmdec_error', 'ra_dec_corr', 'ra_parallax_corr', 'ra_pmra_corr',
+        'ra_pmdec_corr', 'dec_parallax_corr', 'dec_pmra_corr', 'dec_pmdec_corr', 'parallax_pmra_corr',
+        'parallax_pmdec_corr', 'pmra_pmdec_corr', 'astrometric_n_obs_al', 'astrometric_n_obs_ac',
+        'astrometric_n_good_obs_al', 'astrometric_n_bad_obs_al', 'astrometric_gof_al', 'astrometric_chi2_al',
+        'astrometric_excess_noise', 'astrometric_excess_noise_sig', 'astrometric_params_solved',
+        'astrometric_primary_flag', 'astrometric_weight_al', 'astrometric_pseudo_colour',
+        'astrometric_pseudo_colour_error', 'mean_varpi_factor_al', 'astrometric_matched_observations',
+        'visibility_periods_used', 'astrometric_sigma5d_max', 'frame_rotator_object_type', 'matched_observations',
+        'duplicated_source', 'phot_g_n_obs', 'phot_g_mean_flux', 'phot_g_mean_flux_error',
+        'phot_g_mean_flux_over_error', 'phot_bp_n_obs', 'phot_bp_mean_flux', 'phot_bp_mean_flux_error',
+        'phot_bp_mean_flux_over_error', 'phot_rp_n_obs', 'phot_rp_mean_flux', 'phot_rp_mean_flux_error',
+        'phot_rp_mean_flux_over_error', 'phot_bp_rp_excess_factor', 'phot_proc_mode', 'bp_rp', 'bp_g', 'g_rp',
+        'radial_velocity_error', 'rv_nb_transits', 'rv_template_teff', 'rv_template_logg', 'rv_template_fe_h',
+        'phot_variable_flag', 'l', 'b', 'ecl_lon', 'ecl_lat', 'priam_flags', 'teff_val', 'teff_percentile_lower',
+        'teff_percentile_upper', 'a_g_val', 'a_g_percentile_lower', 'a_g_percentile_upper', 'e_bp_min_rp_val',
+        'e_bp_min_rp_percentile_lower', 'e_bp_min_rp_percentile_upper', 'flame_flags', 'radius_val',
+        'radius_percentile_lower', 'radius_percentile_upper', 'lum_val', 'lum_percentile_lower',
+        'lum_percentile_upper']
     #---------------------------------------------------------------------------------------------------------------#
     #---------------------------------------------------------------------------------------------------------------#
     #---------------------------------------------------------------------------------------------------------------#
     #---------------------------------------------------------------------------------------------------------------#
     
-    for directName in tqdm(directories):
-        gaia, gaia_nv, gaia_ef, gaia_ef_nv = [], [], [], []
-        countdup,count,counterror=0,0,0
+    #the reader processes are forked before the writer thread and any connection exist
+    readerPool = multiprocessing.Pool(processes = readers) if readers > 1 else None
+    createLedger(databaseName)
+    #The writer thread and the resume lookups borrow health checked connections from a shared pool
+    pool = connpool.getPool(connectToDatabase, setup = fastload.relaxSession if fastLoad else None, db_name = databaseName, local_infile = bulk)
+
+    # Insert one of the data arrays
+    def insert_batch_data(conn, cur, sql_query, data, dbName=None, tableName=None, columns=None):
+        """
+        Inserts one table's batch and returns whether it committed.
+        """
+        time1 = datetime.datetime.now()
+        stats = instrument.current()
         try:
-            directory = os.getcwd()
-            os.chdir(f"{directName}")
-            if(verbose):
-                print(f"Current Directory: {os.getcwd()}")
-            for filename in tqdm(os.listdir(os.getcwd())):
-                try:
-                    #Use this for the unzipped files
-                    if unzipped:
-                        f = open(filename, 'r')
-                        reader = csv.reader(f)
-                     #Use this for the zipped files
-                    else: 
-                        f = gzip.open(filename, 'rt')
-                        reader = csv.reader(f)
-                    for line in reader:
-                        try:
-                            check = line[2]
-                            if check == 'source_id':
-                                pass #this is the first line of each file with the headers
-                            else:
-                                dec_deg = cbf(line[7])
-                                if dec_deg < -70.:
-                                    if ef:
-                                        solution_id = cbi(line[0])
-                                        source_id = cbi(line[2])
-                                        random_index = cbi(line[3])
-                                        ra_error = cbf(line[6])
-                                        dec_error = cbf(line[8])
-                                        parallax_error = cbf(line[10])
-                                        parallax_over_error = cbf(line[11])
-                                        pmra_error = cbf(line[13])
-                                        pmdec_error = cbf(line[15])
-                                        ra_dec_corr = cbf(line[16])
-                                        ra_parallax_corr = cbf(line[17])
-                                        ra_pmra_corr = cbf(line[18])
-                                        ra_pmdec_corr = cbf(line[19])
-                                        dec_parallax_corr = cbf(line[20])
-                                        dec_pmra_corr = cbf(line[21])
-                                        dec_pmdec_corr = cbf(line[22])
-                                        parallax_pmra_corr = cbf(line[23])
-                                        parallax_pmdec_corr = cbf(line[24])
-                                        pmra_pmdec_corr = cbf(line[25])
-                                        astrometric_n_obs_al = cbi(line[26])
-                                        astrometric_n_obs_ac = cbi(line[27])
-                                        astrometric_n_good_obs_al = cbi(line[28])
-                                        astrometric_n_bad_obs_al = cbi(line[29])
-                                        astrometric_gof_al = cbf(line[30])
-                                        astrometric_chi2_al = cbf(line[31])
-                                        astrometric_excess_noise = cbf(line[32])
-                                        astrometric_excess_noise_sig = cbf(line[33])
-                                        astrometric_params_solved = cbi(line[34])
-                                        astrometric_primary_flag = cbb(line[35])
-                                        astrometric_weight_al = cbf(line[36])
-                                        astrometric_pseudo_colour = cbf(line[37])
-                                        astrometric_pseudo_colour_error = cbf(line[38])
-                                        mean_varpi_factor_al = cbf(line[39])
-                                        astrometric_matched_observations = cbi(line[40])
-                                        visibility_periods_used = cbi(line[41])
-                                        astrometric_sigma5d_max = cbf(line[42])
-                                        frame_rotator_object_type = cbi(line[43])
-                                        matched_observations = cbi(line[44])
-                                        duplicated_source = cbb(line[45])
-                                        phot_g_n_obs = cbi(line[46])
-                                        phot_g_mean_flux = cbf(line[47])
-                                        phot_g_mean_flux_error = cbf(line[48])
-                                        phot_g_mean_flux_over_error = cbf(line[49])
-                                        phot_bp_n_obs = cbi(line[51])
-                                        phot_bp_mean_flux = cbf(line[52])
-                                        phot_bp_mean_flux_error = cbf(line[53])
-                                        phot_bp_mean_flux_over_error = cbf(line[54])
-                                        phot_rp_n_obs = cbi(line[56])
-                                        phot_rp_mean_flux = cbf(line[57])
-                                        phot_rp_mean_flux_error = cbf(line[58])
-                                        phot_rp_mean_flux_over_error = cbf(line[59])
-                                        phot_bp_rp_excess_factor = cbf(line[61])
-                                        phot_proc_mode = str(line[62])
-                                        bp_rp = cbf(line[63])
-                                        bp_g = cbf(line[64])
-                                        g_rp = cbf(line[65])
-                                        radial_velocity_error = cbf(line[67])
-                                        rv_nb_transits = cbf(line[68])
-                                        rv_template_teff = cbf(line[69])
-                                        rv_template_logg = cbf(line[70])
-                                        rv_template_fe_h = cbf(line[71])
-                                        phot_variable_flag = cpvf(line[72])
-                                        l = cbf(line[73])
-                                        b = cbf(line[74])
-                                        ecl_lon = cbf(line[75])
-                                        ecl_lat = cbf(line[76])
-                                        priam_flags = cbf(line[77])
-                                        teff_val = cbf(line[78])
-                                        teff_percentile_lower = cbf(line[79])
-                                        teff_percentile_upper = cbf(line[80])
-                                        a_g_val = cbf(line[81])
-                                        a_g_percentile_lower = cbf(line[82])
-                                        a_g_percentile_upper = cbf(line[83])
-                                        e_bp_min_rp_val = cbf(line[84])
-                                        e_bp_min_rp_percentile_lower = cbf(line[85])
-                                        e_bp_min_rp_percentile_upper = cbf(line[86])
-                                        flame_flags = cbf(line[87])
-                                        radius_val = cbf(line[88])
-                                        radius_percentile_lower = cbf(line[89])
-                                        radius_percentile_upper = cbf(line[90])
-                                        lum_val = cbf(line[91])
-                                        lum_percentile_lower = cbf(line[92])
-                                        lum_percentile_upper = cbf(line[93])
-                                        designation = line[1]
-                                        #store each line as a tuple
-                                        values = (designation, solution_id, source_id, random_index, ra_error, dec_error, parallax_error, parallax_over_error, pmra_error, pmdec_error, ra_dec_corr, ra_parallax_corr, ra_pmra_corr, ra_pmdec_corr, dec_parallax_corr, dec_pmra_corr, dec_pmdec_corr, parallax_pmra_corr, parallax_pmdec_corr, pmra_pmdec_corr, astrometric_n_obs_al, astrometric_n_obs_ac, astrometric_n_good_obs_al, astrometric_n_bad_obs_al, astrometric_gof_al, astrometric_chi2_al, astrometric_excess_noise, astrometric_excess_noise_sig, astrometric_params_solved, astrometric_primary_flag, astrometric_weight_al, astrometric_pseudo_colour, astrometric_pseudo_colour_error, mean_varpi_factor_al, astrometric_matched_observations, visibility_periods_used, astrometric_sigma5d_max, frame_rotator_object_type, matched_observations, duplicated_source, phot_g_n_obs, phot_g_mean_flux, phot_g_mean_flux_error, phot_g_mean_flux_over_error, phot_bp_n_obs, phot_bp_mean_flux, phot_bp_mean_flux_error, phot_bp_mean_flux_over_error, phot_rp_n_obs, phot_rp_mean_flux, phot_rp_mean_flux_error, phot_rp_mean_flux_over_error, phot_bp_rp_excess_factor, phot_proc_mode, bp_rp, bp_g, g_rp, radial_velocity_error, rv_nb_transits, rv_template_teff, rv_template_logg, rv_template_fe_h, phot_variable_flag, l, b, ecl_lon, ecl_lat, priam_flags, teff_val, teff_percentile_lower, teff_percentile_upper, a_g_val, a_g_percentile_lower, a_g_percentile_upper, e_bp_min_rp_val, e_bp_min_rp_percentile_lower, e_bp_min_rp_percentile_upper,flame_flags, radius_val, radius_percentile_lower, radius_percentile_upper, lum_val, lum_percentile_lower, lum_percentile_upper)
-                                        #create an array of tuples, each representing a line to be inserted later
-                                        gaia_ef_nv.append(values)
-                                    else:
-                                        designation = line[1]
-                                        ref_epoch = cbf(line[4])
-                                        ra_deg = cbf(line[5])
-                                        dec_deg = cbf(line[7])
-                                        ra_rad = degToRad(ra_deg)
-                                        dec_rad = degToRad(dec_deg)
-                                        ra = deg2SexagHrs(ra_deg)
-                                        dec = deg2Sexag(dec_deg)
-                                        pmra = cbf(line[12])
-                                        pmdec = cbf(line[14])
-                                        parallax = cbf(line[9])
-                                        radial_velocity = cbf(line[66])
-                                        phot_bp_mean_mag = cbf(line[55])
-                                        phot_g_mean_mag = cbf(line[50])
-                                        phot_rp_mean_mag = cbf(line[60])
-                                        values = (designation,ra,dec,ra_deg,dec_deg,ra_rad,dec_rad,ref_epoch,pmra,pmdec,phot_g_mean_mag,phot_bp_mean_mag,phot_rp_mean_mag,radial_velocity, parallax)
-                                        gaia_nv.append(values)
-                                else: #Gaia visible stars
-                                    if ef:
-                                        solution_id = cbi(line[0])
-                                        source_id = cbi(line[2])
-                                        random_index = cbi(line[3])
-                                        ra_error = cbf(line[6])
-                                        dec_error = cbf(line[8])
-                                        parallax_error = cbf(line[10])
-                                        parallax_over_error = cbf(line[11])
-                                        pmra_error = cbf(line[13])
-                                        pmdec_error = cbf(line[15])
-                                        ra_dec_corr = cbf(line[16])
-                                        ra_parallax_corr = cbf(line[17])
-                                        ra_pmra_corr = cbf(line[18])
-                                        ra_pmdec_corr = cbf(line[19])
-                                        dec_parallax_corr = cbf(line[20])
-                                        dec_pmra_corr = cbf(line[21])
-                                        dec_pmdec_corr = cbf(line[22])
-                                        parallax_pmra_corr = cbf(line[23])
-                                        parallax_pmdec_corr = cbf(line[24])
-                                        pmra_pmdec_corr = cbf(line[25])
-                                        astrometric_n_obs_al = cbi(line[26])
-                                        astrometric_n_obs_ac = cbi(line[27])
-                                        astrometric_n_good_obs_al = cbi(line[28])
-                                        astrometric_n_bad_obs_al = cbi(line[29])
-                                        astrometric_gof_al = cbf(line[30])
-                                        astrometric_chi2_al = cbf(line[31])
-                                        astrometric_excess_noise = cbf(line[32])
-                                        astrometric_excess_noise_sig = cbf(line[33])
-                                        astrometric_params_solved = cbi(line[34])
-                                        astrometric_primary_flag = cbb(line[35])
-                                        astrometric_weight_al = cbf(line[36])
-                                        astrometric_pseudo_colour = cbf(line[37])
-                                        astrometric_pseudo_colour_error = cbf(line[38])
-                                        mean_varpi_factor_al = cbf(line[39])
-                                        astrometric_matched_observations = cbi(line[40])
-                                        visibility_periods_used = cbi(line[41])
-                                        astrometric_sigma5d_max = cbf(line[42])
-                                        frame_rotator_object_type = cbi(line[43])
-                                        matched_observations = cbi(line[44])
-                                        duplicated_source = cbb(line[45])
-                                        phot_g_n_obs = cbi(line[46])
-                                        phot_g_mean_flux = cbf(line[47])
-                                        phot_g_mean_flux_error = cbf(line[48])
-                                        phot_g_mean_flux_over_error = cbf(line[49])
-                                        phot_bp_n_obs = cbi(line[51])
-                                        phot_bp_mean_flux = cbf(line[52])
-                                        phot_bp_mean_flux_error = cbf(line[53])
-                                        phot_bp_mean_flux_over_error = cbf(line[54])
-                                        phot_rp_n_obs = cbi(line[56])
-                                        phot_rp_mean_flux = cbf(line[57])
-                                        phot_rp_mean_flux_error = cbf(line[58])
-                                        phot_rp_mean_flux_over_error = cbf(line[59])
-                                        phot_bp_rp_excess_factor = cbf(line[61])
-                                        phot_proc_mode = str(line[62])
-                                        bp_rp = cbf(line[63])
-                                        bp_g = cbf(line[64])
-                                        g_rp = cbf(line[65])
-                                        radial_velocity_error = cbf(line[67])
-                                        rv_nb_transits = cbf(line[68])
-                                        rv_template_teff = cbf(line[69])
-                                        rv_template_logg = cbf(line[70])
-                                        rv_template_fe_h = cbf(line[71])
-                                        phot_variable_flag = cpvf(line[72])
-                                        l = cbf(line[73])
-                                        b = cbf(line[74])
-                                        ecl_lon = cbf(line[75])
-                                        ecl_lat = cbf(line[76])
-                                        priam_flags = cbf(line[77])
-                                        teff_val = cbf(line[78])
-                                        teff_percentile_lower = cbf(line[79])
-                                        teff_percentile_upper = cbf(line[80])
-                                        a_g_val = cbf(line[81])
-                                        a_g_percentile_lower = cbf(line[82])
-                                        a_g_percentile_upper = cbf(line[83])
-                                        e_bp_min_rp_val = cbf(line[84])
-                                        e_bp_min_rp_percentile_lower = cbf(line[85])
-                                        e_bp_min_rp_percentile_upper = cbf(line[86])
-                                        flame_flags = cbf(line[87])
-                                        radius_val = cbf(line[88])
-                                        radius_percentile_lower = cbf(line[89])
-                                        radius_percentile_upper = cbf(line[90])
-                                        lum_val = cbf(line[91])
-                                        lum_percentile_lower = cbf(line[92])
-                                        lum_percentile_upper = cbf(line[93])
-                                        values = (designation, solution_id, source_id, random_index, ra_error, dec_error, parallax_error, parallax_over_error, pmra_error, pmdec_error, ra_dec_corr, ra_parallax_corr, ra_pmra_corr, ra_pmdec_corr, dec_parallax_corr, dec_pmra_corr, dec_pmdec_corr, parallax_pmra_corr, parallax_pmdec_corr, pmra_pmdec_corr, astrometric_n_obs_al, astrometric_n_obs_ac, astrometric_n_good_obs_al, astrometric_n_bad_obs_al, astrometric_gof_al, astrometric_chi2_al, astrometric_excess_noise, astrometric_excess_noise_sig, astrometric_params_solved, astrometric_primary_flag, astrometric_weight_al, astrometric_pseudo_colour, astrometric_pseudo_colour_error, mean_varpi_factor_al, astrometric_matched_observations, visibility_periods_used, astrometric_sigma5d_max, frame_rotator_object_type, matched_observations, duplicated_source, phot_g_n_obs, phot_g_mean_flux, phot_g_mean_flux_error, phot_g_mean_flux_over_error, phot_bp_n_obs, phot_bp_mean_flux, phot_bp_mean_flux_error, phot_bp_mean_flux_over_error, phot_rp_n_obs, phot_rp_mean_flux, phot_rp_mean_flux_error, phot_rp_mean_flux_over_error, phot_bp_rp_excess_factor, phot_proc_mode, bp_rp, bp_g, g_rp, radial_velocity_error, rv_nb_transits, rv_template_teff, rv_template_logg, rv_template_fe_h, phot_variable_flag, l, b, ecl_lon, ecl_lat, priam_flags, teff_val, teff_percentile_lower, teff_percentile_upper, a_g_val, a_g_percentile_lower, a_g_percentile_upper, e_bp_min_rp_val, e_bp_min_rp_percentile_lower, e_bp_min_rp_percentile_upper,flame_flags, radius_val, radius_percentile_lower, radius_percentile_upper,lum_val, lum_percentile_lower, lum_percentile_upper)
-                                        gaia_ef.append(values)
-                                    else: #We are creating the normal gaia table
-                                        designation = line[1]
-                                        ref_epoch = cbf(line[4])
-                                        ra_deg = cbf(line[5])
-                                        dec_deg = cbf(line[7])
-                                        ra_rad = degToRad(ra_deg)
-                                        dec_rad = degToRad(dec_deg)
-                                        ra = deg2SexagHrs(ra_deg)
-                                        dec = deg2Sexag(dec_deg)
-                                        pmra = cbf(line[12])
-                                        pmdec = cbf(line[14])
-                                        parallax = cbf(line[9])
-                                        radial_velocity = cbf(line[66])
-                                        phot_bp_mean_mag = cbf(line[55])
-                                        phot_g_mean_mag = cbf(line[50])
-                                        phot_rp_mean_mag = cbf(line[60])
-                                        values = (designation,ra,dec,ra_deg,dec_deg,ra_rad,dec_rad,ref_epoch,pmra,pmdec,phot_g_mean_mag,phot_bp_mean_mag,phot_rp_mean_mag,radial_velocity, parallax)
-                                        gaia.append(values)
-                                    count+=1 #We have successfully added a star
-                        except Exception as e:
-                            pass        
-                    f.close()
-                except Exception as e:
-                    if(verbose):
-                        print(f"File Error: {e}")
-            os.chdir(directory)
-        except Exception as e: 
-            print(f"Directory Error: {e}")
-        #------------------------------------------------------------------#
-        #--After each directory (ex: File-aa-dir) insert all of the stars--#
-        #------------------------------------------------------------------#
-        conn = connectToDatabase(db_name = databaseName)
-        cur = conn.cursor()
+            if bulk:
+                inserted, _ = bulkload.bulkInsert(cur, tableName, columns, data)
+            else:
+                #INSERT IGNORE counts only the rows it inserted
+                inserted = cur.executemany(sql_query, data)
+            with stats.stage('db'):
+                conn.commit()
+            stats.count('rows', inserted)
+            stats.count('duplicates', len(data) - inserted)
+            duration = datetime.datetime.now() - time1
+            if verbose:
+                print(f"{dbName}: {len(data)} rows {duration}")
+            return True
+        except Exception as e:
+            print(e)
+            return False
 
-        # Insert all of the data from each of the 4 data arrays
-        def insert_batch_data(sql_query, data, dbName=None):
-            time1 = datetime.datetime.now()
+    def writer():
+        """
+        Inserts the queued batches in order, then records the files whose last rows were in the batch.
+        """
+        batchNum = 0
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            tables, files, ledgerDir = batch
+            batchNum += 1
+            stats = instrument.start("gaia", f"{ledgerDir} batch {batchNum}")
             try:
-                cur.executemany(sql_query, data)
-                conn.commit()
-                duration = datetime.datetime.now() - time1
-                # print(duration)
-                if verbose:
-                    print(f"{dbName}: {duration}")
+                with pool.connection() as conn:
+                    cur = stats.cursor(conn.cursor())
+                    committed = True
+                    for sql_query, data, dbName, tableName, columns in tables:
+                        if len(data) > 0:
+                            committed &= insert_batch_data(conn, cur, sql_query, data, dbName, tableName, columns)
+                    #Only record the files once all of their stars are committed; a crash before this point re-reads them (duplicates are ignored)
+                    if committed and len(files) > 0:
+                        recordFiles(cur, ledgerDir, files, ef)
+                        with stats.stage('db'):
+                            conn.commit()
+                    cur.close()
+                #parsed rows are reported by the file records
+                stats.finish(parsed = 0)
             except Exception as e:
-                print(e)
-                
-        insert_batch_data(sql_gaia, gaia, "Gaia")
-        insert_batch_data(sql_gaia_nv, gaia_nv, "Gaia_not_visible")
-        insert_batch_data(sql_gaia_ef, gaia_ef, "Gaia_errors_flags")
-        insert_batch_data(sql_gaia_ef_nv, gaia_ef_nv, "Gaia_errors_flags_not_visible")    
-        if(verbose):
-            print(f"{count} new stars")
-        
-        # Close the cursor and database connection
-        cur.close()
-        conn.close()
-        #------------------------------------------------------------------#
-        #------------------------------------------------------------------#
-    #Here is outside the directory loop   
+                print(f"Writer Error: {e}")
+
+    def flush(files, ledgerDir):
+        """
+        Hands the current table lists to the writer thread (blocks while two batches are already waiting).
+        """
+        tables = [(sql_gaia, fillSexag(gaia, 1, 2, 3, 4), "Gaia", 'gaia', columns_gaia),
+                  (sql_gaia_nv, fillSexag(gaia_nv, 1, 2, 3, 4), "Gaia_not_visible", 'gaia_not_visible', columns_gaia),
+                  (sql_gaia_ef, gaia_ef, "Gaia_errors_flags", 'gaia_errors_flags', columns_gaia_ef),
+                  (sql_gaia_ef_nv, gaia_ef_nv, "Gaia_errors_flags_not_visible", 'gaia_errors_flags_not_visible', columns_gaia_ef)]
+        with instrument.current().stage('wait'):
+            batches.put((tables, files, ledgerDir))
+
+    #A bounded queue keeps at most two full batches waiting, so memory stays flat while parsing overlaps the inserts
+    batches = queue.Queue(maxsize = 2)
+    writerThread = threading.Thread(target = writer, daemon = True)
+    writerThread.start()
+    directory = os.getcwd()
+    try:
+        for directName in tqdm(directories):
+            gaia, gaia_nv, gaia_ef, gaia_ef_nv = [], [], [], []
+            countdup,count,counterror=0,0,0
+            #files parsed from this directory as (filename, stars), recorded in the ledger once committed
+            loaded = []
+            ledgerDir = os.path.basename(os.path.normpath(directName))
+            done = set()
+            if resume:
+                with pool.connection() as conn:
+                    done = completedFiles(conn.cursor(), ledgerDir, ef)
+            try:
+                os.chdir(f"{directName}")
+                if(verbose):
+                    print(f"Current Directory: {os.getcwd()}")
+                filenames = [filename for filename in sorted(os.listdir(os.getcwd())) if filename not in done]
+                if resume and len(filenames) == 0:
+                    if(verbose):
+                        print(f"Skipping {ledgerDir}: already committed")
+                    continue
+                tasks = [(os.path.abspath(filename), f"{ledgerDir}/{filename}", ef, spatial, unzipped, columnar) for filename in filenames]
+                for filename, getParsed in tqdm(zip(filenames, readFiles(tasks, readerPool, 2 * readers)), total = len(filenames)):
+                    #the reader processes report their own files, so only a file parsed here is timed here
+                    stats = instrument.start("gaia", f"{ledgerDir}/{filename}") if readerPool is None else instrument.NULL
+                    stars = 0
+                    try:
+                        try:
+                            rows, rows_nv, rows_ef, rows_ef_nv, stars = getParsed()
+                        except Exception as e:
+                            if(verbose):
+                                print(f"File Error: {e}")
+                            continue
+                        gaia.extend(rows)
+                        gaia_nv.extend(rows_nv)
+                        gaia_ef.extend(rows_ef)
+                        gaia_ef_nv.extend(rows_ef_nv)
+                        count += stars
+                        loaded.append((filename, stars))
+                        if max(len(gaia), len(gaia_nv), len(gaia_ef), len(gaia_ef_nv)) >= batchRows:
+                            flush(loaded, ledgerDir)
+                            gaia, gaia_nv, gaia_ef, gaia_ef_nv = [], [], [], []
+                            loaded = []
+                    finally:
+                        #the writer thread reports the inserted rows and duplicates of each batch; a file that fails to
+                        #parse still gets its record, with parsed = 0
+                        stats.finish(parsed = stars)
+            except Exception as e: 
+                print(f"Directory Error: {e}")
+            finally:
+                os.chdir(directory)
+            #------------------------------------------------------------------#
+            #--After each directory (ex: File-aa-dir) queue the remaining stars--#
+            #------------------------------------------------------------------#
+            flush(loaded, ledgerDir)
+            if(verbose):
+                print(f"{count} new stars")
+            #------------------------------------------------------------------#
+            #------------------------------------------------------------------#
+        #Here is outside the directory loop   
+        # Wait for the writer to finish the queued batches
+        batches.put(None)
+        writerThread.join()
+        if readerPool is not None:
+            readerPool.close()
+    finally:
+        #an error in the loop or in flush must not leave reader processes running or this process in a data folder
+        os.chdir(directory)
+        if readerPool is not None:
+            readerPool.terminate()
+            readerPool.join()
     
      
         
-def deg2Sexag(deg):
-    """
-    Converts degrees to sexagesimal format (degs:mins:secs).
-    Args:
-        deg (float): Degree value.
-    Returns:
-        str: Sexagesimal formatted string.
-    """
-    sign = " "
-    if deg < 0:
-        sign = "-"
-        deg = -deg
-    dd = int(deg)
-    rest = (deg - dd) * 60
-    mm = int(rest)
-    rest = (rest - mm) * 60
-    ss = int(rest)
-    rest = (rest - ss) * 1000
-    ms = int(rest)
-    return "%c%02d:%02d:%02d.%03d" % (sign, dd, mm, ss, ms)   
-    
-    
-def deg2SexagHrs(deg):
-    """
-    Converts degrees to sexagesimal format for RA (hrs:mins:secs).
-    Args:
-        deg (float): Degree value.
-    Returns:
-        str: Sexagesimal formatted string.
-    """
-    deg = (deg / 360) * 24
-    hrs = int(deg)
-    rest = (deg - hrs) * 60
-    mins = int(rest)
-    rest = (rest - mins) * 60
-    secs = int(rest)
-    rest = (rest - secs) * 1000
-    ms = int(rest)
-    return "%02d:%02d:%02d.%03d" % (hrs, mins, secs, ms)   
-    
-    
 def radToDeg(radians):
     """
     Converts radians to degrees.
@@ -764,6 +1128,19 @@ def parseArguments(in_args):
     parser.add_argument("-v", "--verbose", dest = "verbose", type = bool, help = "Print errors & star numbers (default = False)", default = False)
     parser.add_argument("-ef", "--errorsFlags", dest = "ef", type = bool, help = "Create errors flags table? (default = False)", default = False)
     parser.add_argument("-z", "--zippedFiles", dest = "z", type = bool, help = "Are the GAIA files unzipped? (default = True)", default = True)
+    parser.add_argument("-s", "--spatial", dest = "spatial", type = bool, help = "Store an indexed HEALPix pixel id (HPX) with each star for cone searches; the tables must be created with it (-k) (default = False)", default = False)
+    parser.add_argument("-b", "--bulk", dest = "bulk", type = bool, help = "Load each directory with LOAD DATA LOCAL INFILE instead of executemany (default = False)", default = False)
+    parser.add_argument("--fast-initial-load", dest = "fastLoad", type = bool, help = "Create the tables (-k) without keys or indexes, load with relaxed session checks, then remove duplicates and build the keys at the end; with --resume it continues an unfinished fast load (default = False)", default = False)
+    parser.add_argument("--batch-rows", dest = "batchRows", type = int, help = "Rows a table may collect before they are inserted by the background writer (default = 100000)", default = 100000)
+    parser.add_argument("-p", "--readers", dest = "readers", type = int, help = "Number of processes that decompress and parse the files of a directory concurrently (default = 1)", default = 1)
+    parser.add_argument("--columnar", dest = "columnar", type = bool, help = "Parse each file as typed columns with pyarrow instead of line by line (default = False)", default = False)
+    parser.add_argument("--resume", dest = "resume", type = bool, help = "Skip files and directories already recorded in the gaia_ingest_ledger table for the tables being loaded (gaia, or errors flags with -ef) (default = False)", default = False)
+    parser.add_argument("--metrics", dest = "metrics", type = str, help = "Write per file and per batch stage timings and row, reject and duplicate counts to this file (default = None)", default = None)
+    parser.add_argument("--metrics-format", dest = "metricsFormat", type = str, choices = instrument.FORMATS, help = "Metrics file format: 'json' appends one JSON line per file or batch, 'prometheus' rewrites running totals as Prometheus text (default = 'json')", default = "json")
+    parser.add_argument("--bins", dest = "bins", type = str, help = "Folder to write the sky density grid to at the end of the ingest: <catalog>_bins_<resolution>deg.npy and .json, stars per cell like the files in plots/bins (default = None)", default = None)
+    parser.add_argument("--bins-resolution", dest = "binsResolution", type = float, help = "Cell size of the --bins grid in degrees; finer grids are also written added up to 1 degree (default = 1)", default = 1)
+    parser.add_argument("--bins-healpix", dest = "binsHealpix", type = int, help = "Also count --bins HEALPix maps at this order (0 - 12) and write every coarser order too: <catalog>_hpx_<order>.npy and .json (default = None)", default = None)
+    parser.add_argument("--pool-size", dest = "poolSize", type = int, help = "Most connections each process's connection pool has checked out at once (default = 4)", default = None)
     args = None
     try:
         args = parser.parse_args(in_args[1:])
@@ -786,16 +1163,26 @@ def ingestDB():
     path = os.path.abspath("gaia_unzipped.py")
     tNames =['gaia','gaia_errors_flags','gaia_not_visible','gaia_errors_flags_not_visible']
     args = parseArguments(sys.argv) 
+    if args.metrics:
+        instrument.configure(args.metrics, args.metricsFormat)
+    if args.bins:
+        density.configure(args.bins, args.binsResolution, args.binsHealpix)
+    if args.poolSize:
+        connpool.setPoolSize(args.poolSize)
     numFiles = args.fNum
     frange = args.mr.split(",")
     start, end = frange[0], frange[1]
     killConnections()
     createDatabase(args.dName)
+    if args.fastLoad and not (args.kill or args.resume):
+        print("--fast-initial-load creates the tables, use it with -k (or --resume to continue one)")
+        return
     if args.kill:
         for i in range(len(tNames)):
             print("Drop statement: Dropping Tables")
             dropTable(databaseName = args.dName, tableName = tNames[i])
-            createTable(databaseName = args.dName, tableName = tNames[i])
+            createTable(databaseName = args.dName, tableName = tNames[i], spatial = args.spatial, deferKeys = args.fastLoad)
+        dropTable(databaseName = args.dName, tableName = "gaia_ingest_ledger")
     if len(args.mr) > 0:
         print("Range Insertion")
         folders = folderRange(start, end)
@@ -804,7 +1191,7 @@ def ingestDB():
             dirName = f"{args.path}file-{folder}-dir"
             directory_names.append(dirName)
             # print(f"{folder}")
-        insertTable(databaseName = args.dName, tableNames = tNames, directories = directory_names, verbose = args.verbose, ef = args.ef, unzipped = args.z)
+        insertTable(databaseName = args.dName, tableNames = tNames, directories = directory_names, verbose = args.verbose, ef = args.ef, unzipped = args.z, bulk = args.bulk, spatial = args.spatial, resume = args.resume, batchRows = args.batchRows, fastLoad = args.fastLoad, readers = args.readers, columnar = args.columnar)
     elif args.rIns:
         print("Random Insertion")
         dirs = []
@@ -812,8 +1199,16 @@ def ingestDB():
             letter1, letter2 = letters[int(random.uniform(0,25))],letters[int(random.uniform(0,25))]
             dirName = f"{args.path}file-{letter1}{letter2}-dir"
             dirs.append(dirName)
-        insertTable(databaseName = args.dName, tableNames = tNames, directories = dirs, verbose = args.verbose, ef = args.ef, unzipped = args.z)
+        insertTable(databaseName = args.dName, tableNames = tNames, directories = dirs, verbose = args.verbose, ef = args.ef, unzipped = args.z, bulk = args.bulk, spatial = args.spatial, resume = args.resume, batchRows = args.batchRows, fastLoad = args.fastLoad, readers = args.readers, columnar = args.columnar)
         print(dirs)
+    if args.fastLoad:
+        print("Removing duplicates and building keys")
+        conn = connectToDatabase(db_name = args.dName)
+        removed = fastload.finishTables(conn, [(tableName, 'GAIA_ID', 'errors_flags' not in tableName) for tableName in tNames], spatial = args.spatial)
+        conn.close()
+        print(f"{removed.get(tNames[0], 0) + removed.get(tNames[2], 0)} duplicate stars removed")
+    for path in density.save():
+        print(f"Density bins written to {path}")
         
         
 if __name__ == "__main__":
@@ -12,6 +12,12 @@ import random
 import configparser
 import csv
 import gzip
+import bulkload
+import healpix
+import connpool
+import density
+import instrument
+from sexagesimal import fillSexag
 
 
 def connectionParameters():
@@ -32,19 +38,20 @@ def connectionParameters():
     return db_host, db_port, db_user, db_password
 
 
-def connectToDatabase(db_name = None):
+def connectToDatabase(db_name = None, local_infile = False):
     """
     Returns a connection to the MySQL database.
     Args:
         db_name (str): Name of the database.
+        local_infile (bool): Allow LOAD DATA LOCAL INFILE on the connection.
     Returns:
         pymysql.Connection: MySQL database connection.
     """
     db_host, db_port, db_user, db_password = connectionParameters()
     if db_name == None:
-        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password,autocommit=True)
+        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password,autocommit=True, local_infile = local_infile)
     else:
-        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name,autocommit=True)
+        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name,autocommit=True, local_infile = local_infile)
     return conn
     
     
@@ -81,12 +88,13 @@ def createDatabase(databaseName = "GAIA_dev"):
         pass
     
     
-def createTable(databaseName = "GAIA_dev", tableName = "gaia"): 
+def createTable(databaseName = "GAIA_dev", tableName = "gaia", spatial = False): 
     """
     Creates the specified table.
     Args:
         databaseName (str): Name of the database.
         tableName (str): Name of the table.
+        spatial (bool): Add the indexed HPX (HEALPix pixel id) column to the star tables.
     """
     conn = connectToDatabase(db_name = databaseName)
     cur = conn.cursor()
@@ -110,6 +118,8 @@ def createTable(databaseName = "GAIA_dev", tableName = "gaia"):
                 );\
             """
         cur.execute(query)
+        if spatial:
+            healpix.addSpatialColumn(cur, tableName)
         print(f"{tableName} created")
     elif tableName == 'gaia_errors_flags' or tableName == 'gaia_errors_flags_not_visible':
         query = f"""CREATE TABLE {tableName} (\
@@ -277,7 +287,7 @@ def viewTable(databaseName = "GAIA_dev", tableName = "gaia"):
         print("Cannot View: That table doesn't exist")
           
             
-def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-aa-dir", verbose = False, ef = False): 
+def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-aa-dir", verbose = False, ef = False, bulk = False, spatial = False): 
     """
     description:
         Inserts data into four tables based on the provided catalog files in the specified directory.
@@ -287,16 +297,19 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
         directName (str): Name of the directory containing CSV files (default is "file-aa-dir").
         verbose (bool): Print error messages
         ef (bool): insert into the errors flags table
+        bulk (bool): load each file with LOAD DATA LOCAL INFILE instead of one INSERT per star
+        spatial (bool): also insert the HPX pixel id of each star
     returns:
         None
     """
+    hpxColumn, hpxValue = (", HPX", ", %s") if spatial else ("", "")
     sql_gaia = f"""INSERT INTO gaia (\
-        GAIA_ID, RA, Decl, Ra_deg, Decl_deg, Ra_rad, Decl_rad, Epoch, pmra, pmdec, gmag, bpmag, rpmag, radial_velocity, parallax) \
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);\
+        GAIA_ID, RA, Decl, Ra_deg, Decl_deg, Ra_rad, Decl_rad, Epoch, pmra, pmdec, gmag, bpmag, rpmag, radial_velocity, parallax{hpxColumn}) \
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s{hpxValue});\
         """
     sql_gaia_nv = f"""INSERT INTO gaia_not_visible (\
-        GAIA_ID, RA, Decl, Ra_deg, Decl_deg, Ra_rad, Decl_rad, Epoch, pmra, pmdec, gmag, bpmag, rpmag, radial_velocity, parallax) \
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);\
+        GAIA_ID, RA, Decl, Ra_deg, Decl_deg, Ra_rad, Decl_rad, Epoch, pmra, pmdec, gmag, bpmag, rpmag, radial_velocity, parallax{hpxColumn}) \
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s{hpxValue});\
         """
     sql_gaia_ef = f"""INSERT INTO gaia_errors_flags (\
         GAIA_ID, solution_id, source_id, random_index, ra_error, dec_error, parallax_error, parallax_over_error,\
@@ -338,8 +351,31 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
         e_bp_min_rp_percentile_lower, e_bp_min_rp_percentile_upper, flame_flags, radius_val,\
         radius_percentile_lower, radius_percentile_upper, lum_val, lum_percentile_lower, lum_percentile_upper) VALUES (%s, %s, %s,%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s); \
         """
-    conn = connectToDatabase(db_name = databaseName)
-    cur = conn.cursor()
+    columns_gaia = ['GAIA_ID', 'RA', 'Decl', 'Ra_deg', 'Decl_deg', 'Ra_rad', 'Decl_rad', 'Epoch', 'pmra', 'pmdec', 'gmag', 'bpmag', 'rpmag', 'radial_velocity', 'parallax']
+    if spatial:
+        columns_gaia.append('HPX')
+    columns_gaia_ef = ['GAIA_ID', 'solution_id', 'source_id', 'random_index', 'ra_error', 'dec_error', 'parallax_error',
+        'parallax_over_error', 'pmra_error', 'pmdec_error', 'ra_dec_corr', 'ra_parallax_corr', 'ra_pmra_corr',
+        'ra_pmdec_corr', 'dec_parallax_corr', 'dec_pmra_corr', 'dec_pmdec_corr', 'parallax_pmra_corr',
+        'parallax_pmdec_corr', 'pmra_pmdec_corr', 'astrometric_n_obs_al', 'astrometric_n_obs_ac',
+        'astrometric_n_good_obs_al', 'astrometric_n_bad_obs_al', 'astrometric_gof_al', 'astrometric_chi2_al',
+        'astrometric_excess_noise', 'astrometric_excess_noise_sig', 'astrometric_params_solved',
+        'astrometric_primary_flag', 'astrometric_weight_al', 'astrometric_pseudo_colour',
+        'astrometric_pseudo_colour_error', 'mean_varpi_factor_al', 'astrometric_matched_observations',
+        'visibility_periods_used', 'astrometric_sigma5d_max', 'frame_rotator_object_type', 'matched_observations',
+        'duplicated_source', 'phot_g_n_obs', 'phot_g_mean_flux', 'phot_g_mean_flux_error',
+        'phot_g_mean_flux_over_error', 'phot_bp_n_obs', 'phot_bp_mean_flux', 'phot_bp_mean_flux_error',
+        'phot_bp_mean_flux_over_error', 'phot_rp_n_obs', 'phot_rp_mean_flux', 'phot_rp_mean_flux_error',
+        'phot_rp_mean_flux_over_error', 'phot_bp_rp_excess_factor', 'phot_proc_mode', 'bp_rp', 'bp_g', 'g_rp',
+        'radial_velocity_error', 'rv_nb_transits', 'rv_template_teff', 'rv_template_logg', 'rv_template_fe_h',
+        'phot_variable_flag', 'l', 'b', 'ecl_lon', 'ecl_lat', 'priam_flags', 'teff_val', 'teff_percentile_lower',
+        'teff_percentile_upper', 'a_g_val', 'a_g_percentile_lower', 'a_g_percentile_upper', 'e_bp_min_rp_val',
+        'e_bp_min_rp_percentile_lower', 'e_bp_min_rp_percentile_upper', 'flame_flags', 'radius_val',
+        'radius_percentile_lower', 'radius_percentile_upper', 'lum_val', 'lum_percentile_lower',
+        'lum_percentile_upper']
+    #reuse a pooled connection across directories instead of logging in for each one
+    pool = connpool.getPool(connectToDatabase, db_name = databaseName, local_infile = bulk)
+    conn = pool.acquire()
     try:
         directory = os.getcwd()
         os.chdir(f"{directName}")
@@ -347,12 +383,20 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
             print(f"Current Directory: {os.getcwd()}")
         countdup,count,counterror=0,0,0
         for filename in tqdm(os.listdir(os.getcwd())):
+            gaia, gaia_nv, gaia_ef, gaia_ef_nv = [], [], [], []
+            #positions of the file's stars, counted into the density grid once the file is read
+            ras, decs = [], []
+            stats = instrument.start("gaia", f"{directName}/{filename}")
+            cur = stats.cursor(conn.cursor())
+            fileCount, fileDup, fileError = count, countdup, counterror
             try:
                 #Use this for the unzipped files
-                with open(filename, 'r') as f:
+                with stats.stage('open'):
+                    f = open(filename, 'r')
                 # #Use this for the zipped files
-                # with gzip.open(filename, 'rt') as f:
-                    reader = csv.reader(f)
+                # f = gzip.open(filename, 'rt')
+                with f:
+                    reader = stats.reader(f)
                     for line in reader:
                         try:
                             check = line[2]
@@ -361,8 +405,6 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
                             else:
                                 dec_deg = cbf(line[7])
                                 if dec_deg < -70.:
-                                    conn = connectToDatabase(db_name = databaseName)
-                                    cur = conn.cursor()
                                     if ef:
                                         solution_id = cbi(line[0])
                                         source_id = cbi(line[2])
@@ -448,7 +490,7 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
                                         lum_percentile_lower = cbf(line[92])
                                         lum_percentile_upper = cbf(line[93])
                                         designation = line[1]
-                                        cur.execute(sql_gaia_ef_nv,(designation, solution_id, source_id, 
+                                        values = (designation, solution_id, source_id, 
                                             random_index, ra_error, dec_error, parallax_error, parallax_over_error, 
                                             pmra_error, pmdec_error, ra_dec_corr, ra_parallax_corr, ra_pmra_corr, 
                                             ra_pmdec_corr, dec_parallax_corr, dec_pmra_corr, dec_pmdec_corr, parallax_pmra_corr, 
@@ -468,8 +510,13 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
                                             teff_val, teff_percentile_lower, teff_percentile_upper, a_g_val, a_g_percentile_lower, 
                                             a_g_percentile_upper, e_bp_min_rp_val, e_bp_min_rp_percentile_lower, e_bp_min_rp_percentile_upper,
                                             flame_flags, radius_val, radius_percentile_lower, radius_percentile_upper, 
-                                            lum_val, lum_percentile_lower, lum_percentile_upper))
-                                        conn.commit()
+                                            lum_val, lum_percentile_lower, lum_percentile_upper)
+                                        if bulk:
+                                            gaia_ef_nv.append(values)
+                                        else:
+                                            cur.execute(sql_gaia_ef_nv, values)
+                                            with stats.stage('db'):
+                                                conn.commit()
                                     else:
                                         designation = line[1]
                                         ref_epoch = cbf(line[4])
@@ -477,8 +524,6 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
                                         dec_deg = cbf(line[7])
                                         ra_rad = degToRad(ra_deg)
                                         dec_rad = degToRad(dec_deg)
-                                        ra = deg2SexagHrs(ra_deg)
-                                        dec = deg2Sexag(dec_deg)
                                         pmra = cbf(line[12])
                                         pmdec = cbf(line[14])
                                         parallax = cbf(line[9])
@@ -486,9 +531,15 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
                                         phot_bp_mean_mag = cbf(line[55])
                                         phot_g_mean_mag = cbf(line[50])
                                         phot_rp_mean_mag = cbf(line[60])
-                                        cur.execute(sql_gaia_nv,(designation,ra,dec,ra_deg,dec_deg,ra_rad,dec_rad,
-                                            ref_epoch,pmra,pmdec,phot_g_mean_mag,phot_bp_mean_mag,phot_rp_mean_mag,radial_velocity, parallax))
-                                        conn.commit()
+                                        values = (designation,None,None,ra_deg,dec_deg,ra_rad,dec_rad,
+                                            ref_epoch,pmra,pmdec,phot_g_mean_mag,phot_bp_mean_mag,phot_rp_mean_mag,radial_velocity, parallax)
+                                        ras.append(ra_deg)
+                                        decs.append(dec_deg)
+                                        if spatial:
+                                            values += (healpix.healpixId(ra_deg, dec_deg),)
+                                        #inserted once the file is read, with the RA and Dec strings of the whole file filled at once
+                                        gaia_nv.append(values)
+                                        continue
                                 else:
                                     if ef:
                                         solution_id = cbi(line[0])
@@ -574,7 +625,7 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
                                         lum_val = cbf(line[91])
                                         lum_percentile_lower = cbf(line[92])
                                         lum_percentile_upper = cbf(line[93])
-                                        cur.execute(sql_gaia_ef,(designation, solution_id, source_id, 
+                                        values = (designation, solution_id, source_id, 
                                             random_index, ra_error, dec_error, parallax_error, parallax_over_error, 
                                             pmra_error, pmdec_error, ra_dec_corr, ra_parallax_corr, ra_pmra_corr, 
                                             ra_pmdec_corr, dec_parallax_corr, dec_pmra_corr, dec_pmdec_corr, parallax_pmra_corr, 
@@ -594,8 +645,13 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
                                             teff_val, teff_percentile_lower, teff_percentile_upper, a_g_val, a_g_percentile_lower, 
                                             a_g_percentile_upper, e_bp_min_rp_val, e_bp_min_rp_percentile_lower, e_bp_min_rp_percentile_upper,
                                             flame_flags, radius_val, radius_percentile_lower, radius_percentile_upper, 
-                                            lum_val, lum_percentile_lower, lum_percentile_upper))
-                                        conn.commit()
+                                            lum_val, lum_percentile_lower, lum_percentile_upper)
+                                        if bulk:
+                                            gaia_ef.append(values)
+                                        else:
+                                            cur.execute(sql_gaia_ef, values)
+                                            with stats.stage('db'):
+                                                conn.commit()
                                     else:
                                         designation = line[1]
                                         ref_epoch = cbf(line[4])
@@ -603,8 +659,6 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
                                         dec_deg = cbf(line[7])
                                         ra_rad = degToRad(ra_deg)
                                         dec_rad = degToRad(dec_deg)
-                                        ra = deg2SexagHrs(ra_deg)
-                                        dec = deg2Sexag(dec_deg)
                                         pmra = cbf(line[12])
                                         pmdec = cbf(line[14])
                                         parallax = cbf(line[9])
@@ -612,9 +666,15 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
                                         phot_bp_mean_mag = cbf(line[55])
                                         phot_g_mean_mag = cbf(line[50])
                                         phot_rp_mean_mag = cbf(line[60])
-                                        cur.execute(sql_gaia,(designation,ra,dec,ra_deg,dec_deg,ra_rad,dec_rad,
-                                            ref_epoch,pmra,pmdec,phot_g_mean_mag,phot_bp_mean_mag,phot_rp_mean_mag,radial_velocity, parallax))
-                                        conn.commit()
+                                        values = (designation,None,None,ra_deg,dec_deg,ra_rad,dec_rad,
+                                            ref_epoch,pmra,pmdec,phot_g_mean_mag,phot_bp_mean_mag,phot_rp_mean_mag,radial_velocity, parallax)
+                                        ras.append(ra_deg)
+                                        decs.append(dec_deg)
+                                        if spatial:
+                                            values += (healpix.healpixId(ra_deg, dec_deg),)
+                                        #inserted once the file is read, with the RA and Dec strings of the whole file filled at once
+                                        gaia.append(values)
+                                        continue
                                     count+=1
                         except Exception as e:
                             if e.args[0] != 1062:
@@ -622,7 +682,31 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
                             else:
                                 countdup+=1
                                 pass
-                            
+                density.add("gaia", ras, decs)
+                gaia = fillSexag(gaia, 1, 2, 3, 4)
+                gaia_nv = fillSexag(gaia_nv, 1, 2, 3, 4)
+                if not bulk:
+                    for sql_query, rows in ((sql_gaia, gaia), (sql_gaia_nv, gaia_nv)):
+                        for values in rows:
+                            try:
+                                cur.execute(sql_query, values)
+                                with stats.stage('db'):
+                                    conn.commit()
+                                count+=1
+                            except Exception as e:
+                                if e.args[0] != 1062:
+                                    counterror+=1
+                                else:
+                                    countdup+=1
+                else:
+                    #nothing was inserted while parsing, so the file's new stars are the rows LOAD DATA inserted into each table
+                    count = fileCount
+                    for tableName, columns, rows in (('gaia', columns_gaia, gaia), ('gaia_not_visible', columns_gaia, gaia_nv),
+                                                    ('gaia_errors_flags', columns_gaia_ef, gaia_ef), ('gaia_errors_flags_not_visible', columns_gaia_ef, gaia_ef_nv)):
+                        inserted, cd = bulkload.bulkInsert(cur, tableName, columns, rows)
+                        count += inserted
+                        countdup += cd
+                stats.finish(rows = count - fileCount, duplicates = countdup - fileDup, rejects = counterror - fileError)
             except Exception as e:
                 if(verbose):
                     print(f"File Error: {e}")
@@ -631,51 +715,9 @@ def insertTable(databaseName = "GAIA_dev", tableNames = [], directName = "file-a
         os.chdir(directory)
     except Exception as e: 
         print(f"Directory Error: {e}")
-    conn.ping()
-    conn.close()
+    pool.release(conn, broken = not conn.open)
                  
         
-def deg2Sexag(deg):
-    """
-    Converts degrees to sexagesimal format (degs:mins:secs).
-    Args:
-        deg (float): Degree value.
-    Returns:
-        str: Sexagesimal formatted string.
-    """
-    sign = " "
-    if deg < 0:
-        sign = "-"
-        deg = -deg
-    dd = int(deg)
-    rest = (deg - dd) * 60
-    mm = int(rest)
-    rest = (rest - mm) * 60
-    ss = int(rest)
-    rest = (rest - ss) * 1000
-    ms = int(rest)
-    return "%c%02d:%02d:%02d.%03d" % (sign, dd, mm, ss, ms)   
-    
-    
-def deg2SexagHrs(deg):
-    """
-    Converts degrees to sexagesimal format for RA (hrs:mins:secs).
-    Args:
-        deg (float): Degree value.
-    Returns:
-        str: Sexagesimal formatted string.
-    """
-    deg = (deg / 360) * 24
-    hrs = int(deg)
-    rest = (deg - hrs) * 60
-    mins = int(rest)
-    rest = (rest - mins) * 60
-    secs = int(rest)
-    rest = (rest - secs) * 1000
-    ms = int(rest)
-    return "%02d:%02d:%02d.%03d" % (hrs, mins, secs, ms)   
-    
-    
 def radToDeg(radians):
     """
     Converts radians to degrees.
@@ -776,6 +818,14 @@ def parseArguments(in_args):
     parser.add_argument("-f", "--filePath", dest = "path", type = str, help = "path to reach gaia catalog unzipped files (default = None)", default = "")
     parser.add_argument("-v", "--verbose", dest = "verbose", type = bool, help = "Print errors & star numbers (default = False)", default = False)
     parser.add_argument("-ef", "--errorsFlags", dest = "ef", type = bool, help = "Also create errors flags table?", default = False)
+    parser.add_argument("-s", "--spatial", dest = "spatial", type = bool, help = "Store an indexed HEALPix pixel id (HPX) with each star for cone searches; the tables must be created with it (-k) (default = False)", default = False)
+    parser.add_argument("-b", "--bulk", dest = "bulk", type = bool, help = "Load each file with LOAD DATA LOCAL INFILE instead of row by row inserts (default = False)", default = False)
+    parser.add_argument("--metrics", dest = "metrics", type = str, help = "Write per file stage timings and row, reject and duplicate counts to this file (default = None)", default = None)
+    parser.add_argument("--metrics-format", dest = "metricsFormat", type = str, choices = instrument.FORMATS, help = "Metrics file format: 'json' appends one JSON line per file, 'prometheus' rewrites running totals as Prometheus text (default = 'json')", default = "json")
+    parser.add_argument("--bins", dest = "bins", type = str, help = "Folder to write the sky density grid to at the end of the ingest: <catalog>_bins_<resolution>deg.npy and .json, stars per cell like the files in plots/bins (default = None)", default = None)
+    parser.add_argument("--bins-resolution", dest = "binsResolution", type = float, help = "Cell size of the --bins grid in degrees; finer grids are also written added up to 1 degree (default = 1)", default = 1)
+    parser.add_argument("--bins-healpix", dest = "binsHealpix", type = int, help = "Also count --bins HEALPix maps at this order (0 - 12) and write every coarser order too: <catalog>_hpx_<order>.npy and .json (default = None)", default = None)
+    parser.add_argument("--pool-size", dest = "poolSize", type = int, help = "Most connections each process's connection pool has checked out at once (default = 4)", default = None)
     args = None
     try:
         args = parser.parse_args(in_args[1:])
@@ -798,6 +848,12 @@ def ingestDB():
     path = os.path.abspath("gaia_unzipped.py")
     tNames =['gaia','gaia_errors_flags','gaia_not_visible','gaia_errors_flags_not_visible']
     args = parseArguments(sys.argv) 
+    if args.metrics:
+        instrument.configure(args.metrics, args.metricsFormat)
+    if args.bins:
+        density.configure(args.bins, args.binsResolution, args.binsHealpix)
+    if args.poolSize:
+        connpool.setPoolSize(args.poolSize)
     numFiles = args.fNum
     frange = args.mr.split(",")
     start, end = frange[0], frange[1]
@@ -807,14 +863,14 @@ def ingestDB():
         for i in range(len(tNames)):
             print("Drop statement: Dropping Tables")
             dropTable(databaseName = args.dName, tableName = tNames[i])
-            createTable(databaseName = args.dName, tableName = tNames[i])
+            createTable(databaseName = args.dName, tableName = tNames[i], spatial = args.spatial)
     if len(args.mr) > 0:
         print("Range Insertion")
         folders = folderRange(start, end)
         for folder in tqdm(folders):
             dirName = f"{args.path}file-{folder}-dir"
             print(f"{folder}")
-            insertTable(databaseName = args.dName, tableNames = tNames, directName = dirName, verbose = args.verbose, ef = args.ef)
+            insertTable(databaseName = args.dName, tableNames = tNames, directName = dirName, verbose = args.verbose, ef = args.ef, bulk = args.bulk, spatial = args.spatial)
     elif args.rIns:
         print("Random Insertion")
         dirs = []
@@ -822,8 +878,10 @@ def ingestDB():
             letter1, letter2 = letters[int(random.uniform(0,25))],letters[int(random.uniform(0,25))]
             dirName = f"{args.path}file-{letter1}{letter2}-dir"
             dirs.append(dirName)
-            insertTable(databaseName = args.dName, tableNames = tNames, directName = dirName, verbose = args.verbose, ef = args.ef)
+            insertTable(databaseName = args.dName, tableNames = tNames, directName = dirName, verbose = args.verbose, ef = args.ef, bulk = args.bulk, spatial = args.spatial)
         print(dirs)
+    for path in density.save():
+        print(f"Density bins written to {path}")
         
         
 if __name__ == "__main__":
@@ -8,6 +8,15 @@ import os.path
 import random
 import configparser
 import csv
+import bulkload
+import healpix
+import connpool
+import fastload
+import density
+import instrument
+from sexagesimal import fillSexag
+import pipeline
+import functools
 
 def connectionParameters():
     """
@@ -23,19 +32,20 @@ def connectionParameters():
     db_password = config['GSC240']['password']
     return db_host, db_port, db_user, db_password
 
-def connectToDatabase(db_name = None):
+def connectToDatabase(db_name = None, local_infile = False):
     """
     Returns a connection to the MySQL database.
     Args:
         db_name (str): Name of the database.
+        local_infile (bool): Allow LOAD DATA LOCAL INFILE on the connection.
     Returns:
         pymysql.Connection: MySQL database connection.
     """
     db_host, db_port, db_user, db_password = connectionParameters()
     if db_name == None:
-        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password)
+        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, local_infile = local_infile)
     else:
-        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name)
+        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name, local_infile = local_infile)
     return conn
     
 def cnm(mag):
@@ -79,16 +89,19 @@ def createDatabase(databaseName = "GSC240_dev"):
         pass
         # print("DB already created")
     
-def createTable(databaseName = "GSC240_dev", tableName = "gsc240"): 
+def createTable(databaseName = "GSC240_dev", tableName = "gsc240", spatial = False, deferKeys = False): 
     """
     Creates the specified table.
     Args:
         databaseName (str): Name of the database.
         tableName (str): Name of the table.
+        spatial (bool): Add the indexed HPX (HEALPix pixel id) column to the star tables.
+        deferKeys (bool): Leave out the primary key and HPX index; fastload.finishTable builds them after the load.
     """
     conn = connectToDatabase(db_name = databaseName)
     cur = conn.cursor()
-    cur.execute(f'CREATE TABLE {tableName} (HSTID VARCHAR(11) PRIMARY KEY);')
+    primaryKey = "" if deferKeys else " PRIMARY KEY"
+    cur.execute(f'CREATE TABLE {tableName} (HSTID VARCHAR(11){primaryKey});')
     if tableName == 'gsc240' or tableName == 'gsc240_not_visible':
         query = f"""ALTER TABLE {tableName} \
             ADD GSC1ID VARCHAR(11), \
@@ -123,6 +136,8 @@ def createTable(databaseName = "GSC240_dev", tableName = "gsc240"):
             ADD SourceStatus INT; \
             """
         cur.execute(query)
+        if spatial:
+            healpix.addSpatialColumn(cur, tableName, index = not deferKeys)
     elif tableName == 'gsc240_errors_flags' or tableName == 'gsc240_errors_flags_not_visible':
         query = f"""ALTER TABLE {tableName} \
             ADD GSC1ID VARCHAR(11), \
@@ -179,7 +194,144 @@ def viewTable(databaseName = "GSC240_dev", tableName = "gsc240"):
         print("Cannot View: That table doesn't exist")
 
     
-def insertTable(databaseName = "GSC240_dev", tableNames = ['gsc240', 'gsc240_errors_flags', 'gsc240_not_visible', 'gsc240_errors_flags_not_visible'], path = "csv", dec1="000", dec2="0000", ra="000", verbose = False):  
+COLUMNS = ['HSTID', 'GSC1ID', 'GSCID', 'RA', 'Decl', 'RA_rad', 'Decl_rad', 'RA_deg', 'Decl_deg', 'Original_Epoch',
+    'RA_eps', 'Decl_eps', 'PmRA', 'PmDec', 'Delta_Epoch',
+    'FpgMag', 'JpgMag', 'VMag', 'NpgMag', 'UMag', 'BMag', 'RMag', 'IMag', 'JMag', 'HMag',
+    'KMag', 'Classification', 'SemiMajorAxis', 'Eccentricity', 'PositionAngle', 'SourceStatus']
+COLUMNS_EF = ['HSTID', 'GSC1ID', 'GSCID', 'PmRA_mu', 'PmDec_mu', 'FpgMag_err',
+    'FpgMag_code', 'JpgMag_err', 'JpgMag_code', 'VMag_err', 'VMag_code',
+    'NpgMag_err', 'NpgMag_code', 'UMag_err', 'UMag_code', 'BMag_err',
+    'BMag_code', 'RMag_err', 'RMag_code', 'IMag_err', 'IMag_code',
+    'JMag_err', 'JMag_code', 'HMag_err', 'HMag_code', 'KMag_err',
+    'KMag_code', 'VariableFlag', 'MultipleFlag']
+
+def parseFile(path = "csv", dec1 = "000", dec2 = "0000", ra = "000", spatial = False):
+    """
+    Parses the dec1 dec2 ra file into gsc240 and gsc240_errors_flags row tuples.
+    Args:
+        path (str): Path to the CSV files.
+        dec1 (str): Declination degree.
+        dec2 (str): Declination decimal.
+        ra (str): Right ascension.
+        spatial (bool): Append the HPX pixel id to each gsc240 row
+    Returns:
+        Tuple: (List, List) - gsc240 rows, gsc240_errors_flags rows
+    """
+    rows, rows_ef = [], []
+    file = f"{dec1}/{dec2}/{ra}.csv"
+    stats = instrument.current()
+    with stats.stage('open'):
+        f = open(f'{path}/{file}', 'r')
+    with f:
+        csvFile = stats.reader(f)
+        for line in csvFile:
+            try:
+                GSCID = line[0]
+                GSC1ID = str(line[1])
+                if GSC1ID == "___NULL___":
+                    GSC1ID = None
+                HSTID = line[2]
+                RA_rad = float(line[3])
+                Decl_rad = float(line[4])
+                RA_deg = radToDeg(RA_rad)
+                Decl_deg = radToDeg(Decl_rad)
+                #RA and Decl strings are filled in for the whole file below
+                RA, Decl = None, None
+                Original_Epoch = line[5]
+                RA_eps = line[6]
+                Decl_eps = line[7]
+                PmRA = cnm(float(line[8]))
+                PmDec = cnm(float(line[9]))
+                Delta_Epoch = line[12]
+                FpgMag = cnm(float(line[13]))
+                JpgMag = cnm(float(line[16]))
+                VMag = cnm(float(line[19]))
+                NpgMag = cnm(float(line[22]))
+                UMag = cnm(float(line[25]))
+                BMag = cnm(float(line[28]))
+                RMag = cnm(float(line[31]))
+                IMag = cnm(float(line[34]))
+                JMag = cnm(float(line[37]))
+                HMag = cnm(float(line[40]))
+                KMag = cnm(float(line[43]))
+                Classification = line[46]
+                SemiMajorAxis = line[47]
+                Eccentricity = line[48]
+                PositionAngle = line[49]
+                SourceStatus = line[50]
+                PmRA_mu = cnm(float(line[10]))
+                PmDec_mu = cnm(float(line[11]))
+                FpgMag_err = cnm(float(line[14]))
+                FpgMag_code = cnc(int(line[15]))
+                JpgMag_err = cnm(float(line[17]))
+                JpgMag_code = cnc(int(line[18]))
+                VMag_err = cnm(float(line[20]))
+                VMag_code = cnc(int(line[21]))
+                NpgMag_err = cnm(float(line[23]))
+                NpgMag_code = cnc(int(line[24]))
+                UMag_err = cnm(float(line[26]))
+                UMag_code = cnc(int(line[27]))
+                BMag_err = cnm(float(line[29]))
+                BMag_code = cnc(int(line[30]))
+                RMag_err = cnm(float(line[32]))
+                RMag_code = cnc(int(line[33]))
+                IMag_err = cnm(float(line[35]))
+                IMag_code = cnc(int(line[36]))
+                JMag_err = cnm(float(line[38]))
+                JMag_code = cnc(int(line[39]))
+                HMag_err = cnm(float(line[41]))
+                HMag_code = cnc(int(line[42]))
+                KMag_err = cnm(float(line[44]))
+                KMag_code = cnc(int(line[45]))
+                VariableFlag = line[51]
+                MultipleFlag = line[52]
+                values = (
+                    HSTID, GSC1ID, GSCID, RA, Decl, RA_rad, Decl_rad, 
+                    RA_deg, Decl_deg, Original_Epoch, RA_eps, Decl_eps, 
+                    PmRA, PmDec, Delta_Epoch, FpgMag, JpgMag, VMag, 
+                    NpgMag, UMag, BMag, RMag, IMag, JMag, HMag, KMag, 
+                    Classification, SemiMajorAxis, Eccentricity, PositionAngle, SourceStatus)
+                if spatial:
+                    values += (healpix.healpixId(RA_deg, Decl_deg),)
+                values_ef = (
+                    HSTID, GSC1ID, GSCID, PmRA_mu, PmDec_mu,
+                    FpgMag_err, FpgMag_code, JpgMag_err, JpgMag_code,
+                    VMag_err, VMag_code, NpgMag_err, NpgMag_code,
+                    UMag_err, UMag_code, BMag_err, BMag_code,
+                    RMag_err, RMag_code, IMag_err, IMag_code,
+                    JMag_err, JMag_code, HMag_err, HMag_code,
+                    KMag_err, KMag_code, VariableFlag, MultipleFlag)
+                rows.append(values)
+                rows_ef.append(values_ef)
+            except Exception as e:
+                stats.count('rejects')
+                print(e)
+    density.addRows("gsc240", rows, 7, 8)
+    return fillSexag(rows, 3, 4, 7, 8), rows_ef
+
+def parseBatches(task, tableNames = ['gsc240', 'gsc240_errors_flags', 'gsc240_not_visible', 'gsc240_errors_flags_not_visible'], path = "csv", spatial = False):
+    """
+    Pipeline parse step: parses one file into batches for its tables.
+    Args:
+        task (Tuple): (dec1, dec2, ra) of the file.
+        tableNames (List): List of table names.
+        path (str): Path to the CSV files.
+        spatial (bool): Append the HPX pixel id to each gsc240 row
+    Returns:
+        List: (tableName, columns, rows) batches
+    """
+    dec1, dec2, ra = task
+    if not os.path.exists(f'{path}/{dec1}/{dec2}/{ra}.csv'):
+        return []
+    if int(dec1) < 20:
+        loc = 2
+    else:
+        loc = 0
+    rows, rows_ef = parseFile(path, dec1, dec2, ra, spatial)
+    columns = COLUMNS + ['HPX'] if spatial else COLUMNS
+    return [(tableNames[loc], columns, rows), (tableNames[loc+1], COLUMNS_EF, rows_ef)]
+
+def insertTable(databaseName = "GSC240_dev", tableNames = ['gsc240', 'gsc240_errors_flags', 'gsc240_not_visible', 'gsc240_errors_flags_not_visible'], path = "csv", dec1="000", dec2="0000", ra="000", verbose = False, bulk = False, spatial = False, fastLoad = False, batchRows = 0):  
     """
     Inserts data from the dec1 dec2 ra file.
     Args:
@@ -189,23 +341,31 @@ def insertTable(databaseName = "GSC240_dev", tableNames = ['gsc240', 'gsc240_err
         dec1 (str): Declination degree.
         dec2 (str): Declination decimal.
         ra (str): Right ascension.
+        bulk (bool): Load the file with LOAD DATA LOCAL INFILE instead of one INSERT per star
+        spatial (bool): Also insert the HPX pixel id of each star
+        fastLoad (bool): Insert over connections with relaxed session checks (tables created with deferKeys)
+        batchRows (int): Stars per multi-row INSERT statement instead of two INSERTs per star; 0 inserts one star at a time
     Returns:
         None
     """
-    conn = connectToDatabase(db_name = databaseName)
-    cur = conn.cursor() 
+    #reuse a pooled connection across files instead of logging in for each one
+    pool = connpool.getPool(connectToDatabase, setup = fastload.relaxSession if fastLoad else None, db_name = databaseName, local_infile = bulk)
+    conn = pool.acquire()
+    stats = instrument.start("gsc240", f"{dec1}/{dec2}/{ra}.csv")
+    cur = stats.cursor(conn.cursor())
     try:
         if int(dec1) < 20:
             loc = 2
         else:
             loc = 0
+        hpxColumn, hpxValue = (", HPX", ", %s") if spatial else ("", "")
         sql = f"""INSERT INTO {tableNames[loc]} ( \
                 HSTID, GSC1ID, GSCID, RA, Decl, RA_rad, Decl_rad, RA_deg, Decl_deg, Original_Epoch, \
                 RA_eps, Decl_eps, PmRA, PmDec, Delta_Epoch, \
                 FpgMag, JpgMag, VMag, NpgMag, UMag, BMag, RMag, IMag, JMag, HMag, \
-                KMag, Classification, SemiMajorAxis, Eccentricity, PositionAngle, SourceStatus) \
+                KMag, Classification, SemiMajorAxis, Eccentricity, PositionAngle, SourceStatus{hpxColumn}) \
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,  \
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s); \
+                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s{hpxValue}); \
             """
         sql_ef= f"""INSERT INTO {tableNames[loc+1]} ( \
                 HSTID, GSC1ID, GSCID, PmRA_mu, PmDec_mu, FpgMag_err, \
@@ -217,86 +377,26 @@ def insertTable(databaseName = "GSC240_dev", tableNames = ['gsc240', 'gsc240_err
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, \
                 %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);\
             """
-        file = f"{dec1}/{dec2}/{ra}.csv"
+        columns = COLUMNS + ['HPX'] if spatial else COLUMNS
         count = 0
         countdup = 0
-        with open(f'{path}/{file}', 'r') as f:
-            csvFile = csv.reader(f)
-            for line in csvFile:
+        rows, rows_ef = parseFile(path, dec1, dec2, ra, spatial)
+        if batchRows and not bulk:
+            #both tables are keyed by HSTID, so the errors and flags rows of duplicate stars are skipped too
+            try:
+                count, countdup = pipeline.insertRows(cur, tableNames[loc], columns, rows, batchRows = batchRows)
+                countEf, countdupEf = pipeline.insertRows(cur, tableNames[loc+1], COLUMNS_EF, rows_ef, batchRows = batchRows)
+            except Exception as e:
+                #a row that is not just a duplicate fails its whole statement; report it, not only with -v
+                print(f"{dec1}/{dec2}/{ra}.csv: {e}")
+                raise
+            if (countEf, countdupEf) != (count, countdup):
+                print(f"{dec1}/{dec2}/{ra}.csv: {count} new stars and {countdup} duplicates in {tableNames[loc]}, but {countEf} and {countdupEf} in {tableNames[loc+1]}")
+        elif not bulk:
+            for values, values_ef in zip(rows, rows_ef):
                 try:
-                    GSCID = line[0]
-                    GSC1ID = str(line[1])
-                    if GSC1ID == "___NULL___":
-                        GSC1ID = None
-                    HSTID = line[2]
-                    RA_rad = float(line[3])
-                    Decl_rad = float(line[4])
-                    RA_deg = radToDeg(RA_rad)
-                    Decl_deg = radToDeg(Decl_rad)
-                    RA = deg2SexagHrs(RA_deg)
-                    Decl = deg2Sexag(Decl_deg)
-                    Original_Epoch = line[5]
-                    RA_eps = line[6]
-                    Decl_eps = line[7]
-                    PmRA = cnm(float(line[8]))
-                    PmDec = cnm(float(line[9]))
-                    Delta_Epoch = line[12]
-                    FpgMag = cnm(float(line[13]))
-                    JpgMag = cnm(float(line[16]))
-                    VMag = cnm(float(line[19]))
-                    NpgMag = cnm(float(line[22]))
-                    UMag = cnm(float(line[25]))
-                    BMag = cnm(float(line[28]))
-                    RMag = cnm(float(line[31]))
-                    IMag = cnm(float(line[34]))
-                    JMag = cnm(float(line[37]))
-                    HMag = cnm(float(line[40]))
-                    KMag = cnm(float(line[43]))
-                    Classification = line[46]
-                    SemiMajorAxis = line[47]
-                    Eccentricity = line[48]
-                    PositionAngle = line[49]
-                    SourceStatus = line[50]
-                    PmRA_mu = cnm(float(line[10]))
-                    PmDec_mu = cnm(float(line[11]))
-                    FpgMag_err = cnm(float(line[14]))
-                    FpgMag_code = cnc(int(line[15]))
-                    JpgMag_err = cnm(float(line[17]))
-                    JpgMag_code = cnc(int(line[18]))
-                    VMag_err = cnm(float(line[20]))
-                    VMag_code = cnc(int(line[21]))
-                    NpgMag_err = cnm(float(line[23]))
-                    NpgMag_code = cnc(int(line[24]))
-                    UMag_err = cnm(float(line[26]))
-                    UMag_code = cnc(int(line[27]))
-                    BMag_err = cnm(float(line[29]))
-                    BMag_code = cnc(int(line[30]))
-                    RMag_err = cnm(float(line[32]))
-                    RMag_code = cnc(int(line[33]))
-                    IMag_err = cnm(float(line[35]))
-                    IMag_code = cnc(int(line[36]))
-                    JMag_err = cnm(float(line[38]))
-                    JMag_code = cnc(int(line[39]))
-                    HMag_err = cnm(float(line[41]))
-                    HMag_code = cnc(int(line[42]))
-                    KMag_err = cnm(float(line[44]))
-                    KMag_code = cnc(int(line[45]))
-                    VariableFlag = line[51]
-                    MultipleFlag = line[52]
-                    cur.execute(sql,(
-                        HSTID, GSC1ID, GSCID, RA, Decl, RA_rad, Decl_rad, 
-                        RA_deg, Decl_deg, Original_Epoch, RA_eps, Decl_eps, 
-                        PmRA, PmDec, Delta_Epoch, FpgMag, JpgMag, VMag, 
-                        NpgMag, UMag, BMag, RMag, IMag, JMag, HMag, KMag, 
-                        Classification, SemiMajorAxis, Eccentricity, PositionAngle, SourceStatus))
-                    cur.execute(sql_ef,(
-                        HSTID, GSC1ID, GSCID, PmRA_mu, PmDec_mu,
-                        FpgMag_err, FpgMag_code, JpgMag_err, JpgMag_code,
-                        VMag_err, VMag_code, NpgMag_err, NpgMag_code,
-                        UMag_err, UMag_code, BMag_err, BMag_code,
-                        RMag_err, RMag_code, IMag_err, IMag_code,
-                        JMag_err, JMag_code, HMag_err, HMag_code,
-                        KMag_err, KMag_code, VariableFlag, MultipleFlag))
+                    cur.execute(sql, values)
+                    cur.execute(sql_ef, values_ef)
                     count+=1
                 except Exception as e:
                     #--------------------------#
@@ -305,57 +405,29 @@ def insertTable(databaseName = "GSC240_dev", tableNames = ['gsc240', 'gsc240_err
                     #-------------------------#
                     #this exception catches duplicate stars
                     countdup+=1
+        if bulk:
+            #LOAD DATA skips duplicate keys, so duplicates are the rows that were not inserted
+            c, cd = bulkload.bulkInsert(cur, tableNames[loc], columns, rows)
+            count += c
+            countdup += cd
+            bulkload.bulkInsert(cur, tableNames[loc+1], COLUMNS_EF, rows_ef)
     except Exception as e:
         #this exception catches files that do not exist
+        if isinstance(e, FileNotFoundError):
+            stats = instrument.NULL
         if(verbose):
             print(e)
         pass
-    conn.ping()
-    conn.commit()
-    conn.close()
+    try:
+        with stats.stage('db'):
+            conn.commit()
+    finally:
+        pool.release(conn, broken = not conn.open)
+    stats.finish(rows = count, duplicates = countdup)
     if(verbose):
         # print(f"{count} stars inserted | {countdup} duplicates")
         return count, countdup
                     
-def deg2Sexag(deg):
-    """
-    Converts degrees to sexagesimal format (degs:mins:secs).
-    Args:
-        deg (float): Degree value.
-    Returns:
-        str: Sexagesimal formatted string.
-    """
-    sign = " "
-    if deg < 0:
-        sign = "-"
-        deg = -deg
-    dd = int(deg)
-    rest = (deg - dd) * 60
-    mm = int(rest)
-    rest = (rest - mm) * 60
-    ss = int(rest)
-    rest = (rest - ss) * 1000
-    ms = int(rest)
-    return "%c%02d:%02d:%02d.%03d" % (sign, dd, mm, ss, ms)   
-    
-def deg2SexagHrs(deg):
-    """
-    Converts degrees to sexagesimal format for RA (hrs:mins:secs).
-    Args:
-        deg (float): Degree value.
-    Returns:
-        str: Sexagesimal formatted string.
-    """
-    deg = (deg / 360) * 24
-    hrs = int(deg)
-    rest = (deg - hrs) * 60
-    mins = int(rest)
-    rest = (rest - mins) * 60
-    secs = int(rest)
-    rest = (rest - secs) * 1000
-    ms = int(rest)
-    return "%02d:%02d:%02d.%03d" % (hrs, mins, secs, ms)   
-    
 def radToDeg(radians):
     """
     Converts radians to degrees.
@@ -424,6 +496,18 @@ def parseArguments(in_args):
     parser.add_argument("-k", "--dropTables", dest = "kill", type = bool, help = "Drop Current tables and restart DB ingestion? (default = False)", default = False)
     parser.add_argument("-mr", "--manualRange", dest = "mr", type = str, help = "Manually insert a set of files (1,180--insert dec files 0-179) (default = None)", default = "")
     parser.add_argument("-v", "--verbose", dest = "verbose", type = bool, help = "Print number of duplicate/new stars to command line (default=False)", default = False)
+    parser.add_argument("-s", "--spatial", dest = "spatial", type = bool, help = "Store an indexed HEALPix pixel id (HPX) with each star for cone searches; the tables must be created with it (-k) (default = False)", default = False)
+    parser.add_argument("-p", "--parsers", dest = "parsers", type = int, help = "Number of parser processes; more than 1 parses files in parallel and inserts them from separate writer processes (default = 1)", default = 1)
+    parser.add_argument("-w", "--writers", dest = "writers", type = int, help = "Number of writer processes used with -p (default = 1)", default = 1)
+    parser.add_argument("-b", "--bulk", dest = "bulk", type = bool, help = "Load each file with LOAD DATA LOCAL INFILE instead of row by row inserts (default = False)", default = False)
+    parser.add_argument("--batch-rows", dest = "batchRows", type = int, help = "Stars per multi-row INSERT ... ON DUPLICATE KEY UPDATE statement, counting duplicates from the affected rows; 0 inserts one star at a time (default = 0)", default = 0)
+    parser.add_argument("--fast-initial-load", dest = "fastLoad", type = bool, help = "Create the tables (-k) without keys or indexes, load with relaxed session checks, then remove duplicates and build the keys at the end (default = False)", default = False)
+    parser.add_argument("--metrics", dest = "metrics", type = str, help = "Write per file stage timings and row, reject and duplicate counts to this file (default = None)", default = None)
+    parser.add_argument("--metrics-format", dest = "metricsFormat", type = str, choices = instrument.FORMATS, help = "Metrics file format: 'json' appends one JSON line per file, 'prometheus' rewrites running totals as Prometheus text (default = 'json')", default = "json")
+    parser.add_argument("--bins", dest = "bins", type = str, help = "Folder to write the sky density grid to at the end of the ingest: <catalog>_bins_<resolution>deg.npy and .json, stars per cell like the files in plots/bins (default = None)", default = None)
+    parser.add_argument("--bins-resolution", dest = "binsResolution", type = float, help = "Cell size of the --bins grid in degrees; finer grids are also written added up to 1 degree (default = 1)", default = 1)
+    parser.add_argument("--bins-healpix", dest = "binsHealpix", type = int, help = "Also count --bins HEALPix maps at this order (0 - 12) and write every coarser order too: <catalog>_hpx_<order>.npy and .json (default = None)", default = None)
+    parser.add_argument("--pool-size", dest = "poolSize", type = int, help = "Most connections each process's connection pool has checked out at once (default = 4)", default = None)
     args = None
     try:
         args = parser.parse_args(in_args[1:])
@@ -441,16 +525,47 @@ def ingestDB():
     """
     tNames = ['gsc240', 'gsc240_errors_flags', 'gsc240_not_visible', 'gsc240_errors_flags_not_visible']
     args = parseArguments(sys.argv) 
+    if args.metrics:
+        instrument.configure(args.metrics, args.metricsFormat)
+    if args.bins:
+        density.configure(args.bins, args.binsResolution, args.binsHealpix)
+    if args.poolSize:
+        connpool.setPoolSize(args.poolSize)
     numFiles = args.fNum
     killConnections()
     createDatabase(args.dName)
+    if args.fastLoad and not args.kill:
+        print("--fast-initial-load creates the tables, use it with -k")
+        return
     if args.kill:
         for i in range(len(tNames)):
             print("Dropping Tables")
             dropTable(databaseName = args.dName, tableName = tNames[i])
-            createTable(databaseName = args.dName, tableName = tNames[i])
+            createTable(databaseName = args.dName, tableName = tNames[i], spatial = args.spatial, deferKeys = args.fastLoad)
     files = []
-    if len(args.mr) > 0:
+    if args.parsers > 1 and not args.rIns:
+        print(f"Pipelined Insertion ({args.parsers} parsers, {args.writers} writers)")
+        if len(args.mr) > 0:
+            text = args.mr.split(",")
+            tasks = [("{:>03}".format(decDeg), "{:>04}".format(decDec), "{:>03}".format(Ra))
+                     for decDeg in range(int(text[0]),int(text[1])) for decDec in range(10) for Ra in range(360)]
+        elif args.mIns != None:
+            text = args.mIns.split(",") + ["", ""]
+            decDeg = min(int(text[0]),180)
+            decDec = min(int(text[1]),10) if text[1] else 10
+            lenRA = min(int(text[2]),360) if text[2] else 360
+            tasks = [("{:>03}".format(decDeg), "{:>04}".format(decDec), "{:>03}".format(Ra)) for Ra in range(lenRA)]
+        else:
+            tasks = [("{:>03}".format(decDeg), "{:>04}".format(decDec), "{:>03}".format(Ra))
+                     for decDeg in range(0,args.fNum) for decDec in range(10) for Ra in range(360)]
+        parse = functools.partial(parseBatches, tableNames = tNames, path = args.fPath, spatial = args.spatial)
+        connect = functools.partial(connectToDatabase, db_name = args.dName, local_infile = args.bulk)
+        totals = pipeline.runPipeline(tasks, parse, connect, parsers = args.parsers, writers = args.writers, bulk = args.bulk,
+                                      setup = fastload.relaxSession if args.fastLoad else None, catalog = "gsc240", batchRows = args.batchRows)
+        count = sum(totals.get(tableName, [0, 0])[0] for tableName in (tNames[0], tNames[2]))
+        countdups = sum(totals.get(tableName, [0, 0])[1] for tableName in (tNames[0], tNames[2]))
+        print(f"{count} new stars | {countdups} duplicates")
+    elif len(args.mr) > 0:
         print("Manual Range Insertion")
         text = args.mr.split(",")
         for decDeg in tqdm(range(int(text[0]),int(text[1]))):
@@ -460,7 +575,7 @@ def ingestDB():
                     dec = "{:>03}".format(decDeg)
                     decdec = "{:>04}".format(decDec)
                     ra = "{:>03}".format(Ra)
-                    c,cd = insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose)
+                    c,cd = insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose, bulk = args.bulk, spatial = args.spatial, fastLoad = args.fastLoad, batchRows = args.batchRows)
                     count+=c
                     countdups+=cd
                 files.append([dec,decdec])   
@@ -488,7 +603,7 @@ def ingestDB():
                     dec = "{:>03}".format(decDeg)
                     decdec = "{:>04}".format(decDec)
                     ra = "{:>03}".format(Ra)
-                    c,cd = insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose)
+                    c,cd = insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose, bulk = args.bulk, spatial = args.spatial, fastLoad = args.fastLoad, batchRows = args.batchRows)
                     count+=c
                     countdups+=cd
                     files.append([dec,decdec,ra])
@@ -502,7 +617,7 @@ def ingestDB():
             dec = "{:>03}".format(dec)
             decdec = "{:>04}".format(decdec)
             ra = "{:>03}".format(ra)
-            insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose)
+            insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose, bulk = args.bulk, spatial = args.spatial, fastLoad = args.fastLoad, batchRows = args.batchRows)
             files.append([dec,decdec,ra])
         print(files)
     else:
@@ -513,8 +628,16 @@ def ingestDB():
                     dec = "{:>03}".format(decDeg)
                     decdec = "{:>04}".format(decDec)
                     ra = "{:>03}".format(Ra)
-                    insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose)
+                    insertTable(databaseName = args.dName, tableNames = tNames, path = args.fPath, dec1 = dec, dec2 = decdec, ra = ra, verbose = args.verbose, bulk = args.bulk, spatial = args.spatial, fastLoad = args.fastLoad, batchRows = args.batchRows)
                 files.append([dec,decdec]) 
+    if args.fastLoad:
+        print("Removing duplicates and building keys")
+        conn = connectToDatabase(db_name = args.dName)
+        removed = fastload.finishTables(conn, [(tableName, 'HSTID', 'errors_flags' not in tableName) for tableName in tNames], spatial = args.spatial)
+        conn.close()
+        print(f"{removed.get(tNames[0], 0) + removed.get(tNames[2], 0)} duplicate stars removed")
+    for path in density.save():
+        print(f"Density bins written to {path}")
     if(args.verbose):
         for file in files:
             print(file)
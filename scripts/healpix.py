@@ -0,0 +1,216 @@
+import math
+import numpy as np
+
+# Order of the HPX column (nside = 2**12 = 4096, pixels are about 0.86 arcmin across)
+HPX_ORDER = 12
+
+def spreadBits(value):
+    """
+    Moves the bits of a pixel coordinate to the even bit positions (used to build nested pixel ids).
+    Args:
+        value (int): Pixel coordinate.
+    Returns:
+        int: Value with a zero bit inserted above each bit.
+    """
+    result = 0
+    bit = 0
+    while value:
+        result |= (value & 1) << (2 * bit)
+        value >>= 1
+        bit += 1
+    return result
+
+def healpixId(ra, dec, order = HPX_ORDER):
+    """
+    Returns the nested HEALPix pixel containing a position.
+    Args:
+        ra (float): Right ascension in degrees.
+        dec (float): Declination in degrees.
+        order (int): HEALPix order (nside = 2**order).
+    Returns:
+        int: Nested pixel id.
+    """
+    nside = 1 << order
+    z = math.sin(math.radians(dec))
+    za = abs(z)
+    tt = (ra % 360.) / 90.
+    if za <= 2. / 3.:
+        temp1 = nside * (0.5 + tt)
+        temp2 = nside * z * 0.75
+        jp = int(temp1 - temp2)
+        jm = int(temp1 + temp2)
+        ifp = jp >> order
+        ifm = jm >> order
+        if ifp == ifm:
+            face = ifp | 4
+        elif ifp < ifm:
+            face = ifp
+        else:
+            face = ifm + 8
+        ix = jm & (nside - 1)
+        iy = nside - (jp & (nside - 1)) - 1
+    else:
+        ntt = min(3, int(tt))
+        tp = tt - ntt
+        tmp = nside * math.sqrt(3 * (1 - za))
+        jp = min(int(tp * tmp), nside - 1)
+        jm = min(int((1 - tp) * tmp), nside - 1)
+        if z >= 0:
+            face = ntt
+            ix = nside - jm - 1
+            iy = nside - jp - 1
+        else:
+            face = ntt + 8
+            ix = jp
+            iy = jm
+    return (face << (2 * order)) + spreadBits(ix) + (spreadBits(iy) << 1)
+
+def spreadBitsArray(values, order):
+    """
+    Column version of spreadBits.
+    Args:
+        values (Numpy array): Pixel coordinates.
+        order (int): HEALPix order (number of bits to spread).
+    Returns:
+        Numpy array: Values with a zero bit inserted above each bit.
+    """
+    values = values.astype(np.int64)
+    result = np.zeros_like(values)
+    for bit in range(order):
+        result |= ((values >> bit) & 1) << (2 * bit)
+    return result
+
+def healpixIds(ra, dec, order = HPX_ORDER):
+    """
+    Column version of healpixId.
+    Args:
+        ra (Numpy array): Right ascension in degrees.
+        dec (Numpy array): Declination in degrees.
+        order (int): HEALPix order (nside = 2**order).
+    Returns:
+        Numpy array: Nested pixel ids (int64).
+    """
+    nside = 1 << order
+    z = np.sin(np.radians(np.asarray(dec, dtype = np.float64)))
+    za = np.abs(z)
+    tt = np.mod(np.asarray(ra, dtype = np.float64), 360.) / 90.
+    # equatorial region
+    temp1 = nside * (0.5 + tt)
+    temp2 = nside * z * 0.75
+    jp = np.trunc(temp1 - temp2).astype(np.int64)
+    jm = np.trunc(temp1 + temp2).astype(np.int64)
+    ifp = jp >> order
+    ifm = jm >> order
+    faceEq = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ixEq = jm & (nside - 1)
+    iyEq = nside - (jp & (nside - 1)) - 1
+    # polar caps
+    ntt = np.minimum(3, np.trunc(tt).astype(np.int64))
+    tp = tt - ntt
+    tmp = nside * np.sqrt(np.maximum(3 * (1 - za), 0.))
+    jpP = np.minimum(np.trunc(tp * tmp).astype(np.int64), nside - 1)
+    jmP = np.minimum(np.trunc((1 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z >= 0
+    faceP = np.where(north, ntt, ntt + 8)
+    ixP = np.where(north, nside - jmP - 1, jpP)
+    iyP = np.where(north, nside - jpP - 1, jmP)
+    equatorial = za <= 2. / 3.
+    face = np.where(equatorial, faceEq, faceP)
+    ix = np.where(equatorial, ixEq, ixP)
+    iy = np.where(equatorial, iyEq, iyP)
+    return (face << (2 * order)) + spreadBitsArray(ix, order) + (spreadBitsArray(iy, order) << 1)
+
+def pixelRanges(ra, dec, radius, order = HPX_ORDER):
+    """
+    Returns ranges of HPX ids whose pixels together cover a cone. The cone is covered with coarse pixels
+    (about the size of the radius) found by sampling a margin around it, and each coarse pixel becomes
+    one contiguous range of nested ids at the storage order.
+    Args:
+        ra (float): Right ascension of the center in degrees.
+        dec (float): Declination of the center in degrees.
+        radius (float): Cone radius in degrees.
+        order (int): HEALPix order of the stored ids.
+    Returns:
+        List: List of (first, last) inclusive id ranges.
+    """
+    coarse = min(order, max(0, int(math.floor(math.log2(58.6 / max(radius, 1e-6))))))
+    pixSize = 58.6 / (1 << coarse)
+    step = pixSize / 4
+    margin = radius + 2 * pixSize
+    decs = np.arange(max(dec - margin, -90.), min(dec + margin, 90.) + step, step)
+    decs = np.clip(decs, -90., 90.)
+    ras, decSamples = [], []
+    for d in decs:
+        cosd = max(math.cos(math.radians(d)), 1e-6)
+        halfWidth = min(180., margin / cosd)
+        raStep = min(step / cosd, 360.)
+        row = np.arange(ra - halfWidth, ra + halfWidth + raStep, raStep)
+        ras.append(row)
+        decSamples.append(np.full(len(row), d))
+    pixels = np.unique(healpixIds(np.concatenate(ras), np.concatenate(decSamples), coarse))
+    shift = 2 * (order - coarse)
+    ranges = []
+    for pix in pixels.tolist():
+        first, last = pix << shift, ((pix + 1) << shift) - 1
+        if ranges and ranges[-1][1] + 1 == first:
+            ranges[-1] = (ranges[-1][0], last)
+        else:
+            ranges.append((first, last))
+    return ranges
+
+def coneSearchQuery(tableName, ra, dec, radius, raColumn = "RA_deg", decColumn = "Decl_deg", columns = "*", order = HPX_ORDER):
+    """
+    Builds a cone search that narrows rows with HPX index ranges and then applies the exact angular distance cut.
+    Args:
+        tableName (str): Name of the table.
+        ra (float): Right ascension of the center in degrees.
+        dec (float): Declination of the center in degrees.
+        radius (float): Cone radius in degrees.
+        raColumn (str): RA column of the table in degrees.
+        decColumn (str): Dec column of the table in degrees.
+        columns (str): Columns to select.
+        order (int): HEALPix order of the HPX column.
+    Returns:
+        Tuple: (str, List) - SQL query, query parameters
+    """
+    ranges = pixelRanges(ra, dec, radius, order)
+    pixelFilter = " OR ".join(["HPX BETWEEN %s AND %s"] * len(ranges))
+    distance = f"""DEGREES(2 * ASIN(SQRT(POW(SIN(RADIANS({decColumn} - %s) / 2), 2) + \
+        COS(RADIANS({decColumn})) * COS(RADIANS(%s)) * POW(SIN(RADIANS({raColumn} - %s) / 2), 2))))"""
+    sql = f"SELECT {columns} FROM {tableName} WHERE ({pixelFilter}) AND {distance} <= %s;"
+    params = [value for pixelRange in ranges for value in pixelRange] + [dec, dec, ra, radius]
+    return sql, params
+
+def coneSearch(cur, tableName, ra, dec, radius, raColumn = "RA_deg", decColumn = "Decl_deg", columns = "*"):
+    """
+    Returns the rows of a table within radius degrees of a position.
+    Args:
+        cur (pymysql.cursors.Cursor): Database cursor.
+        tableName (str): Name of a table with an HPX column.
+        ra (float): Right ascension of the center in degrees.
+        dec (float): Declination of the center in degrees.
+        radius (float): Cone radius in degrees.
+        raColumn (str): RA column of the table in degrees.
+        decColumn (str): Dec column of the table in degrees.
+        columns (str): Columns to select.
+    Returns:
+        List: Rows inside the cone.
+    """
+    sql, params = coneSearchQuery(tableName, ra, dec, radius, raColumn, decColumn, columns)
+    cur.execute(sql, params)
+    return cur.fetchall()
+
+def addSpatialColumn(cur, tableName, index = True):
+    """
+    Adds the HPX pixel id column to a table.
+    Args:
+        cur (pymysql.cursors.Cursor): Database cursor.
+        tableName (str): Name of the table.
+        index (bool): Index the column now (False leaves the index for fastload.finishTable).
+    Returns:
+        None
+    """
+    if index:
+        cur.execute(f"ALTER TABLE {tableName} ADD HPX BIGINT, ADD INDEX {tableName}_hpx (HPX);")
+    else:
+        cur.execute(f"ALTER TABLE {tableName} ADD HPX BIGINT;")
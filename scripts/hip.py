@@ -3,9 +3,19 @@ from tqdm import tqdm
 import argparse
 import os
 import sys
+import re
 import math
 import configparser
 import csv
+import numpy as np
+import bulkload
+import healpix
+import density
+import instrument
+from sexagesimal import deg2SexagArray, deg2SexagHrsArray, sexag2DegArray, sexag2DegHrsArray
+
+# An "hh mm ss.ss" or "-dd mm ss.s" position column of hip_main.csv
+SEXAGESIMAL = re.compile(r"-?\d+(\.\d*)? \d+(\.\d*)? \d+(\.\d*)?$")
 
 def connectionParameters():
     """
@@ -21,19 +31,20 @@ def connectionParameters():
     db_password = config['HIP']['password']
     return db_host, db_port, db_user, db_password
 
-def connectToDatabase(db_name = None):
+def connectToDatabase(db_name = None, local_infile = False):
     """
     Returns a connection to the MySQL database.
     Args:
         db_name (str): Name of the database.
+        local_infile (bool): Allow LOAD DATA LOCAL INFILE on the connection.
     Returns:
         pymysql.Connection: MySQL database connection.
     """
     db_host, db_port, db_user, db_password = connectionParameters()
     if db_name == None:
-        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password)
+        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, local_infile = local_infile)
     else:
-        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name)
+        conn = pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name, local_infile = local_infile)
     return conn
     
     
@@ -91,12 +102,13 @@ def cbs(value):
         return None
     return str(value)
 
-def createTable(databaseName = "HIP_dev", tableName = "hip"): 
+def createTable(databaseName = "HIP_dev", tableName = "hip", spatial = False): 
     """
     Creates the specified table.
     Args:
         databaseName (str): Name of the database.
         tableName (str): Name of the table.
+        spatial (bool): Add the indexed HPX (HEALPix pixel id) column to the hip table.
     """
     conn = connectToDatabase(db_name = databaseName)
     cur = conn.cursor()
@@ -186,6 +198,8 @@ def createTable(databaseName = "HIP_dev", tableName = "hip"):
     """
     if tableName == 'hip':
         cur.execute(sql)
+        if spatial:
+            healpix.addSpatialColumn(cur, tableName)
     elif tableName == 'hip_errors_flags':
         cur.execute(sql_ef)
     conn.commit()
@@ -224,54 +238,26 @@ def cnm(value):
         return None
     return float(value)
 
-def sexag2Deg(sexag):
-    """
-    Converts sexagesimal format (degs:mins:secs) to degrees.
-    Args:
-        sexag (str): Sexagesimal formatted string.
-    Returns:
-        float: Degree value.
-    """
-    parts = sexag.split(' ')
-    sign = 1
-    if parts[0][0] == '-':
-        sign = -1
-        parts[0] = parts[0][1:]
-    deg = float(parts[0])
-    deg += float(parts[1]) / 60
-    deg += float(parts[2]) / 3600
-    return deg * sign
-
-def sexag2DegHrs(sexag):
-    """
-    Converts sexagesimal format for RA (hrs:mins:secs) to degrees.
-    Args:
-        sexag (str): Sexagesimal formatted string.
-    Returns:
-        float: Degree value.
-    """
-    parts = sexag.split(' ')
-    hrs = float(parts[0])
-    hrs += float(parts[1]) / 60
-    hrs += float(parts[2]) / 3600
-    return (hrs / 24) * 360
-    
-def insertTable(databaseName = "HIP_dev", path = "", verbose = False):  
+def insertTable(databaseName = "HIP_dev", path = "", verbose = False, bulk = False, spatial = False):  
     """
     Inserts data from the dec1 dec2 ra file.
     Args:
         databaseName (str): Name of the database.
         path (str): Path to the CSV files.
         verbose (bool): Whether to print flags
+        bulk (bool): Load the file with LOAD DATA LOCAL INFILE instead of one INSERT per star
+        spatial (bool): Also insert the HPX pixel id of each star
     Returns:
         None
     """
     
-    conn = connectToDatabase(db_name = databaseName)
-    cur = conn.cursor() 
+    conn = connectToDatabase(db_name = databaseName, local_infile = bulk)
+    stats = instrument.start("hip", "hip_main.csv")
+    cur = stats.cursor(conn.cursor())
 
+    hpxColumn, hpxValue = (", HPX", ", %s") if spatial else ("", "")
     sql = f"""INSERT INTO hip (\
-    HIP_ID, RA, Decl, RA_deg, Decl_deg, RA_rad, Decl_rad, Vmag, Parallax, pm_RA, pm_Dec, BT_Mag, VT_Mag, Hip_Mag, BV_Color, VI_Color) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s); \
+    HIP_ID, RA, Decl, RA_deg, Decl_deg, RA_rad, Decl_rad, Vmag, Parallax, pm_RA, pm_Dec, BT_Mag, VT_Mag, Hip_Mag, BV_Color, VI_Color{hpxColumn}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s{hpxValue}); \
     """
     sql_errors_flags = f"""INSERT INTO hip_errors_flags (\
     HIP_ID, Prox_10asec, Var_Flag, Vmag_Source, Astrom_Ref_Dbl, RA_Error, Dec_Error, Parallax_Error, pm_RA_Error, pm_Dec_Error, \
@@ -286,12 +272,29 @@ def insertTable(databaseName = "HIP_dev", path = "", verbose = False):
     %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s \
     ); \
     """
+    columns = ['HIP_ID', 'RA', 'Decl', 'RA_deg', 'Decl_deg', 'RA_rad', 'Decl_rad', 'Vmag', 'Parallax', 'pm_RA', 'pm_Dec', 'BT_Mag', 'VT_Mag', 'Hip_Mag', 'BV_Color', 'VI_Color']
+    if spatial:
+        columns.append('HPX')
+    columns_errors_flags = ['HIP_ID', 'Prox_10asec', 'Var_Flag', 'Vmag_Source', 'Astrom_Ref_Dbl', 'RA_Error', 'Dec_Error', 'Parallax_Error', 'pm_RA_Error', 'pm_Dec_Error',
+    'Crl_Dec_RA', 'Crl_Plx_RA', 'Crl_Plx_Dec', 'Crl_pmRA_RA', 'Crl_pmRA_Dec', 'Crl_pmRA_Plx', 'Crl_pmDec_RA', 'Crl_pmDec_Dec', 'Crl_pmDec_Plx',
+    'Crl_pmDec_pmRA', 'Reject_Percent', 'Quality_Fit', 'BT_Mag_Error', 'VT_Mag_Error', 'BT_Mag_Ref_Dbl', 'BV_Color_Error', 'BV_Mag_Source',
+    'VI_Color_Error', 'VI_Color_Source', 'Mag_Ref_Dbl', 'Hip_Mag_Error', 'Scat_Hip_Mag', 'N_Obs_Hip_Mag', 'Hip_Mag_Ref_Dbl', 'Hip_Mag_Max',
+    'Hip_Mag_Min', 'Var_Period', 'Hip_Var_Type', 'Var_Data_Annex', 'Var_Curv_Annex', 'CCDM_Id', 'CCDM_History', 'CCDM_N_Entries', 'CCDM_N_Comp',
+    'Dbl_Mult_Annex', 'Astrom_Mult_Source', 'Dbl_Soln_Qual', 'Dbl_Ref_ID', 'Dbl_Theta', 'Dbl_Rho', 'Rho_Error', 'Diff_Hip_Mag', 'dHip_Mag_Error',
+    'Survey_Star', 'ID_Chart', 'Notes', 'HD_Id', 'BD_Id', 'CoD_Id', 'CPD_Id', 'VI_Color_Reduct', 'Spect_Type', 'Spect_Type_Source']
+    rows, rows_errors_flags = [], []
+    #positions of the parsed stars in degrees; the string, radian and HPX columns are filled from them once the file is read
+    ras, decs = [], []
+    #rows without degree columns, converted from their sexagesimal strings as columns: (row, RA, Dec)
+    missing = []
     filename = "hip_main.csv"
-    with open(path+filename, 'r') as f:
-        count, countdup = 0,0
-        r = csv.reader(f)
+    with stats.stage('open'):
+        f = open(path+filename, 'r')
+    with f:
+        count, countdup, rejects = 0,0,0
+        r = stats.reader(f)
         for line in tqdm(r):
-            try: #will correctly fail if there is a duplicate star
+            try:
                 HIP_ID = int(line[1])
                 Prox_10asec = cbs(line[2])
                 RA = line[3]
@@ -302,12 +305,10 @@ def insertTable(databaseName = "HIP_dev", path = "", verbose = False):
                 RA_Deg = cbf(line[8])
                 Decl_Deg = cbf(line[9])
                 if RA_Deg == None or Decl_Deg == None:
-                    RA_Deg = sexag2DegHrs(RA)
-                    Decl_Deg = sexag2Deg(Dec)
-                RA = deg2SexagHrs(RA_Deg)
-                Decl = deg2Sexag(Decl_Deg)
-                RA_Rad = degToRad(RA_Deg)
-                Decl_Rad = degToRad(Decl_Deg)
+                    if not SEXAGESIMAL.match(RA) or not SEXAGESIMAL.match(Dec):
+                        raise ValueError(f"HIP {HIP_ID}: no position in '{RA}' '{Dec}'")
+                    missing.append((len(rows), RA, Dec))
+                    RA_Deg, Decl_Deg = math.nan, math.nan
                 Astrom_Ref_Dbl = cbs(line[10])
                 Parallax = cbf(line[11])
                 pm_RA = cbf(line[12])
@@ -376,68 +377,78 @@ def insertTable(databaseName = "HIP_dev", path = "", verbose = False):
                 VI_Color_Reduct = cbs(line[75])
                 Spect_Type = cbs(line[76])
                 Spect_Type_Source = cbs(line[77])
-                cur.execute(sql, (
-                    HIP_ID, RA, Decl, RA_Deg, Decl_Deg, RA_Rad, Decl_Rad, Vmag, Parallax, pm_RA, pm_Dec, BT_Mag, VT_Mag, Hip_Mag, BV_Color, VI_Color))
-                cur.execute(sql_errors_flags,(
+                values = (
+                    HIP_ID, None, None, None, None, None, None, Vmag, Parallax, pm_RA, pm_Dec, BT_Mag, VT_Mag, Hip_Mag, BV_Color, VI_Color)
+                values_errors_flags = (
                     HIP_ID, Prox_10asec, Var_Flag, Vmag_Source, Astrom_Ref_Dbl, RA_Error, Dec_Error, Parallax_Error, pm_RA_Error, pm_Dec_Error,
                     Crl_Dec_RA, Crl_Plx_RA, Crl_Plx_Dec, Crl_pmRA_RA, Crl_pmRA_Dec, Crl_pmRA_Plx, Crl_pmDec_RA, Crl_pmDec_Dec, Crl_pmDec_Plx,
                     Crl_pmDec_pmRA, Reject_Percent, Quality_Fit, BT_Mag_Error, VT_Mag_Error, BT_Mag_Ref_Dbl, BV_Color_Error, BV_Mag_Source,
                     VI_Color_Error, VI_Color_Source, Mag_Ref_Dbl, Hip_Mag_Error, Scat_Hip_Mag, N_Obs_Hip_Mag, Hip_Mag_Ref_Dbl, Hip_Mag_Max,
                     Hip_Mag_Min, Var_Period, Hip_Var_Type, Var_Data_Annex, Var_Curv_Annex, CCDM_Id, CCDM_History, CCDM_N_Entries, CCDM_N_Comp,
                     Dbl_Mult_Annex, Astrom_Mult_Source, Dbl_Soln_Qual, Dbl_Ref_ID, Dbl_Theta, Dbl_Rho, Rho_Error, Diff_Hip_Mag, dHip_Mag_Error,
-                    Survey_Star, ID_Chart, Notes, HD_Id, BD_Id, CoD_Id, CPD_Id, VI_Color_Reduct, Spect_Type, Spect_Type_Source))
-                count+=1            
+                    Survey_Star, ID_Chart, Notes, HD_Id, BD_Id, CoD_Id, CPD_Id, VI_Color_Reduct, Spect_Type, Spect_Type_Source)
+                ras.append(RA_Deg)
+                decs.append(Decl_Deg)
+                rows.append(values)
+                rows_errors_flags.append(values_errors_flags)
+            except Exception as e:
+                countdup+=1
+                rejects+=1
+                print(e)
+    ra, dec = np.array(ras, dtype = np.float64), np.array(decs, dtype = np.float64)
+    if missing:
+        index, raStrings, decStrings = zip(*missing)
+        ra[list(index)] = sexag2DegHrsArray(raStrings)
+        dec[list(index)] = sexag2DegArray(decStrings)
+    rows = fillPositions(rows, ra, dec, spatial)
+    density.add("hip", ra, dec)
+    if not bulk:
+        for values, values_errors_flags in zip(rows, rows_errors_flags):
+            try: #will correctly fail if there is a duplicate star
+                cur.execute(sql, values)
+                cur.execute(sql_errors_flags, values_errors_flags)
+                count+=1
             except Exception as e:
                 countdup+=1
                 if e.args[0] != 1062:
+                    rejects+=1
                     print(e)
                 elif verbose:
-                    if e.args[0] == 1062:
-                        print(e)      
-    conn.commit()
+                    print(e)
+    else:
+        #LOAD DATA skips duplicate keys, so duplicates are the rows that were not inserted
+        c, cd = bulkload.bulkInsert(cur, 'hip', columns, rows)
+        bulkload.bulkInsert(cur, 'hip_errors_flags', columns_errors_flags, rows_errors_flags)
+        count += c
+        countdup += cd
+    with stats.stage('db'):
+        conn.commit()
     conn.close()
+    stats.finish(rows = count, duplicates = countdup - rejects, rejects = rejects)
     if(verbose):
         print(f"{count} stars inserted | {countdup} duplicates")
                            
-def deg2Sexag(deg):
+def fillPositions(rows, ra, dec, spatial = False):
     """
-    Converts degrees to sexagesimal format (degs:mins:secs).
+    Fills the RA and Dec string, degree and radian columns of hip row tuples from position columns, and appends
+    the HPX pixel ids.
     Args:
-        deg (float): Degree value.
+        rows (List): Row tuples with placeholders in columns 1 - 6.
+        ra (Numpy array): RA of each row in degrees.
+        dec (Numpy array): Dec of each row in degrees.
+        spatial (bool): Append the HPX pixel id of each star.
     Returns:
-        str: Sexagesimal formatted string.
-    """
-    sign = " "
-    if deg < 0:
-        sign = "-"
-        deg = -deg
-    dd = int(deg)
-    rest = (deg - dd) * 60
-    mm = int(rest)
-    rest = (rest - mm) * 60
-    ss = int(rest)
-    rest = (rest - ss) * 1000
-    ms = int(rest)
-    return "%c%02d:%02d:%02d.%03d" % (sign, dd, mm, ss, ms)   
-    
-def deg2SexagHrs(deg):
-    """
-    Converts degrees to sexagesimal format for RA (hrs:mins:secs).
-    Args:
-        deg (float): Degree value.
-    Returns:
-        str: Sexagesimal formatted string.
-    """
-    deg = (deg / 360) * 24
-    hrs = int(deg)
-    rest = (deg - hrs) * 60
-    mins = int(rest)
-    rest = (rest - mins) * 60
-    secs = int(rest)
-    rest = (rest - secs) * 1000
-    ms = int(rest)
-    return "%02d:%02d:%02d.%03d" % (hrs, mins, secs, ms)   
-    
+        List: Row tuples with the position columns filled in.
+    """
+    if len(rows) == 0:
+        return rows
+    columns = list(zip(deg2SexagHrsArray(ra).tolist(), deg2SexagArray(dec).tolist(), ra.tolist(), dec.tolist(),
+                       np.radians(ra).tolist(), np.radians(dec).tolist()))
+    if spatial:
+        hpx = healpix.healpixIds(ra, dec).tolist()
+        return [(row[0],) + position + row[7:] + (pixel,) for row, position, pixel in zip(rows, columns, hpx)]
+    return [(row[0],) + position + row[7:] for row, position in zip(rows, columns)]
+
 def degToRad(degrees):
     """
     Converts degrees to radians.
@@ -502,6 +513,13 @@ def parseArguments(in_args):
     parser.add_argument("-f", "--filePath", dest = "fPath", type = str, help = "location of the hip data file (default = None)", default = "")
     parser.add_argument("-k", "--dropTables", dest = "kill", type = bool, help = "Drop Current tables and restart DB ingestion? (default = False)", default = False)
     parser.add_argument("-v", "--verbose", dest = "verbose", type = bool, help = "Print number of duplicate/new stars to command line (default=False)", default = False)
+    parser.add_argument("-s", "--spatial", dest = "spatial", type = bool, help = "Store an indexed HEALPix pixel id (HPX) with each star for cone searches; the tables must be created with it (-k) (default = False)", default = False)
+    parser.add_argument("-b", "--bulk", dest = "bulk", type = bool, help = "Load the file with LOAD DATA LOCAL INFILE instead of row by row inserts (default = False)", default = False)
+    parser.add_argument("--metrics", dest = "metrics", type = str, help = "Write stage timings and row, reject and duplicate counts to this file (default = None)", default = None)
+    parser.add_argument("--metrics-format", dest = "metricsFormat", type = str, choices = instrument.FORMATS, help = "Metrics file format: 'json' appends one JSON line per file, 'prometheus' rewrites running totals as Prometheus text (default = 'json')", default = "json")
+    parser.add_argument("--bins", dest = "bins", type = str, help = "Folder to write the sky density grid to at the end of the ingest: <catalog>_bins_<resolution>deg.npy and .json, stars per cell like the files in plots/bins (default = None)", default = None)
+    parser.add_argument("--bins-resolution", dest = "binsResolution", type = float, help = "Cell size of the --bins grid in degrees; finer grids are also written added up to 1 degree (default = 1)", default = 1)
+    parser.add_argument("--bins-healpix", dest = "binsHealpix", type = int, help = "Also count --bins HEALPix maps at this order (0 - 12) and write every coarser order too: <catalog>_hpx_<order>.npy and .json (default = None)", default = None)
     args = None
     try:
         args = parser.parse_args(in_args[1:])
@@ -518,6 +536,10 @@ def ingestDB():
         None
     """
     args = parseArguments(sys.argv) 
+    if args.metrics:
+        instrument.configure(args.metrics, args.metricsFormat)
+    if args.bins:
+        density.configure(args.bins, args.binsResolution, args.binsHealpix)
     tNames = ['hip', 'hip_errors_flags']
     killConnections(args.dName)#make sure that any processes still running are closed--for DB performance
     createDatabase(args.dName)
@@ -525,8 +547,10 @@ def ingestDB():
         for i in range(len(tNames)):
             print("Dropping Tables")
             dropTable(databaseName = args.dName, tableName = tNames[i])
-            createTable(databaseName = args.dName, tableName = tNames[i])
-    insertTable(databaseName = args.dName, path = args.fPath, verbose = args.verbose)
+            createTable(databaseName = args.dName, tableName = tNames[i], spatial = args.spatial)
+    insertTable(databaseName = args.dName, path = args.fPath, verbose = args.verbose, bulk = args.bulk, spatial = args.spatial)
+    for path in density.save():
+        print(f"Density bins written to {path}")
    
     
     
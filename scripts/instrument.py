@@ -0,0 +1,315 @@
+import os
+import csv
+import json
+import time
+import threading
+import contextlib
+
+# Stages each file's wall time is split into:
+#   open    - opening the file
+#   read    - pulling lines from the file object (disk reads and gzip decompression)
+#   parse   - splitting lines into fields (csv.reader)
+#   convert - everything else: value conversion (cbf, cnm, fillSexag, ...) and building the row tuples
+#   db      - database round trips (execute, executemany, LOAD DATA, commit)
+#   wait    - blocked on a full queue, waiting for a writer to catch up
+STAGES = ['open', 'read', 'parse', 'convert', 'db', 'wait']
+# parsed counts rows read from a file, rows counts rows inserted; they are reported by different records when
+# one process parses and another inserts
+COUNTERS = ['parsed', 'rows', 'rejects', 'duplicates']
+FORMATS = ['json', 'prometheus']
+
+# The sink is kept in the environment so spawned worker processes pick it up when they import this module
+PATH_VARIABLE = "CATALOG_METRICS"
+FORMAT_VARIABLE = "CATALOG_METRICS_FORMAT"
+PID_VARIABLE = "CATALOG_METRICS_PID"
+
+class TimedCursor:
+    """
+    Wraps a database cursor and adds the time spent in execute and executemany to a stats object's db stage.
+    Everything else is passed through to the cursor.
+    """
+    def __init__(self, cur, stats):
+        """
+        Args:
+            cur (pymysql.cursors.Cursor): Database cursor.
+            stats (FileStats): Stats the round trips are added to.
+        """
+        self.cur = cur
+        self.stats = stats
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.cur.execute(*args, **kwargs)
+        finally:
+            self.stats.seconds['db'] += time.perf_counter() - start
+
+    def executemany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.cur.executemany(*args, **kwargs)
+        finally:
+            self.stats.seconds['db'] += time.perf_counter() - start
+
+    def __iter__(self):
+        return iter(self.cur)
+
+    def __getattr__(self, name):
+        return getattr(self.cur, name)
+
+class FileStats:
+    """
+    Stage timings and counters for one unit of work (a file, a zone, or a batch), emitted as one record by finish().
+    """
+    def __init__(self, catalog, unit):
+        """
+        Args:
+            catalog (str): Catalog name, ex: "2mass".
+            unit (str): File or batch the record describes, ex: "000/0000/000.dat".
+        """
+        self.catalog = catalog
+        self.unit = unit
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Adds the time spent in the body of a with block to a stage.
+        Args:
+            name (str): Stage name from STAGES.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def count(self, name, n = 1):
+        """
+        Adds to a counter.
+        Args:
+            name (str): Counter name from COUNTERS.
+            n (int): Amount to add.
+        """
+        self.counts[name] += n
+
+    def lines(self, f):
+        """
+        Iterates over a file object, adding the time spent getting each line to the read stage.
+        Args:
+            f (file): Open file, ex: from open() or gzip.open().
+        Returns:
+            Iterator: The file's lines.
+        """
+        seconds = self.seconds
+        lines = iter(f)
+        while True:
+            start = time.perf_counter()
+            try:
+                line = next(lines)
+            except StopIteration:
+                seconds['read'] += time.perf_counter() - start
+                return
+            seconds['read'] += time.perf_counter() - start
+            yield line
+
+    def reader(self, f, **kwargs):
+        """
+        csv.reader over a file that adds its line reads to the read stage and its field splitting to the parse stage.
+        Args:
+            f (file): Open file.
+            kwargs: csv.reader arguments, ex: delimiter = ','.
+        Returns:
+            Iterator: Lists of fields.
+        """
+        seconds = self.seconds
+        rows = csv.reader(self.lines(f), **kwargs)
+        while True:
+            start = time.perf_counter()
+            read = seconds['read']
+            try:
+                row = next(rows)
+            except StopIteration:
+                seconds['parse'] += time.perf_counter() - start - (seconds['read'] - read)
+                return
+            seconds['parse'] += time.perf_counter() - start - (seconds['read'] - read)
+            yield row
+
+    def cursor(self, cur):
+        """
+        Args:
+            cur (pymysql.cursors.Cursor): Database cursor.
+        Returns:
+            TimedCursor: The cursor with its round trips added to the db stage.
+        """
+        return TimedCursor(cur, self)
+
+    def record(self):
+        """
+        Returns:
+            Dict: The JSON record; convert is the time not spent in any other stage.
+        """
+        seconds = dict(self.seconds)
+        total = time.perf_counter() - self.started
+        seconds['convert'] = max(0.0, total - sum(seconds[stage] for stage in STAGES if stage != 'convert'))
+        record = {"catalog": self.catalog, "file": self.unit, "pid": os.getpid(), "time": round(time.time(), 3), "total": round(total, 6)}
+        record["seconds"] = {stage: round(value, 6) for stage, value in seconds.items()}
+        record.update(self.counts)
+        return record
+
+    def finish(self, rows = None, duplicates = None, rejects = None, parsed = None):
+        """
+        Emits the record to the configured sink and clears the thread's current stats.
+        Args:
+            rows (int): Rows inserted, if not counted with count().
+            duplicates (int): Duplicates skipped, if not counted with count().
+            rejects (int): Lines that could not be parsed, if not counted with count().
+            parsed (int): Rows parsed (default = rows + duplicates).
+        """
+        for name, value in (('rows', rows), ('duplicates', duplicates), ('rejects', rejects), ('parsed', parsed)):
+            if value is not None:
+                self.counts[name] = value
+        if parsed is None and self.counts['parsed'] == 0:
+            self.counts['parsed'] = self.counts['rows'] + self.counts['duplicates']
+        if getattr(local, "stats", None) is self:
+            local.stats = None
+        emit(self.record())
+
+class NullStats:
+    """
+    Stand-in used when no sink is configured; every hook does the plain operation with no timing.
+    """
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def count(self, name, n = 1):
+        pass
+
+    def lines(self, f):
+        return f
+
+    def reader(self, f, **kwargs):
+        return csv.reader(f, **kwargs)
+
+    def cursor(self, cur):
+        return cur
+
+    def finish(self, rows = None, duplicates = None, rejects = None, parsed = None):
+        pass
+
+NULL = NullStats()
+local = threading.local()
+lock = threading.Lock()
+# Prometheus totals of this process: {catalog: {"files": n, "rows": n, ..., "seconds": {stage: s}}}
+totals = {}
+
+def configure(path, format = "json"):
+    """
+    Turns instrumentation on for this process and the worker processes it starts.
+    Args:
+        path (str): File the records are written to. JSON lines are appended; Prometheus text is rewritten.
+        format (str): "json" or "prometheus".
+    """
+    if format not in FORMATS:
+        raise ValueError(f"metrics format must be one of {FORMATS}")
+    #absolute, since the gaia scripts change directory while they read
+    os.environ[PATH_VARIABLE] = os.path.abspath(path)
+    os.environ[FORMAT_VARIABLE] = format
+    os.environ[PID_VARIABLE] = str(os.getpid())
+
+def enabled():
+    """
+    Returns:
+        bool: Whether a metrics sink is configured.
+    """
+    return bool(os.environ.get(PATH_VARIABLE))
+
+def start(catalog, unit):
+    """
+    Starts the stats for one file or batch and makes them the thread's current stats.
+    Args:
+        catalog (str): Catalog name.
+        unit (str): File or batch name.
+    Returns:
+        FileStats or NullStats: NullStats when instrumentation is off.
+    """
+    if not enabled():
+        return NULL
+    stats = FileStats(catalog, unit)
+    local.stats = stats
+    return stats
+
+def current():
+    """
+    Returns the stats started by this thread, so helpers like parseFile can add to them without an extra argument.
+    Returns:
+        FileStats or NullStats: NullStats when nothing was started.
+    """
+    return getattr(local, "stats", None) or NULL
+
+def outputPath():
+    """
+    Returns the metrics path for this process. Prometheus files of worker processes get the pid before the
+    extension, since each process only knows its own totals.
+    Returns:
+        str: Path of the metrics file.
+    """
+    path = os.environ[PATH_VARIABLE]
+    if os.environ.get(FORMAT_VARIABLE) == "prometheus" and os.environ.get(PID_VARIABLE) != str(os.getpid()):
+        root, ext = os.path.splitext(path)
+        path = f"{root}.{os.getpid()}{ext}"
+    return path
+
+def emit(record):
+    """
+    Writes one record to the configured sink.
+    Args:
+        record (Dict): Record from FileStats.record().
+    """
+    if not enabled():
+        return
+    with lock:
+        if os.environ.get(FORMAT_VARIABLE) == "prometheus":
+            total = totals.setdefault(record["catalog"], dict(dict.fromkeys(['files'] + COUNTERS, 0), seconds = dict.fromkeys(STAGES, 0.0)))
+            total['files'] += 1
+            for name in COUNTERS:
+                total[name] += record[name]
+            for stage in STAGES:
+                total['seconds'][stage] += record["seconds"][stage]
+            #rewritten after every record, since pool workers exit without running atexit handlers
+            writePrometheus()
+        else:
+            #one write per line so records from several processes do not interleave
+            with open(outputPath(), 'a') as f:
+                f.write(json.dumps(record) + "\n")
+
+def prometheusText():
+    """
+    Returns:
+        str: The process's totals in the Prometheus text exposition format.
+    """
+    lines = []
+    metrics = [("files", "Files and batches finished"), ("parsed", "Rows parsed"), ("rows", "Rows inserted"),
+               ("rejects", "Lines that could not be parsed"), ("duplicates", "Duplicate rows skipped")]
+    for name, help in metrics:
+        lines.append(f"# HELP catalog_ingest_{name}_total {help}.")
+        lines.append(f"# TYPE catalog_ingest_{name}_total counter")
+        for catalog, total in sorted(totals.items()):
+            lines.append(f'catalog_ingest_{name}_total{{catalog="{catalog}"}} {total[name]}')
+    lines.append("# HELP catalog_ingest_stage_seconds_total Seconds spent in each ingest stage.")
+    lines.append("# TYPE catalog_ingest_stage_seconds_total counter")
+    for catalog, total in sorted(totals.items()):
+        for stage in STAGES:
+            lines.append(f'catalog_ingest_stage_seconds_total{{catalog="{catalog}",stage="{stage}"}} {total["seconds"][stage]:.6f}')
+    return "\n".join(lines) + "\n"
+
+def writePrometheus():
+    """
+    Rewrites the Prometheus text file through a temporary file, so a scraper never sees a partial file.
+    """
+    path = outputPath()
+    with open(f"{path}.tmp", 'w') as f:
+        f.write(prometheusText())
+    os.replace(f"{path}.tmp", path)
@@ -0,0 +1,247 @@
+import pymysql
+import argparse
+import os
+import shutil
+import sys
+import math
+import configparser
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pymysql.constants import FIELD_TYPE
+
+# Width of the declination bands the tables are partitioned by (degrees)
+DEC_BAND = 10
+
+# catalog: (catalogs.conf section, default database, {table: declination column or (main table, key column)})
+# errors_flags tables have no position, so their rows are put in the band of the matching star in the main table
+CATALOGS = {
+    'gaia': ('GAIA', 'GAIA_dev', {
+        'gaia': 'Decl_deg',
+        'gaia_not_visible': 'Decl_deg',
+        'gaia_errors_flags': ('gaia', 'GAIA_ID'),
+        'gaia_errors_flags_not_visible': ('gaia_not_visible', 'GAIA_ID')}),
+    '2mass': ('2MASS', '2MASS_dev', {
+        '2mass': 'Decl_deg',
+        '2mass_not_visible': 'Decl_deg'}),
+    'gsc240': ('GSC240', 'GSC240_dev', {
+        'gsc240': 'Decl_deg',
+        'gsc240_not_visible': 'Decl_deg',
+        'gsc240_errors_flags': ('gsc240', 'HSTID'),
+        'gsc240_errors_flags_not_visible': ('gsc240_not_visible', 'HSTID')}),
+    'ucac4': ('UCAC4', 'UCAC4_dev', {
+        'ucac4': 'Decl_deg',
+        'ucac4_not_visible': 'Decl_deg',
+        'ucac4_errors_flags': ('ucac4', 'UCAC_ID'),
+        'ucac4_errors_flags_not_visible': ('ucac4_not_visible', 'UCAC_ID')}),
+    'hip': ('HIP', 'HIP_dev', {
+        'hip': 'Decl_Deg',
+        'hip_errors_flags': ('hip', 'HIP_ID')}),
+    'sao2000': ('SAO2000', 'SAO2000_dev', {
+        'sao2000': 'Dec_deg',
+        'sao1950': 'DEGREES(Dec1950_rad)'}),
+}
+
+# declination column of every positional table, used to band the errors_flags tables
+CATALOGS_DEC = {tableName: band for _, _, tables in CATALOGS.values() for tableName, band in tables.items() if not isinstance(band, tuple)}
+
+def connectionParameters(section = "DEFAULT"):
+    """
+    Returns the host, port, user, and password of the MySQL database to connect to.
+    Args:
+        section (str): Section of catalogs.conf to read.
+    Returns:
+        Tuple: (str, int, str, str) - host, port, user, password
+    """
+    config = configparser.ConfigParser()
+    path = '/'.join((os.path.abspath("catalogs.conf").replace('\\', '/')).split('/')[:-1])
+    config.read(os.path.join(path, 'catalogs.conf'))
+    db_host = config[section]['host']
+    db_port = int(config[section]['port'])
+    db_user = config[section]['user']
+    db_password = config[section]['password']
+    return db_host, db_port, db_user, db_password
+
+def connectToDatabase(section = "DEFAULT", db_name = None):
+    """
+    Returns a connection to the MySQL database that streams query results instead of buffering them.
+    Args:
+        section (str): Section of catalogs.conf to read.
+        db_name (str): Name of the database.
+    Returns:
+        pymysql.Connection: MySQL database connection.
+    """
+    db_host, db_port, db_user, db_password = connectionParameters(section)
+    return pymysql.connect(host = db_host, port = db_port, user = db_user, password = db_password, database = db_name,
+                           cursorclass = pymysql.cursors.SSCursor)
+
+def arrowType(typeCode):
+    """
+    Returns the Arrow type for a MySQL column type code.
+    Args:
+        typeCode (int): pymysql FIELD_TYPE code from cursor.description.
+    Returns:
+        pyarrow.DataType: Arrow type of the column.
+    """
+    if typeCode in (FIELD_TYPE.TINY, FIELD_TYPE.SHORT, FIELD_TYPE.LONG, FIELD_TYPE.INT24, FIELD_TYPE.LONGLONG, FIELD_TYPE.YEAR):
+        return pa.int64()
+    if typeCode in (FIELD_TYPE.FLOAT, FIELD_TYPE.DOUBLE, FIELD_TYPE.DECIMAL, FIELD_TYPE.NEWDECIMAL):
+        return pa.float64()
+    if typeCode in (FIELD_TYPE.DATETIME, FIELD_TYPE.TIMESTAMP):
+        return pa.timestamp('us')
+    return pa.string()
+
+def exportQuery(tableName, band, bandWidth = DEC_BAND):
+    """
+    Returns the query that selects a table with its dec_band partition column.
+    Args:
+        tableName (str): Name of the table.
+        band (str or Tuple): Declination column (or expression) of the table, or (main table, key column).
+        bandWidth (int): Width of the declination bands in degrees.
+    Returns:
+        str: SQL query
+    """
+    if isinstance(band, tuple):
+        mainTable, key = band
+        mainDec = CATALOGS_DEC[mainTable]
+        return f"""SELECT t.*, CAST(FLOOR(m.{mainDec} / {bandWidth}) * {bandWidth} AS SIGNED) AS dec_band \
+            FROM {tableName} t LEFT JOIN {mainTable} m ON m.{key} = t.{key};"""
+    return f"SELECT t.*, CAST(FLOOR({band} / {bandWidth}) * {bandWidth} AS SIGNED) AS dec_band FROM {tableName} t;"
+
+def recordBatches(cur, schema, chunkRows = 500000):
+    """
+    Streams the rows of an executed query as Arrow record batches.
+    Args:
+        cur (pymysql.cursors.SSCursor): Cursor with an executed query.
+        schema (pyarrow.Schema): Schema of the query result.
+        chunkRows (int): Rows per record batch.
+    Returns:
+        Generator: pyarrow.RecordBatch objects
+    """
+    while True:
+        rows = cur.fetchmany(chunkRows)
+        if len(rows) == 0:
+            break
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays([pa.array(column, type = field.type) for column, field in zip(columns, schema)], schema = schema)
+
+def exportTable(cur, tableName, band, outDir = "parquet", bandWidth = DEC_BAND, chunkRows = 500000):
+    """
+    Writes a table to outDir/tableName as Parquet files partitioned by declination band (dec_band=-10/, dec_band=0/, ...).
+    Args:
+        cur (pymysql.cursors.SSCursor): Streaming database cursor.
+        tableName (str): Name of the table.
+        band (str or Tuple): Declination column (or expression) of the table, or (main table, key column).
+        outDir (str): Root folder of the export.
+        bandWidth (int): Width of the declination bands in degrees.
+        chunkRows (int): Rows fetched from MySQL at a time.
+    Returns:
+        None
+    """
+    cur.execute(exportQuery(tableName, band, bandWidth))
+    tableDir = os.path.join(outDir, tableName)
+    if os.path.isdir(tableDir):
+        shutil.rmtree(tableDir)
+    schema = pa.schema([(column[0], arrowType(column[1])) for column in cur.description])
+    ds.write_dataset(recordBatches(cur, schema, chunkRows), tableDir, schema = schema, format = "parquet",
+                     partitioning = ds.partitioning(pa.schema([("dec_band", pa.int64())]), flavor = "hive"),
+                     existing_data_behavior = "overwrite_or_ignore", max_rows_per_group = chunkRows)
+
+def exportCatalog(catalog, databaseName = None, outDir = "parquet", bandWidth = DEC_BAND, tables = None, verbose = False):
+    """
+    Exports the tables of a catalog to Parquet.
+    Args:
+        catalog (str): Catalog name, one of CATALOGS.
+        databaseName (str): Name of the database (default = the catalog's *_dev database).
+        outDir (str): Root folder of the export.
+        bandWidth (int): Width of the declination bands in degrees.
+        tables (List): Tables to export (default = every table of the catalog).
+        verbose (bool): Print each table as it is exported.
+    Returns:
+        None
+    """
+    section, defaultName, catalogTables = CATALOGS[catalog]
+    conn = connectToDatabase(section, databaseName or defaultName)
+    cur = conn.cursor()
+    for tableName, band in catalogTables.items():
+        if tables and tableName not in tables:
+            continue
+        try:
+            if verbose:
+                print(f"Exporting {tableName}")
+            exportTable(cur, tableName, band, outDir, bandWidth)
+        except Exception as e:
+            print(f"Export Error {tableName}: {e}")
+    cur.close()
+    conn.close()
+
+def readTable(path, columns = None, filters = None, decMin = None, decMax = None, bandWidth = DEC_BAND):
+    """
+    Reads an exported table. Only the requested columns are read, and only the declination bands (and
+    row groups) that can match the filters are opened.
+    Args:
+        path (str): Folder of the exported table, ex: parquet/gaia.
+        columns (List): Columns to read (default = all).
+        filters (List): Row filters as (column, op, value) tuples that must all hold, ex: [('gmag', '<', 12)].
+        decMin (float): Minimum declination in degrees.
+        decMax (float): Maximum declination in degrees.
+        bandWidth (int): Width of the declination bands the table was exported with.
+    Returns:
+        pandas.DataFrame: Matching rows.
+    """
+    filters = list(filters or [])
+    decColumn = CATALOGS_DEC.get(os.path.basename(os.path.normpath(path)))
+    if decColumn is not None and not decColumn.isidentifier():
+        decColumn = None
+    if decMin is not None:
+        filters.append(('dec_band', '>=', int(math.floor(decMin / bandWidth)) * bandWidth))
+        if decColumn:
+            filters.append((decColumn, '>=', decMin))
+    if decMax is not None:
+        filters.append(('dec_band', '<=', int(math.floor(decMax / bandWidth)) * bandWidth))
+        if decColumn:
+            filters.append((decColumn, '<=', decMax))
+    table = pq.read_table(path, columns = columns, filters = filters or None, partitioning = "hive")
+    return table.to_pandas()
+
+def parseArguments(in_args):
+    """
+    Parses command-line arguments.
+    Args:
+        in_args (List): List of command-line arguments.
+    Returns:
+        argparse.Namespace: Parsed arguments.
+    """
+    description = "Exports catalog tables to Parquet partitioned by declination band"
+    usage = "\n{} [-c catalog] [-o outDir]\n".format(in_args[0])
+    epilog = ""
+    parser = argparse.ArgumentParser(description = description, usage = usage, epilog = epilog)
+    parser.add_argument("-c", "--catalog", dest = "catalog", type = str, help = f"Catalog to export: {', '.join(CATALOGS)} or all (default = 'all')", default = "all")
+    parser.add_argument("-d", "--databaseName", dest = "dName", type = str, help = "Name of the database to export from (default = the catalog's *_dev database)", default = None)
+    parser.add_argument("-t", "--tables", dest = "tables", type = str, help = "Comma separated tables to export (default = every table of the catalog)", default = "")
+    parser.add_argument("-o", "--outDir", dest = "outDir", type = str, help = "Folder to write the Parquet files to (default = 'parquet')", default = "parquet")
+    parser.add_argument("-bw", "--bandWidth", dest = "bandWidth", type = int, help = "Width of the declination bands in degrees (default = 10)", default = DEC_BAND)
+    parser.add_argument("-v", "--verbose", dest = "verbose", type = bool, help = "Print each table as it is exported (default = False)", default = False)
+    args = None
+    try:
+        args = parser.parse_args(in_args[1:])
+    except Exception as e:
+        print(e)
+        parser.print_help()
+        sys.exit(0)
+    return args
+
+def exportAll():
+    """
+    Exports the catalogs selected on the command line.
+    Returns:
+        None
+    """
+    args = parseArguments(sys.argv)
+    catalogs = list(CATALOGS) if args.catalog == "all" else args.catalog.split(",")
+    tables = [table for table in args.tables.split(",") if table]
+    for catalog in catalogs:
+        exportCatalog(catalog, args.dName, args.outDir, args.bandWidth, tables, args.verbose)
+
+if __name__ == "__main__":
+    exportAll()
@@ -0,0 +1,165 @@
+import multiprocessing
+from tqdm import tqdm
+import bulkload
+import connpool
+import density
+import instrument
+
+def insertRows(cur, tableName, columns, rows, bulk = False, batchRows = 0):
+    """
+    Inserts a batch of rows into a table. Duplicate primary keys are skipped and counted.
+    Args:
+        cur (pymysql.cursors.Cursor): Database cursor.
+        tableName (str): Name of the table.
+        columns (List): Column names in the same order as the row tuples.
+        rows (List): List of row tuples.
+        bulk (bool): Load the batch with LOAD DATA LOCAL INFILE instead of one INSERT per row.
+        batchRows (int): Rows per multi-row INSERT statement; 0 inserts one row per statement. A duplicate is
+            left unchanged by ON DUPLICATE KEY UPDATE on the first column, which must be the table's key.
+    Returns:
+        Tuple: (int, int) - rows inserted, duplicate rows skipped
+    """
+    if bulk:
+        return bulkload.bulkInsert(cur, tableName, columns, rows)
+    if batchRows:
+        #executemany sends each slice as one multi-row statement (pymysql splits statements over 1 MB). The no-op
+        #update makes a duplicate key affect 0 rows and an insert 1, so the rest of the slice were duplicates;
+        #unlike INSERT IGNORE, other errors (truncation, out of range values) still raise
+        key = columns[0]
+        sql = f"INSERT INTO {tableName} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) ON DUPLICATE KEY UPDATE {key} = {key};"
+        count = 0
+        for start in range(0, len(rows), batchRows):
+            count += cur.executemany(sql, rows[start:start + batchRows])
+        return count, len(rows) - count
+    sql = f"INSERT INTO {tableName} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))});"
+    count, countdup = 0, 0
+    for values in rows:
+        try:
+            cur.execute(sql, values)
+            count += 1
+        except Exception as e:
+            if e.args[0] != 1062:
+                print(e)
+            countdup += 1
+    return count, countdup
+
+def parserLoop(parse, tasks, batches, done, catalog = "pipeline", bins = None):
+    """
+    Parser process: turns tasks into (tableName, columns, rows) batches and puts them on the bounded batch queue.
+    Args:
+        parse (function): parse(task) returns a list of (tableName, columns, rows) batches.
+        tasks (multiprocessing.Queue): Tasks to parse, ended by None.
+        batches (multiprocessing.Queue): Bounded queue the writers drain.
+        done (multiprocessing.Queue): Receives one item per finished task (for the progress bar).
+        catalog (str): Catalog name used in the metrics records.
+        bins (multiprocessing.Queue): Receives the process's density counts (density.take()) once the tasks run out.
+    """
+    for task in iter(tasks.get, None):
+        #the writers count the inserted rows, so a task's record has its parse timings, parsed rows and rejects
+        stats = instrument.start(catalog, str(task))
+        parsed, count = [], 0
+        try:
+            parsed = parse(task)
+            count = sum(len(rows) for _, _, rows in parsed)
+        except Exception as e:
+            print(f"Parse Error {task}: {e}")
+            parsed = []
+        finally:
+            #finished before the batches are queued, so the record does not count time spent waiting for the writers;
+            #an empty or failed task still gets its record, with parsed = 0
+            stats.finish(parsed = count)
+        try:
+            for batch in parsed:
+                #put blocks while the queue is full, so the parsers wait for the writers
+                batches.put(batch)
+        except Exception as e:
+            print(f"Parse Error {task}: {e}")
+        finally:
+            done.put(task)
+    if bins is not None:
+        bins.put(density.take())
+
+def writerLoop(connect, batches, results, bulk, setup = None, catalog = "pipeline", batchRows = 0):
+    """
+    Writer process: inserts batches over one pooled connection until it receives None, then reports its totals.
+    The connection is health checked when it has been idle, rather than pinged before every batch.
+    Args:
+        connect (function): connect() returns a database connection.
+        batches (multiprocessing.Queue): Queue of (tableName, columns, rows) batches.
+        results (multiprocessing.Queue): Receives the {tableName: [inserted, duplicates]} totals.
+        bulk (bool): Load batches with LOAD DATA LOCAL INFILE.
+        setup (function): setup(conn) runs once on each new connection.
+        catalog (str): Catalog name used in the metrics records.
+        batchRows (int): Rows per multi-row INSERT statement; 0 inserts one row per statement.
+    """
+    totals = {}
+    pool = connpool.ConnectionPool(connect, size = 1, setup = setup)
+    for tableName, columns, rows in iter(batches.get, None):
+        try:
+            stats = instrument.start(catalog, f"{tableName} batch")
+            with pool.connection() as conn:
+                cur = stats.cursor(conn.cursor())
+                c, cd = insertRows(cur, tableName, columns, rows, bulk = bulk, batchRows = batchRows)
+                with stats.stage('db'):
+                    conn.commit()
+                cur.close()
+            stats.finish(rows = c, duplicates = cd, parsed = 0)
+            total = totals.setdefault(tableName, [0, 0])
+            total[0] += c
+            total[1] += cd
+        except Exception as e:
+            print(f"Write Error {tableName}: {e}")
+    pool.close()
+    results.put(totals)
+
+def runPipeline(tasks, parse, connect, parsers = 2, writers = 1, queueSize = 8, bulk = False, setup = None, catalog = "pipeline", batchRows = 0):
+    """
+    Parses tasks in parser processes and inserts the resulting batches from writer processes so that
+    parsing and inserting overlap. The batch queue is bounded, which holds the parsers back when the
+    writers fall behind.
+    Args:
+        tasks (List): Picklable task descriptions, ex: file names.
+        parse (function): Picklable function; parse(task) returns a list of (tableName, columns, rows) batches.
+        connect (function): Picklable function; connect() returns a database connection for a writer.
+        parsers (int): Number of parser processes.
+        writers (int): Number of writer processes.
+        queueSize (int): Maximum number of batches waiting for a writer.
+        bulk (bool): Load batches with LOAD DATA LOCAL INFILE.
+        setup (function): Picklable function; setup(conn) runs once on each writer connection.
+        catalog (str): Catalog name used in the metrics records.
+        batchRows (int): Rows per multi-row INSERT statement in the writers; 0 inserts one row per statement.
+    Returns:
+        Dict: {tableName: [rows inserted, duplicates]}
+    """
+    taskQueue = multiprocessing.Queue()
+    batchQueue = multiprocessing.Queue(maxsize = queueSize)
+    doneQueue = multiprocessing.Queue()
+    resultQueue = multiprocessing.Queue()
+    binsQueue = multiprocessing.Queue()
+    for task in tasks:
+        taskQueue.put(task)
+    for _ in range(parsers):
+        taskQueue.put(None)
+    writerProcs = [multiprocessing.Process(target = writerLoop, args = (connect, batchQueue, resultQueue, bulk, setup, catalog, batchRows)) for _ in range(writers)]
+    parserProcs = [multiprocessing.Process(target = parserLoop, args = (parse, taskQueue, batchQueue, doneQueue, catalog, binsQueue)) for _ in range(parsers)]
+    for proc in writerProcs + parserProcs:
+        proc.start()
+    for _ in tqdm(range(len(tasks))):
+        doneQueue.get()
+    #the parsers count the stars they parse; their counts are collected before they are joined
+    for _ in range(parsers):
+        density.merge(binsQueue.get())
+    for proc in parserProcs:
+        proc.join()
+    for _ in range(writers):
+        batchQueue.put(None)
+    totals = {}
+    #collect the results before joining so the writers are not blocked on a full result queue
+    for _ in range(writers):
+        for tableName, (c, cd) in resultQueue.get().items():
+            total = totals.setdefault(tableName, [0, 0])
+            total[0] += c
+            total[1] += cd
+    for proc in writerProcs:
+        proc.join()
+    return totals
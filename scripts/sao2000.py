@@ -1,10 +1,199 @@
 import pymysql 
 import math
+import numpy as np
 import argparse
 import os
 import sys
 import configparser
+import queue
+import threading
 from tqdm import tqdm
+import bulkload
+import connpool
+import healpix
+import density
+import instrument
+from sexagesimal import padArray
+
+# Fixed width fields of one 204 byte sao.dat line: (name, start byte, width, type, null)
+# type 'i' is read as an int, 'f' as a float and 's' as text kept as is (not stripped);
+# a field whose stripped text equals null is NULL (NaN for floats, None for text)
+SAO_FIELDS = [
+    ('SaoNumber', 0, 6, 'i', None), ('Dup', 6, 1, 's', ''),
+    ('RAh1950', 7, 2, 'i', None), ('RAm1950', 9, 2, 'i', None), ('RAs1950', 11, 2, 'i', None), ('RAfrac1950', 13, 4, 's', None),
+    ('PMRA_1950', 17, 7, 'f', ''), ('PMRA_1950mu', 24, 2, 'i', None), ('RA2m_Flag', 26, 1, 's', ''),
+    ('RA1950_precessed', 27, 6, 'f', None), ('RA1950_precessed_sd', 33, 2, 'i', None), ('Original_Epoch', 35, 6, 'f', None),
+    ('DEsign1950', 41, 1, 's', None), ('DEd1950', 42, 2, 'i', None), ('DEm1950', 44, 2, 'i', None), ('DEs1950', 46, 2, 'i', None), ('DEfrac1950', 48, 3, 's', None),
+    ('PMDec_1950', 51, 6, 'f', ''), ('PMDec_1950mu', 57, 2, 'i', None), ('D2m_Flag', 59, 1, 's', ''),
+    ('DE2s', 60, 5, 'f', None), ('e_DE2', 65, 2, 'i', None), ('Dec_orig_epoch', 67, 6, 'f', None), ('e_Pos', 73, 3, 'i', None),
+    ('PhotMag', 76, 4, 'f', '99.9'), ('VMag', 80, 4, 'f', '99.9'), ('SpectralType', 84, 3, 's', None),
+    ('VMag_src', 87, 2, 'i', None), ('StarNum_src', 89, 2, 'i', None), ('PhotMag_src', 91, 1, 'i', None), ('PM_src', 92, 1, 'i', None),
+    ('SpecType_src', 93, 1, 'i', None), ('Rem', 94, 1, 'i', None), ('VMag_delta', 95, 1, 'i', None), ('PhotMag_delta', 96, 1, 'i', None),
+    ('SrcCatCode', 97, 2, 'i', None), ('SrcCatNum', 99, 5, 'i', None),
+    ('DurchmusterungID', 104, 13, 's', None), ('HenryDraperCatNum', 117, 6, 's', None), ('HDDuplicateID', 123, 1, 's', ''),
+    ('GeneralCatalogNumber1950', 124, 5, 's', None), ('RA1950_rad', 129, 10, 'f', None), ('Dec1950_rad', 139, 11, 'f', None),
+    ('RAh', 150, 2, 'i', None), ('RAm', 152, 2, 'i', None), ('RAs', 154, 2, 'i', None), ('RAfrac', 156, 4, 's', None),
+    ('PMRA', 160, 7, 'f', ''),
+    ('DEsign', 167, 1, 's', None), ('DEd', 168, 2, 'i', None), ('DEm', 170, 2, 'i', None), ('DEs', 172, 2, 'i', None), ('DEfrac', 174, 3, 's', None),
+    ('PMDec', 177, 6, 'f', ''), ('RA_rad', 183, 10, 'f', None), ('Dec_rad', 193, 11, 'f', None)]
+SAO_WIDTH = 204
+
+COLUMNS_1950 = ['SaoNumber', 'Dup', 'RA1950', 'PMRA_1950', 'PMRA_1950mu', 'RA2m_Flag',
+                'RA1950_precessed', 'RA1950_precessed_sd', 'Original_Epoch', 'Dec1950', 'PMDec_1950',
+                'PMDec_1950mu', 'D2m_Flag', 'DE2s', 'e_DE2', 'Dec_orig_epoch', 'e_Pos', 'VMag_src', 'StarNum_src',
+                'PhotMag_src', 'PM_src', 'SpecType_src', 'Rem', 'SrcCatCode', 'SrcCatNum',
+                'DurchmusterungID', 'HenryDraperCatNum', 'HDDuplicateID', 'GeneralCatalogNumber1950', 'RA1950_rad', 'Dec1950_rad']
+COLUMNS_2000 = ['SaoNumber', 'RA', 'PMRA', 'Decl', 'PMDec', 'RA_rad', 'Dec_rad', 'RA_deg', 'Dec_deg',
+                'PhotMag', 'VMag', 'SpectralType', 'VMag_delta', 'PhotMag_delta']
+
+def decodeDigits(raw):
+    """
+    Reads unsigned whole numbers straight from their bytes, digit by digit; leading blanks are skipped.
+    Args:
+        raw (Numpy array): N x width uint8 array of the field's bytes.
+    Returns:
+        Numpy array: int64 values, or None if the field holds anything but digits and blanks.
+    """
+    digits = raw - np.uint8(ord('0'))
+    isDigit = digits < 10
+    if not (isDigit | (raw == ord(' '))).all():
+        return None
+    values = np.zeros(len(raw), dtype = np.int64)
+    for j in range(raw.shape[1]):
+        values = np.where(isDigit[:, j], values * 10 + digits[:, j], values)
+    return values
+
+def decodeField(raw, kind, null):
+    """
+    Converts one fixed width field of every line.
+    Args:
+        raw (Numpy array): N x width uint8 array of the field's bytes.
+        kind (str): 'i', 'f' or 's'.
+        null (str): Stripped text meaning NULL, or None if the field is never NULL.
+    Returns:
+        Numpy array: int64, float64 (NaN for NULL), str, or object (str or None) values.
+    """
+    field = np.ascontiguousarray(raw).view(f'S{raw.shape[1]}').ravel()
+    isNull = np.char.strip(field) == null.encode() if null is not None else None
+    if kind == 's':
+        values = field.astype(str)
+        if isNull is not None:
+            values = values.astype(object)
+            values[isNull] = None
+        return values
+    if kind == 'i' and isNull is None:
+        values = decodeDigits(raw)
+        if values is not None:
+            return values
+    if isNull is not None:
+        field = np.where(isNull, b'0', field)
+    values = field.astype(np.int64 if kind == 'i' else np.float64)
+    if isNull is not None:
+        values[isNull] = np.nan
+    return values
+
+def readSao(fileName, numRows = 99999999):
+    """
+    Reads and decodes sao.dat in one pass: the file is read as bytes into a lines x SAO_WIDTH byte array and
+    every SAO_FIELDS field is converted a whole column at a time.
+    Args:
+        fileName (str): Path to sao.dat.
+        numRows (int): Stop at the first star numbered above this.
+    Returns:
+        Dict: {field name: Numpy array} - one value per star, in file order.
+    """
+    stats = instrument.current()
+    with stats.stage('open'):
+        f = open(f'{fileName}', 'rb')
+    with f, stats.stage('read'):
+        data = f.read()
+    with stats.stage('parse'):
+        raw = np.frombuffer(data, dtype = np.uint8)
+        if len(raw) % (SAO_WIDTH + 1) == 0 and (raw[SAO_WIDTH::SAO_WIDTH + 1] == ord('\n')).all():
+            #every line is full width: the lines are a view of the file's bytes
+            buf = raw.reshape(-1, SAO_WIDTH + 1)[:, :SAO_WIDTH]
+        else:
+            lines = np.array([line for line in data.splitlines() if line.strip()], dtype = f'S{SAO_WIDTH}')
+            buf = lines.view(np.uint8).reshape(len(lines), SAO_WIDTH)
+            #short lines are padded with NUL bytes, which read as blanks
+            buf[buf == 0] = ord(' ')
+    fields = {}
+    for name, start, width, kind, null in SAO_FIELDS:
+        fields[name] = decodeField(buf[:, start:start + width], kind, null)
+        if name == 'SaoNumber':
+            #stars are in SaoNumber order, so the limit keeps a prefix of the file
+            over = np.flatnonzero(fields[name] > numRows)
+            if len(over) > 0:
+                buf = buf[:over[0]]
+                fields[name] = fields[name][:over[0]]
+    return fields
+
+def joinSexag(h, m, s, fraction, sign = None):
+    """
+    Builds "hh:mm:ss.fff" strings from the fields of a position, like the original per-line formatting.
+    Args:
+        h (Numpy array): Hours or degrees.
+        m (Numpy array): Minutes.
+        s (Numpy array): Whole seconds.
+        fraction (Numpy array): Fraction of a second as written in the file, ex: ".123".
+        sign (Numpy array): '+' or '-' for declinations; '+' is left off.
+    Returns:
+        Numpy array: Position strings.
+    """
+    out = np.char.add(np.char.add(padArray(h, 2), ":"), padArray(m, 2))
+    out = np.char.add(np.char.add(np.char.add(out, ":"), padArray(s, 2)), fraction)
+    if sign is not None:
+        out = np.char.add(np.where(sign == '+', '', sign), out)
+    return out
+
+def nanToNone(values):
+    """
+    Args:
+        values (Numpy array): Float values.
+    Returns:
+        Numpy array: Object array of the values, with None for NaN.
+    """
+    return np.where(np.isnan(values), None, values.astype(object))
+
+def sao1950Rows(fields):
+    """
+    Builds the sao1950 row tuples from decoded fields; blank proper motions are stored as 0.
+    Args:
+        fields (Dict): Fields from readSao.
+    Returns:
+        List: Row tuples in COLUMNS_1950 order.
+    """
+    derived = {
+        'RA1950': joinSexag(fields['RAh1950'], fields['RAm1950'], fields['RAs1950'], fields['RAfrac1950']),
+        'Dec1950': joinSexag(fields['DEd1950'], fields['DEm1950'], fields['DEs1950'], fields['DEfrac1950'], fields['DEsign1950']),
+        'PMRA_1950': np.nan_to_num(fields['PMRA_1950'], nan = 0.),
+        'PMDec_1950': np.nan_to_num(fields['PMDec_1950'], nan = 0.)}
+    columns = [derived[name] if name in derived else fields[name] for name in COLUMNS_1950]
+    return list(zip(*[column.tolist() for column in columns]))
+
+def sao2000Rows(fields, spatial = False):
+    """
+    Builds the sao2000 row tuples from decoded fields; blank proper motions are stored as 0 and
+    99.9 magnitudes as NULL.
+    Args:
+        fields (Dict): Fields from readSao.
+        spatial (bool): Append the HPX pixel id to each row.
+    Returns:
+        List: Row tuples in COLUMNS_2000 order (plus HPX).
+    """
+    derived = {
+        'RA': joinSexag(fields['RAh'], fields['RAm'], fields['RAs'], fields['RAfrac']),
+        'Decl': joinSexag(fields['DEd'], fields['DEm'], fields['DEs'], fields['DEfrac'], fields['DEsign']),
+        'PMRA': np.nan_to_num(fields['PMRA'], nan = 0.),
+        'PMDec': np.nan_to_num(fields['PMDec'], nan = 0.),
+        'RA_deg': np.degrees(fields['RA_rad']),
+        'Dec_deg': np.degrees(fields['Dec_rad']),
+        'PhotMag': nanToNone(fields['PhotMag']),
+        'VMag': nanToNone(fields['VMag'])}
+    columns = [derived[name] if name in derived else fields[name] for name in COLUMNS_2000]
+    if spatial:
+        columns.append(healpix.healpixIds(derived['RA_deg'], derived['Dec_deg']))
+    return list(zip(*[column.tolist() for column in columns]))
   
 def connectionParameters():
     """
@@ -20,19 +209,20 @@ def connectionParameters():
     db_password = config['SAO2000']['password']
     return db_host, db_port, db_user, db_password
 
-def connectToDatabase(db_name = None):
+def connectToDatabase(db_name = None, local_infile = False):
     """
     Connects to the MySQL database on the specified server.
     Args:
         db_name (str): Name of the database.
+        local_infile (bool): Allow LOAD DATA LOCAL INFILE on the connection.
     Returns:
         pymysql.connections.Connection: MySQL database connection.
     """
     db_host,db_port,db_user,db_password = connectionParameters()
     if db_name == None:
-        conn = pymysql.connect(host=db_host, port=db_port, user=db_user, password=db_password)
+        conn = pymysql.connect(host=db_host, port=db_port, user=db_user, password=db_password, local_infile=local_infile)
     else:
-        conn = pymysql.connect(host=db_host, port=db_port, user=db_user, password=db_password, database = db_name)
+        conn = pymysql.connect(host=db_host, port=db_port, user=db_user, password=db_password, database = db_name, local_infile=local_infile)
     return conn   
     
 def createDatabase(databaseName = "SAO2000_dev"): 
@@ -110,113 +300,46 @@ def viewTable(databaseName = "SAO2000_dev", name = "sao2000"):
     except:
         print("Cannot View: That table doesn't exist")
 
-def insertIntoTable1950(databaseName = "SAO2000_dev", numRows = 5, fileName = "sao.dat"):  
+def insertIntoTable1950(databaseName = "SAO2000_dev", numRows = 5, fileName = "sao.dat", bulk = False, fields = None):  
     """
     Inserts the specified number of rows into the sao1950 table.
     Args:
         databaseName (str): Name of the database.
         numRows (int): Number of rows to insert.
         fileName (str): Name of the file containing data.
+        bulk (bool): Load the rows with LOAD DATA LOCAL INFILE instead of one INSERT per line.
+        fields (Dict): Fields already decoded by readSao, so the file is not read again.
     Returns:
         None
     """
-    conn = connectToDatabase(db_name = databaseName)
-    cur = conn.cursor()
-    sql = """INSERT INTO sao1950 (SaoNumber, Dup, RA1950, \
-                PMRA_1950,PMRA_1950mu,RA2m_Flag, \
-                RA1950_precessed,RA1950_precessed_sd, \
-                Original_Epoch, Dec1950, PMDec_1950, \
-                PMDec_1950mu, D2m_Flag, DE2s, e_DE2, \
-                Dec_orig_epoch, e_Pos, VMag_src, StarNum_src, \
-                PhotMag_src, PM_src, SpecType_src, Rem, \
-                SrcCatCode, SrcCatNum, \
-                DurchmusterungID, HenryDraperCatNum, HDDuplicateID, \
-                GeneralCatalogNumber1950, RA1950_rad, Dec1950_rad) \
-             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, \
-                 %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, \
-                 %s, %s, %s, %s, %s, %s, %s, %s, %s, %s); 
-        """
-    with open(f'{fileName}', 'r') as f:
-        for line in tqdm(f):
-            line = str.encode(line)
-            SaoNumber = int(line[0:6].decode()) 
-            if SaoNumber > numRows:
-                break
-            Dup = str(line[6:7].decode())
-            if Dup == ' ':
-                Dup = None
-            rah = str("{:02d}".format(int(line[7:9].decode())))
-            ram = str("{:02d}".format(int(line[9:11].decode())))
-            ras = str("{:02d}".format(int(line[11:13].decode())))
-            rass = str(line[13:17].decode())
-            RA1950 =  rah + ":" + ram + ":" + ras + rass
-            PMRA_1950 = line[17:24].decode()
-            PMRA_1950mu = int(line[24:26].decode())
-            RA2m_Flag = str(line[26:27].decode())
-            if RA2m_Flag == ' ':
-                RA2m_Flag = None
-            RA1950_precessed = float(line[27:33].decode())
-            RA1950_precessed_sd = int(line[33:35].decode())
-            Original_Epoch = float(line[35:41].decode())
-            decsign = str(line[41:42].decode())
-            decd = str("{:02d}".format(int(line[42:44].decode())))
-            decm = str("{:02d}".format(int(line[44:46].decode())))
-            decs = str("{:02d}".format(int(line[46:48].decode())))
-            decss = str(line[48:51].decode())
-            if decsign == '+':
-                decsign = ''
-            Dec1950 = decsign + decd + ":" + decm + ":" + decs + decss
-            PMDec_1950 = line[51:57].decode()
-            PMDec_1950mu = int(line[57:59].decode())
-            D2m_Flag = str(line[59:60].decode())
-            if D2m_Flag == ' ':
-                D2m_Flag = None
-            DE2s = float(line[60:65].decode())
-            e_DE2 = int(line[65:67].decode())
-            Dec_orig_epoch = float(line[67:73].decode())
-            e_Pos = int(line[73:76].decode())
-            VMag_src = int(line[87:89].decode())
-            StarNum_src = int(line[89:91].decode())
-            PhotMag_src = int(line[91:92].decode())
-            PM_src = int(line[92:93].decode())
-            SpecType_src = int(line[93:94].decode())
-            Rem = int(line[94:95].decode())
-            SrcCatCode = int(line[97:99].decode())
-            SrcCatNum = int(line[99:104].decode())
-            DurchmusterungID = str(line[104:117].decode())
-            HenryDraperCatNum = str(line[117:123].decode())
-            HDDuplicateID =str(line[123:124].decode())
-            if HDDuplicateID == ' ':
-                HDDuplicateID = None
-            GeneralCatalogNumber1950 =str(line[124:129].decode())
-            RA1950_rad = float(line[129:139].decode())
-            Dec1950_rad = float(line[139:150].decode())  
-            if PMRA_1950 == '      ':
-                PMRA_1950 = 0
-            PMRA_1950 = float(PMRA_1950)
-            if PMDec_1950 == '      ':
-                PMDec_1950 = 0
-            PMDec_1950 = str(PMDec_1950)
-            cur.execute(sql,(SaoNumber, Dup, 
-                RA1950, PMRA_1950, PMRA_1950mu,
-                RA2m_Flag, RA1950_precessed,
-                RA1950_precessed_sd, Original_Epoch,
-                Dec1950, PMDec_1950, PMDec_1950mu,
-                D2m_Flag, DE2s, e_DE2, Dec_orig_epoch,
-                e_Pos, VMag_src, StarNum_src,
-                PhotMag_src, PM_src, SpecType_src,
-                Rem, SrcCatCode, SrcCatNum, DurchmusterungID,
-                HenryDraperCatNum, HDDuplicateID,
-                GeneralCatalogNumber1950,
-                RA1950_rad, Dec1950_rad))
-    conn.commit()
+    conn = connectToDatabase(db_name = databaseName, local_infile = bulk)
+    stats = instrument.start("sao1950", fileName)
+    cur = stats.cursor(conn.cursor())
+    sql = f"""INSERT INTO sao1950 ({', '.join(COLUMNS_1950)}) VALUES ({', '.join(['%s'] * len(COLUMNS_1950))});"""
+    parsed = fields is None
+    if parsed:
+        fields = readSao(fileName, numRows)
+    rows = sao1950Rows(fields)
+    count = 0
+    countdup = 0
+    if bulk:
+        count, countdup = bulkload.bulkInsert(cur, 'sao1950', COLUMNS_1950, rows)
+    else:
+        for values in tqdm(rows):
+            cur.execute(sql, values)
+            count+=1
+    with stats.stage('db'):
+        conn.commit()
     conn.close()
+    #a record for rows decoded elsewhere counts only the inserts
+    stats.finish(rows = count, duplicates = countdup, parsed = None if parsed else 0)
                     
-def createTable2000(databaseName = "SAO2000_dev"): 
+def createTable2000(databaseName = "SAO2000_dev", spatial = False): 
     """
     Creates the sao2000 table.
     Args:
         databaseName (str): Name of the database.
+        spatial (bool): Add the indexed HPX (HEALPix pixel id) column.
     Returns:
         None
     """
@@ -237,6 +360,8 @@ def createTable2000(databaseName = "SAO2000_dev"):
             ADD PhotMag_delta FLOAT; \
             """
     cur.execute(query)
+    if spatial:
+        healpix.addSpatialColumn(cur, 'sao2000')
     conn.commit()
     conn.close()
     
@@ -250,75 +375,139 @@ def radToDeg(radians):
     """
     return math.degrees(radians)
         
-def insertIntoTable2000(databaseName = "SAO2000_dev", numRows = 5, fileName = "sao.dat"): 
+def insertIntoTable2000(databaseName = "SAO2000_dev", numRows = 5, fileName = "sao.dat", bulk = False, spatial = False, fields = None): 
     """
     Inserts the specified number of rows into the sao2000 table.
     Args:
         databaseName (str): Name of the database.
         numRows (int): Number of rows to insert.
         fileName (str): Name of the file containing data.
+        bulk (bool): Load the rows with LOAD DATA LOCAL INFILE instead of one INSERT per line.
+        spatial (bool): Also insert the HPX pixel id of each star.
+        fields (Dict): Fields already decoded by readSao, so the file is not read again.
     Returns:
         None
     """
-    countra, countdec = 0,0
-    conn = connectToDatabase(db_name = databaseName)
-    cur = conn.cursor()
-    sql = """INSERT INTO sao2000 (SaoNumber, RA, PMRA, Decl, PMDec, \
-                                    RA_rad, Dec_rad, RA_deg, Dec_deg, \
-                                    PhotMag, VMag, SpectralType, \
-                                    VMag_delta, PhotMag_delta) \
-             VALUES (%s, %s, %s, %s, %s, %s, %s,%s, %s, %s, %s, %s, %s, %s); 
-        """
-    with open(f'{fileName}', 'r') as f:
-        for line in tqdm(f):
-            line = str.encode(line)
-            SaoNumber = int(line[0:6].decode())
-            if SaoNumber > numRows:
-                break
-            rah = str("{:02d}".format(int(line[150:152].decode())))
-            ram = str("{:02d}".format(int(line[152:154].decode())))
-            ras = str("{:02d}".format(int(line[154:156].decode())))
-            rass = str(line[156:160].decode())
-            RA =  rah + ":" + ram + ":" + ras + rass
-            PMRA = line[160:167].decode()
-            decsign = str(line[167:168].decode())
-            if decsign == '+':
-                decsign = ''
-            decd = str("{:02d}".format(int(line[168:170].decode())))
-            decm = str("{:02d}".format(int(line[170:172].decode())))
-            decs = str("{:02d}".format(int(line[172:174].decode())))
-            decss = str(line[174:177].decode())
-            Decl = decsign + decd + ":" + decm + ":" + decs + decss
-            PMDec = line[177:183].decode() 
-            RA_rad = float(line[183:193].decode())
-            Dec_rad = float(line[193:204].decode())
-            Dec_deg = radToDeg(float(line[193:204].decode()))
-            RA_deg = radToDeg(float(line[183:193].decode()))
-            PhotMag = float(line[76:80].decode())
-            VMag = float(line[80:84].decode())
-            SpectralType = str(line[84:87].decode())
-            VMag_delta = int(line[95:96].decode())
-            PhotMag_delta = int(line[96:97].decode())
-            if PMRA == '      ':
-                countra +=1
-                PMRA = 0
-            PMRA = float(PMRA)
-            if PMDec == '      ':
-                countdec+=1
-                PMDec = 0
-            PMDec = float(PMDec)
-            if VMag == 99.9:
-                VMag = None
-            if PhotMag == 99.9:
-                PhotMag = None
-            cur.execute(sql,(SaoNumber,RA,PMRA,
-                    Decl,PMDec,RA_rad,Dec_rad,
-                    RA_deg,Dec_deg,PhotMag,
-                    VMag,SpectralType,
-                    VMag_delta,PhotMag_delta))
-    conn.commit()
+    conn = connectToDatabase(db_name = databaseName, local_infile = bulk)
+    stats = instrument.start("sao2000", fileName)
+    cur = stats.cursor(conn.cursor())
+    columns = COLUMNS_2000 + ['HPX'] if spatial else COLUMNS_2000
+    sql = f"""INSERT INTO sao2000 ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))});"""
+    parsed = fields is None
+    if parsed:
+        fields = readSao(fileName, numRows)
+        density.add("sao", np.degrees(fields['RA_rad']), np.degrees(fields['Dec_rad']))
+    rows = sao2000Rows(fields, spatial)
+    count = 0
+    countdup = 0
+    if bulk:
+        count, countdup = bulkload.bulkInsert(cur, 'sao2000', columns, rows)
+    else:
+        for values in tqdm(rows):
+            cur.execute(sql, values)
+            count+=1
+    with stats.stage('db'):
+        conn.commit()
     conn.close() 
+    stats.finish(rows = count, duplicates = countdup, parsed = None if parsed else 0)
     
+def insertTables(databaseName = "SAO2000_dev", numRows = 99999999, fileName = "sao.dat", bulk = False, spatial = False, batchRows = 10000):
+    """
+    Fills sao1950 and sao2000 in one pass over sao.dat: the file is decoded once, each batch of stars is split
+    into its sao1950 and sao2000 rows, and two writer threads insert the two tables at the same time, each over
+    its own pooled connection. Both tables get the same stars, so the row limit stops them at the same SaoNumber.
+    If a batch fails, both writers stop and the error is raised once they have finished.
+    Args:
+        databaseName (str): Name of the database.
+        numRows (int): Number of rows to insert.
+        fileName (str): Name of the file containing data.
+        bulk (bool): Load each batch with LOAD DATA LOCAL INFILE instead of a multi-row INSERT.
+        spatial (bool): Also insert the HPX pixel id of each sao2000 star.
+        batchRows (int): Stars per batch handed to the writers.
+    Returns:
+        Dict: {tableName: [rows inserted, duplicates]}
+    """
+    stats = instrument.start("sao", fileName)
+    fields = readSao(fileName, numRows)
+    stars = len(fields['SaoNumber'])
+    density.add("sao", np.degrees(fields['RA_rad']), np.degrees(fields['Dec_rad']))
+    #the writers report the inserted rows and duplicates of each batch
+    stats.finish(parsed = stars)
+    pool = connpool.getPool(connectToDatabase, db_name = databaseName, local_infile = bulk)
+    columns2000 = COLUMNS_2000 + ['HPX'] if spatial else COLUMNS_2000
+    tables = [('sao1950', COLUMNS_1950, sao1950Rows), ('sao2000', columns2000, lambda batch: sao2000Rows(batch, spatial))]
+    totals = {tableName: [0, 0] for tableName, _, _ in tables}
+    #set when a writer fails, so the other writer and the reader stop instead of loading one table further
+    failed = threading.Event()
+    errors = []
+
+    def writer(tableName, columns, batches):
+        """
+        Inserts one table's queued batches until it receives None.
+        """
+        #INSERT IGNORE skips a SaoNumber already in the table and counts only the rows it inserted
+        sql = f"INSERT IGNORE INTO {tableName} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))});"
+        for start, rows in iter(batches.get, None):
+            if failed.is_set():
+                return
+            stats = instrument.start(tableName, f"{fileName} batch {start // batchRows + 1}")
+            try:
+                with pool.connection() as conn:
+                    cur = stats.cursor(conn.cursor())
+                    if bulk:
+                        inserted, _ = bulkload.bulkInsert(cur, tableName, columns, rows)
+                    else:
+                        inserted = cur.executemany(sql, rows)
+                    with stats.stage('db'):
+                        conn.commit()
+                    cur.close()
+                totals[tableName][0] += inserted
+                totals[tableName][1] += len(rows) - inserted
+                stats.finish(rows = inserted, duplicates = len(rows) - inserted, parsed = 0)
+            except Exception as e:
+                print(f"Write Error {tableName} rows {start}-{start + len(rows)}: {e}")
+                errors.append(e)
+                failed.set()
+                return
+
+    def put(batches, item):
+        """
+        Queues an item for a writer, giving up once a writer has failed (a failed writer no longer empties its queue).
+        """
+        while not failed.is_set():
+            try:
+                batches.put(item, timeout = 1)
+                return
+            except queue.Full:
+                pass
+
+    #each table has its own bounded queue, so neither writer gets more than two batches ahead of the other
+    queues = [queue.Queue(maxsize = 2) for _ in tables]
+    writers = [threading.Thread(target = writer, args = (tableName, columns, batches), daemon = True)
+               for (tableName, columns, _), batches in zip(tables, queues)]
+    for thread in writers:
+        thread.start()
+    for start in tqdm(range(0, stars, batchRows)):
+        if failed.is_set():
+            break
+        batch = {name: values[start:start + batchRows] for name, values in fields.items()}
+        for (_, _, buildRows), batches in zip(tables, queues):
+            put(batches, (start, buildRows(batch)))
+    for batches in queues:
+        put(batches, None)
+    if failed.is_set():
+        #a writer waiting on an empty queue still needs its None; a full queue's writer stops at its next batch
+        for batches in queues:
+            try:
+                batches.put_nowait(None)
+            except queue.Full:
+                pass
+    for thread in writers:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return totals
+
 def dropTable(databaseName = "SAO2000_dev", tableName = "sao2000"):
     """
     Drops the specified table if it already exists.
@@ -371,6 +560,15 @@ def parseArguments(in_args):
     parser.add_argument("-d", "--databaseName", dest = "dName", type = str, help = "Name of the database to insert the tables into (default = SAO2000_dev", default = "SAO2000_dev")
     parser.add_argument("-f", "--fileName", dest = "fName", type = str, help = "Path to the star catalog file sao.dat (default = None)", default = "")
     parser.add_argument("-r", "--rows", dest = "rows", type = int, help = "Number of rows to insert into the database (default = All rows)", default = 99999999)
+    parser.add_argument("-s", "--spatial", dest = "spatial", type = bool, help = "Store an indexed HEALPix pixel id (HPX) with each sao2000 star for cone searches (default = False)", default = False)
+    parser.add_argument("-b", "--bulk", dest = "bulk", type = bool, help = "Load the tables with LOAD DATA LOCAL INFILE instead of row by row inserts (default = False)", default = False)
+    parser.add_argument("--batch-rows", dest = "batchRows", type = int, help = "Stars per batch; each batch is inserted into sao1950 and sao2000 by two writers at the same time (default = 10000)", default = 10000)
+    parser.add_argument("--metrics", dest = "metrics", type = str, help = "Write per table stage timings and row and duplicate counts to this file (default = None)", default = None)
+    parser.add_argument("--metrics-format", dest = "metricsFormat", type = str, choices = instrument.FORMATS, help = "Metrics file format: 'json' appends one JSON line per table, 'prometheus' rewrites running totals as Prometheus text (default = 'json')", default = "json")
+    parser.add_argument("--bins", dest = "bins", type = str, help = "Folder to write the sky density grid to at the end of the ingest: <catalog>_bins_<resolution>deg.npy and .json, stars per cell like the files in plots/bins (default = None)", default = None)
+    parser.add_argument("--bins-resolution", dest = "binsResolution", type = float, help = "Cell size of the --bins grid in degrees; finer grids are also written added up to 1 degree (default = 1)", default = 1)
+    parser.add_argument("--bins-healpix", dest = "binsHealpix", type = int, help = "Also count --bins HEALPix maps at this order (0 - 12) and write every coarser order too: <catalog>_hpx_<order>.npy and .json (default = None)", default = None)
+    parser.add_argument("--pool-size", dest = "poolSize", type = int, help = "Most connections each process's connection pool has checked out at once (default = 4)", default = None)
     args = None
     try:
         args = parser.parse_args(in_args[1:])
@@ -387,14 +585,23 @@ def ingestDB():
         None
     """
     args = parseArguments(sys.argv)
+    if args.metrics:
+        instrument.configure(args.metrics, args.metricsFormat)
+    if args.bins:
+        density.configure(args.bins, args.binsResolution, args.binsHealpix)
+    if args.poolSize:
+        connpool.setPoolSize(args.poolSize)
     killConnections()
     createDatabase(databaseName = args.dName)
     dropTable(databaseName = args.dName, tableName = "sao1950")
     dropTable(databaseName = args.dName, tableName = "sao2000")
     createTable1950(databaseName = args.dName)
-    createTable2000(databaseName = args.dName)
-    insertIntoTable1950(databaseName = args.dName, numRows = args.rows, fileName = args.fName)
-    insertIntoTable2000(databaseName = args.dName, numRows = args.rows, fileName = args.fName)
+    createTable2000(databaseName = args.dName, spatial = args.spatial)
+    totals = insertTables(databaseName = args.dName, numRows = args.rows, fileName = args.fName, bulk = args.bulk, spatial = args.spatial, batchRows = args.batchRows)
+    for tableName, (count, countdup) in totals.items():
+        print(f"{tableName}: {count} rows inserted, {countdup} duplicates")
+    for path in density.save():
+        print(f"Density bins written to {path}")
     
 if __name__ == "__main__":
     ingestDB()
@@ -0,0 +1,189 @@
+import numpy as np
+
+def deg2Sexag(deg):
+    """
+    Converts degrees to sexagesimal format (degs:mins:secs).
+    Args:
+        deg (float): Degree value.
+    Returns:
+        str: Sexagesimal formatted string.
+    """
+    sign = " "
+    if deg < 0:
+        sign = "-"
+        deg = -deg
+    dd = int(deg)
+    rest = (deg - dd) * 60
+    mm = int(rest)
+    rest = (rest - mm) * 60
+    ss = int(rest)
+    rest = (rest - ss) * 1000
+    ms = int(rest)
+    return "%c%02d:%02d:%02d.%03d" % (sign, dd, mm, ss, ms)
+
+def deg2SexagHrs(deg):
+    """
+    Converts degrees to sexagesimal format for RA (hrs:mins:secs).
+    Args:
+        deg (float): Degree value.
+    Returns:
+        str: Sexagesimal formatted string.
+    """
+    deg = (deg / 360) * 24
+    hrs = int(deg)
+    rest = (deg - hrs) * 60
+    mins = int(rest)
+    rest = (rest - mins) * 60
+    secs = int(rest)
+    rest = (rest - secs) * 1000
+    ms = int(rest)
+    return "%02d:%02d:%02d.%03d" % (hrs, mins, secs, ms)
+
+def sexag2Deg(sexag):
+    """
+    Converts sexagesimal format (degs mins secs) to degrees.
+    Args:
+        sexag (str): Sexagesimal formatted string.
+    Returns:
+        float: Degree value.
+    """
+    parts = sexag.split(' ')
+    sign = 1
+    if parts[0][0] == '-':
+        sign = -1
+        parts[0] = parts[0][1:]
+    deg = float(parts[0])
+    deg += float(parts[1]) / 60
+    deg += float(parts[2]) / 3600
+    return deg * sign
+
+def sexag2DegHrs(sexag):
+    """
+    Converts sexagesimal format for RA (hrs mins secs) to degrees.
+    Args:
+        sexag (str): Sexagesimal formatted string.
+    Returns:
+        float: Degree value.
+    """
+    parts = sexag.split(' ')
+    hrs = float(parts[0])
+    hrs += float(parts[1]) / 60
+    hrs += float(parts[2]) / 3600
+    return (hrs / 24) * 360
+
+def padArray(values, width):
+    """
+    Formats a column of non-negative whole numbers as zero padded strings (like %0Nd).
+    Args:
+        values (Numpy array): Whole number values.
+        width (int): Minimum number of digits.
+    Returns:
+        Numpy array: Zero padded strings.
+    """
+    return np.char.zfill(values.astype(np.int64).astype(str), width)
+
+def deg2SexagArray(deg):
+    """
+    Column version of deg2Sexag; gives the same strings for every value.
+    Args:
+        deg (Numpy array): Degree values.
+    Returns:
+        Numpy array: Sexagesimal formatted strings.
+    """
+    deg = np.asarray(deg, dtype = np.float64)
+    sign = np.where(deg < 0, "-", " ")
+    deg = np.abs(deg)
+    dd = np.trunc(deg)
+    rest = (deg - dd) * 60
+    mm = np.trunc(rest)
+    rest = (rest - mm) * 60
+    ss = np.trunc(rest)
+    rest = (rest - ss) * 1000
+    ms = np.trunc(rest)
+    out = np.char.add(sign, padArray(dd, 2))
+    out = np.char.add(np.char.add(out, ":"), padArray(mm, 2))
+    out = np.char.add(np.char.add(out, ":"), padArray(ss, 2))
+    return np.char.add(np.char.add(out, "."), padArray(ms, 3))
+
+def deg2SexagHrsArray(deg):
+    """
+    Column version of deg2SexagHrs; gives the same strings for every value.
+    Args:
+        deg (Numpy array): Degree values.
+    Returns:
+        Numpy array: Sexagesimal formatted strings for RA.
+    """
+    deg = (np.asarray(deg, dtype = np.float64) / 360) * 24
+    hrs = np.trunc(deg)
+    rest = (deg - hrs) * 60
+    mins = np.trunc(rest)
+    rest = (rest - mins) * 60
+    secs = np.trunc(rest)
+    rest = (rest - secs) * 1000
+    ms = np.trunc(rest)
+    out = np.char.add(padArray(hrs, 2), ":")
+    out = np.char.add(np.char.add(out, padArray(mins, 2)), ":")
+    out = np.char.add(np.char.add(out, padArray(secs, 2)), ".")
+    return np.char.add(out, padArray(ms, 3))
+
+def splitSexagArray(sexag):
+    """
+    Splits a column of "a b c" sexagesimal strings into numbers.
+    Args:
+        sexag (Numpy array): Sexagesimal formatted strings, without a sign.
+    Returns:
+        Numpy array: Nx3 float values.
+    """
+    return np.array(np.char.split(sexag, ' ').tolist(), dtype = np.float64).reshape(-1, 3)
+
+def sexag2DegArray(sexag):
+    """
+    Column version of sexag2Deg; gives the same values for every string.
+    Args:
+        sexag (Numpy array): Sexagesimal formatted strings.
+    Returns:
+        Numpy array: Degree values.
+    """
+    sexag = np.asarray(sexag, dtype = str)
+    negative = np.char.startswith(sexag, '-')
+    parts = splitSexagArray(np.where(negative, np.char.lstrip(sexag, '-'), sexag))
+    deg = parts[:, 0] + parts[:, 1] / 60
+    deg = deg + parts[:, 2] / 3600
+    return np.where(negative, -deg, deg)
+
+def sexag2DegHrsArray(sexag):
+    """
+    Column version of sexag2DegHrs; gives the same values for every string.
+    Args:
+        sexag (Numpy array): Sexagesimal formatted strings for RA.
+    Returns:
+        Numpy array: Degree values.
+    """
+    parts = splitSexagArray(np.asarray(sexag, dtype = str))
+    hrs = parts[:, 0] + parts[:, 1] / 60
+    hrs = hrs + parts[:, 2] / 3600
+    return (hrs / 24) * 360
+
+def fillSexag(rows, raIndex, decIndex, raDegIndex, decDegIndex):
+    """
+    Fills the RA and Dec string columns of row tuples from their degree columns, a whole batch at a time.
+    Args:
+        rows (List): Row tuples with placeholders in the string columns.
+        raIndex (int): Position of the RA string column.
+        decIndex (int): Position of the Dec string column.
+        raDegIndex (int): Position of the RA degree column.
+        decDegIndex (int): Position of the Dec degree column.
+    Returns:
+        List: Row tuples with the string columns filled in.
+    """
+    if len(rows) == 0:
+        return rows
+    ra = deg2SexagHrsArray(np.fromiter((row[raDegIndex] for row in rows), dtype = np.float64, count = len(rows))).tolist()
+    dec = deg2SexagArray(np.fromiter((row[decDegIndex] for row in rows), dtype = np.float64, count = len(rows))).tolist()
+    filled = []
+    for row, raString, decString in zip(rows, ra, dec):
+        row = list(row)
+        row[raIndex] = raString
+        row[decIndex] = decString
+        filled.append(tuple(row))
+    return filled
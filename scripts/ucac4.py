@@ -5,10 +5,17 @@ import sys
 import math
 import os.path
 import numpy as np
-import struct
 import random
 import configparser
 from tqdm import tqdm
+import bulkload
+import healpix
+import connpool
+import density
+import instrument
+from sexagesimal import deg2SexagArray, deg2SexagHrsArray
+import pipeline
+import functools
 
 def connectionParameters():
     """
@@ -24,23 +31,24 @@ def connectionParameters():
     db_password = config['UCAC4']['password']
     return db_host, db_port, db_user, db_password
 
-def connectToDatabase(db_name = None):
+def connectToDatabase(db_name = None, local_infile = False):
     """
     Returns a connection to the database.
     Args:
         db_name (str): Name of the database.
+        local_infile (bool): Allow LOAD DATA LOCAL INFILE on the connection.
     Returns:
         pymysql.connections.Connection: Database connection.
     """
     db_host,db_port,db_user,db_password = connectionParameters()
     if db_name == None:
-        conn = pymysql.connect(host=db_host, port=db_port, user=db_user, password=db_password)
+        conn = pymysql.connect(host=db_host, port=db_port, user=db_user, password=db_password, local_infile=local_infile)
     else:
-        conn = pymysql.connect(host=db_host, port=db_port, user=db_user, password=db_password, database = db_name)
+        conn = pymysql.connect(host=db_host, port=db_port, user=db_user, password=db_password, database = db_name, local_infile=local_infile)
     return conn
         
 def checkMag(mag):
-     """
+    """
     Changes blank magnitude values to NULL.
     Args:
         mag (float): Magnitude value.
@@ -51,6 +59,84 @@ def checkMag(mag):
         return None
     return mag / 1000
     
+def checkMagArray(mag):
+    """
+    Column version of checkMag: scales magnitudes to float and changes blank (>= 20000) values to NULL.
+    Args:
+        mag (Numpy array): Magnitude values in millimag.
+    Returns:
+        Numpy array: Object array of float magnitudes or None.
+    """
+    return np.where(mag >= 20000, None, mag.astype(np.float64) / 1000)
+
+def nullArray(values, null):
+    """
+    Changes a sentinel value in a column to NULL.
+    Args:
+        values (Numpy array): Column values.
+        null (int): Sentinel value meaning NULL.
+    Returns:
+        Numpy array: Object array of the values or None.
+    """
+    return np.where(values == null, None, values.astype(object))
+
+# Layout of one 78 byte UCAC4 zone record (same order as the u4b struct format)
+ZONE_DTYPE = np.dtype([
+    ('ra', '<i4'), ('spd', '<i4'), ('magm', '<u2'), ('maga', '<u2'),
+    ('sigmag', 'u1'), ('objt', 'u1'), ('cdf', 'u1'),
+    ('sigra', 'i1'), ('sigdc', 'i1'), ('na1', 'u1'), ('nu1', 'u1'), ('cu1', 'u1'),
+    ('cepra', '<u2'), ('cepdc', '<u2'), ('pmrac', '<i2'), ('pmdc', '<i2'),
+    ('sigpmr', 'i1'), ('sigpmd', 'i1'),
+    ('pts_key', '<u4'), ('j_m', '<u2'), ('h_m', '<u2'), ('k_m', '<u2'),
+    ('icqflg', 'u1', (3,)), ('e2mpho', 'u1', (3,)),
+    ('apasm', '<u2', (5,)), ('apase', 'i1', (5,)),
+    ('gcflg', 'i1'), ('icf', '<u4'), ('leda', 'i1'), ('x2m', 'i1'),
+    ('rnm', '<u4'), ('zn2', '<u2'), ('rn2', '<u4')])
+
+def readZone(fileName):
+    """
+    Reads a whole UCAC4 zone file into a structured array.
+    Args:
+        fileName (str): Path to the z### file.
+    Returns:
+        Numpy array: One ZONE_DTYPE record per star.
+    """
+    with instrument.current().stage('read'):
+        return np.fromfile(fileName, dtype = ZONE_DTYPE)
+
+def decodeZone(records, spatial = False):
+    """
+    Converts zone records into ucac4 and ucac4_errors_flags row tuples using column operations.
+    Args:
+        records (Numpy array): ZONE_DTYPE records from readZone.
+        spatial (bool): Append the HPX pixel id to each ucac4 row.
+    Returns:
+        Tuple: (List, List) - ucac4 rows, ucac4_errors_flags rows
+    """
+    RA_deg = records['ra'] / 1000 / 3600
+    Dec_deg = records['spd'] / 1000 / 3600 - 90
+    PmRA = records['pmrac'] / (10000 * 15)
+    PmDec = records['pmdc'] / 10000
+    apasm = records['apasm']
+    apase = records['apase']
+    columns = [records['rnm'], nullArray(records['pts_key'], 0), deg2SexagHrsArray(RA_deg), deg2SexagArray(Dec_deg),
+        RA_deg, Dec_deg, records['ra'], records['spd'], checkMagArray(records['magm']), checkMagArray(records['maga']),
+        records['objt'], records['cdf'], records['sigra'], records['sigdc'],
+        records['cepra'], records['cepdc'], PmRA, PmDec, records['sigpmr'], records['sigpmd'],
+        checkMagArray(records['j_m']), checkMagArray(records['h_m']), checkMagArray(records['k_m'])]
+    columns += [checkMagArray(apasm[:, i]) for i in range(5)]
+    if spatial:
+        columns.append(healpix.healpixIds(RA_deg, Dec_deg))
+    density.add("ucac", RA_deg, Dec_deg)
+    columns_ef = [records['rnm'], records['sigmag'], records['na1'], records['nu1'], records['cu1']]
+    columns_ef += [records['icqflg'][:, i] for i in range(3)]
+    columns_ef += [records['e2mpho'][:, i] for i in range(3)]
+    columns_ef += [nullArray(apase[:, i], 99) for i in range(5)]
+    columns_ef += [records['gcflg'], records['icf'], records['leda'], records['x2m'], records['zn2'], records['rn2']]
+    rows = list(zip(*[column.tolist() for column in columns]))
+    rows_ef = list(zip(*[column.tolist() for column in columns_ef]))
+    return rows, rows_ef
+    
 def createDatabase(databaseName = "UCAC4_dev"): 
     """
     Creates the specified database if it doesn't already exist.
@@ -68,12 +154,13 @@ def createDatabase(databaseName = "UCAC4_dev"):
     except:
         print("DB already created")
     
-def createTable(databaseName = "UCAC4_dev", tableName = "ucac4"): 
+def createTable(databaseName = "UCAC4_dev", tableName = "ucac4", spatial = False): 
     """
     Creates the specified table.
     Args:
         databaseName (str): Name of the database.
         tableName (str): Name of the table.
+        spatial (bool): Add the indexed HPX (HEALPix pixel id) column to the star tables.
     Returns:
         None
     """
@@ -108,6 +195,8 @@ def createTable(databaseName = "UCAC4_dev", tableName = "ucac4"):
                 ADD zn2 INT, ADD rn2 INT; \
                 """
     cur.execute(query)
+    if spatial and (tableName == 'ucac4' or tableName == 'ucac4_not_visible'):
+        healpix.addSpatialColumn(cur, tableName)
     conn.commit()
     conn.close()
 
@@ -132,7 +221,34 @@ def viewTable(databaseName = "UCAC4_dev", tableName = "ucac4"):
         print("Cannot View: That table doesn't exist")
 
     
-def insertTable(databaseName = "UCAC4_dev", fileNum = 1, tableNames = ['ucac4', 'ucac4_errors_flags', 'ucac4_not_visible', 'ucac4_errors_flags_not_visible'], path = "u4b"):  
+COLUMNS = ['UCAC_ID', '2MASS_ID', 'RA', 'Decl', 'RA_deg', 'Decl_deg', 'RA_orig', 'Decl_orig', 'MagModel', 'MagApperature', 'Objt',
+    'Cdf', 'SigRA', 'SigDec', 'CepRA', 'CepDec', 'PmRA', 'PmDec', 'SigPmRA', 'SigPmDec',
+    '2MASS_J', '2MASS_H', '2MASS_K', 'APASS_B', 'APASS_V', 'APASS_g', 'APASS_r', 'APASS_i']
+COLUMNS_EF = ['UCAC_ID', 'SigMag', 'Na1', 'Nu1', 'Cu1', 'icqflg_J', 'icqflg_H', 'icqflg_K', 'e2mpho_J', 'e2mpho_H', 'e2mpho_K',
+    'APASS_B_err', 'APASS_V_err', 'APASS_g_err', 'APASS_r_err', 'APASS_i_err', 'gcflg',
+    'icf', 'leda', 'x2m', 'zn2', 'rn2']
+
+def parseBatches(fileNum, tableNames = ['ucac4', 'ucac4_errors_flags', 'ucac4_not_visible', 'ucac4_errors_flags_not_visible'], path = "u4b", spatial = False):
+    """
+    Pipeline parse step: decodes one zone file into batches for its tables.
+    Args:
+        fileNum (int): Number of the zone file.
+        tableNames (List): Names of the tables to insert data into.
+        path (str): Path to the folder containing the files.
+        spatial (bool): Append the HPX pixel id to each ucac4 row.
+    Returns:
+        List: (tableName, columns, rows) batches
+    """
+    fileName = "{:>03}".format(fileNum)
+    if fileNum < 100:
+        loc = 2
+    else:
+        loc = 0
+    rows, rows_ef = decodeZone(readZone(f'{path}/z{fileName}'), spatial = spatial)
+    columns = COLUMNS + ['HPX'] if spatial else COLUMNS
+    return [(tableNames[loc], columns, rows), (tableNames[loc+1], COLUMNS_EF, rows_ef)]
+
+def insertTable(databaseName = "UCAC4_dev", fileNum = 1, tableNames = ['ucac4', 'ucac4_errors_flags', 'ucac4_not_visible', 'ucac4_errors_flags_not_visible'], path = "u4b", bulk = False, spatial = False):  
     """
     Inserts data from the z*filenum* file into the specified tables.
     Args:
@@ -140,22 +256,29 @@ def insertTable(databaseName = "UCAC4_dev", fileNum = 1, tableNames = ['ucac4',
         fileNum (int): Number of the file to insert data from.
         tableNames (List): Names of the tables to insert data into.
         path (str): Path to the folder containing the files.
+        bulk (bool): Load the zone with LOAD DATA LOCAL INFILE instead of one INSERT per star.
+        spatial (bool): Also insert the HPX pixel id of each star.
     Returns:
         None
     """
+    #reuse a pooled connection across zones instead of logging in for each one
+    pool = connpool.getPool(connectToDatabase, db_name = databaseName, local_infile = bulk)
+    conn = pool.acquire()
+    stats = instrument.start("ucac4", "z{:>03}".format(fileNum))
+    count, countdup = 0, 0
     try:
-        conn = connectToDatabase(db_name = databaseName)
-        cur = conn.cursor()
+        cur = stats.cursor(conn.cursor())
         fileName = "{:>03}".format(fileNum)
         if fileNum < 100:
             loc = 2
         else:
             loc = 0
+        hpxColumn, hpxValue = (", HPX", ",%s") if spatial else ("", "")
         sql = f"""INSERT INTO {tableNames[loc]} (UCAC_ID, 2MASS_ID, \
                 RA, Decl, RA_deg, Decl_deg, RA_orig, Decl_orig, MagModel, MagApperature, Objt, \
                 Cdf, SigRA, SigDec, CepRA, CepDec, PmRA, PmDec, SigPmRA, SigPmDec, \
-                2MASS_J, 2MASS_H, 2MASS_K, APASS_B, APASS_V, APASS_g, APASS_r, APASS_i) \
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s); 
+                2MASS_J, 2MASS_H, 2MASS_K, APASS_B, APASS_V, APASS_g, APASS_r, APASS_i{hpxColumn}) \
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s{hpxValue}); 
             """
         sql_ef = f"""INSERT INTO {tableNames[loc+1]} (UCAC_ID, SigMag, \
                 Na1, Nu1, Cu1, icqflg_J, icqflg_H, icqflg_K, e2mpho_J, e2mpho_H, e2mpho_K, \
@@ -163,129 +286,25 @@ def insertTable(databaseName = "UCAC4_dev", fileNum = 1, tableNames = ['ucac4',
                 icf, leda, x2m, zn2, rn2) \
                 VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s);  
             """
-        with open(f'{path}/z{fileName}', 'rb') as f:
-            ok = True
-            incr = ""
-            while ok:
-                record = f.read(78)
-                if not record:
-                    break
-                raw = struct.unpack("<iiHHBBB" + "bbBBBHH" + "hhbb" + "IHHHBBBBBBHHHHHbbbbbb" + "IbbIHI", record) #unpacks the binary record to the correct format
-                tMASS_pts_key = raw[18]
-                if tMASS_pts_key == 0:
-                    tMASS_pts_key = None
-                RA_orig = raw[0]
-                Decl_orig = raw[1]
-                MagModel = checkMag(raw[2])
-                MagApperature = checkMag(raw[3])
-                Objt = raw[5]
-                Cdf= raw[6]
-                SigRA= raw[7]
-                SigDec= raw[8]
-                CepRA= raw[12]
-                CepDec= raw[13]
-                PmRA= raw[14]
-                PmDec= raw[15]
-                SigPmRA= raw[16]
-                SigPmDec= raw[17]
-                tMASS_J= checkMag(raw[19]) 
-                tMASS_H= checkMag(raw[20]) 
-                tMASS_K= checkMag(raw[21]) 
-                APASS_B= checkMag(raw[28])
-                APASS_V= checkMag(raw[29])
-                APASS_g= checkMag(raw[30])
-                APASS_r= checkMag(raw[31])
-                APASS_i = checkMag(raw[32])
-                RA_deg = RA_orig / 1000 / 3600 
-                Dec_deg = Decl_orig / 1000 / 3600 - 90
-                RA = deg2SexagHrs(RA_deg)
-                Decl = deg2Sexag(Dec_deg)
-                PmRA /= 10000 * 15
-                PmDec /= 10000
-                Sigmag = raw[4]
-                Na1 = raw[9]
-                Nu1 = raw[10]
-                Cu1 = raw[11]
-                icqflg_J = raw[22]
-                icqflg_H = raw[23]
-                icqflg_K = raw[24]
-                e2mpho_J = raw[25]
-                e2mpho_H = raw[26]
-                e2mpho_K = raw[27]
-                APASS_B_err = raw[33]
-                APASS_V_err = raw[34]
-                APASS_g_err = raw[35]
-                APASS_r_err = raw[36]
-                APASS_i_err = raw[37]
-                if APASS_B_err == 99:
-                    APASS_B_err = None
-                if APASS_V_err == 99:
-                    APASS_V_err = None
-                if APASS_g_err == 99:
-                    APASS_g_err = None
-                if APASS_r_err == 99:
-                    APASS_r_err = None
-                if APASS_i_err == 99:
-                    APASS_i_err = None
-                gcflg = raw[38]
-                icf = raw[39]
-                leda = raw[40]
-                x2m = raw[41]
-                rnm = raw[42]
-                zn2 = raw[43]
-                rn2 = raw[44]
-                cur.execute(sql,(rnm, tMASS_pts_key, RA, Decl,
-                RA_deg, Dec_deg, RA_orig, Decl_orig, MagModel, MagApperature, Objt, Cdf, SigRA, SigDec,
-                CepRA, CepDec, PmRA, PmDec, SigPmRA, SigPmDec, tMASS_J, tMASS_H, tMASS_K,
-                APASS_B, APASS_V, APASS_g, APASS_r, APASS_i))
-                cur.execute(sql_ef,(rnm, Sigmag,
-                Na1, Nu1, Cu1, icqflg_J, icqflg_H, icqflg_K, e2mpho_J, e2mpho_H, e2mpho_K,
-                APASS_B_err, APASS_V_err, APASS_g_err, APASS_r_err, APASS_i_err,
-                gcflg, icf, leda, x2m, zn2, rn2))
+        columns = COLUMNS + ['HPX'] if spatial else COLUMNS
+        rows, rows_ef = decodeZone(readZone(f'{path}/z{fileName}'), spatial = spatial)
+        if bulk:
+            count, countdup = bulkload.bulkInsert(cur, tableNames[loc], columns, rows)
+            bulkload.bulkInsert(cur, tableNames[loc+1], COLUMNS_EF, rows_ef)
+        else:
+            for values, values_ef in zip(rows, rows_ef):
+                cur.execute(sql, values)
+                cur.execute(sql_ef, values_ef)
+                count+=1
     except Exception as e: 
         print(e)         
-    conn.commit()
-    conn.close()
+    try:
+        with stats.stage('db'):
+            conn.commit()
+    finally:
+        pool.release(conn, broken = not conn.open)
+    stats.finish(rows = count, duplicates = countdup)
                     
-def deg2Sexag(deg):
-    """
-    Converts degrees to sexagesimal format (degs:mins:secs).
-    Args:
-        deg (float): Degree value.
-    Returns:
-        str: Sexagesimal representation of the degree.
-    """
-    sign = " "
-    if deg < 0:
-        sign = "-"
-        deg = -deg
-    dd = int(deg)
-    rest = (deg - dd) * 60
-    mm = int(rest)
-    rest = (rest - mm) * 60
-    ss = int(rest)
-    rest = (rest - ss) * 1000
-    ms = int(rest)
-    return "%c%02d:%02d:%02d.%03d" % (sign, dd, mm, ss, ms)   
-    
-def deg2SexagHrs(deg):
-    """
-    Converts degrees to sexagesimal format for RA (hrs:mins:secs).
-    Args:
-        deg (float): Degree value.
-    Returns:
-        str: Sexagesimal representation of the degree for RA.
-    """
-    deg = (deg / 360) * 24
-    hrs = int(deg)
-    rest = (deg - hrs) * 60
-    mins = int(rest)
-    rest = (rest - mins) * 60
-    secs = int(rest)
-    rest = (rest - secs) * 1000
-    ms = int(rest)
-    return "%02d:%02d:%02d.%03d" % (hrs, mins, secs, ms)   
-    
 def radToDeg(radians):
     """
     Converts radians to degrees.
@@ -354,6 +373,16 @@ def parseArguments(in_args):
     parser.add_argument("-r", "--randomInsertion", dest="rIns", type=bool, help="Randomly select files to insert? (default = False)", default=False)
     parser.add_argument("-m", "--manuallyInsert", dest="mIns", type=str, help="Manually insert zone files in a specified range (default = 0,0)", default=None)
     parser.add_argument("-k", "--dropTables", dest="kill", type=bool, help="Drop Current tables and restart DB ingestion? (default = False)", default=False)
+    parser.add_argument("-s", "--spatial", dest="spatial", type=bool, help="Store an indexed HEALPix pixel id (HPX) with each star for cone searches; the tables must be created with it (-k) (default = False)", default=False)
+    parser.add_argument("-p", "--parsers", dest="parsers", type=int, help="Number of parser processes; more than 1 decodes zones in parallel and inserts them from separate writer processes (default = 1)", default=1)
+    parser.add_argument("-w", "--writers", dest="writers", type=int, help="Number of writer processes used with -p (default = 1)", default=1)
+    parser.add_argument("-b", "--bulk", dest="bulk", type=bool, help="Load each zone file with LOAD DATA LOCAL INFILE instead of row by row inserts (default = False)", default=False)
+    parser.add_argument("--metrics", dest = "metrics", type = str, help = "Write per zone stage timings and row, reject and duplicate counts to this file (default = None)", default = None)
+    parser.add_argument("--metrics-format", dest = "metricsFormat", type = str, choices = instrument.FORMATS, help = "Metrics file format: 'json' appends one JSON line per zone, 'prometheus' rewrites running totals as Prometheus text (default = 'json')", default = "json")
+    parser.add_argument("--bins", dest = "bins", type = str, help = "Folder to write the sky density grid to at the end of the ingest: <catalog>_bins_<resolution>deg.npy and .json, stars per cell like the files in plots/bins (default = None)", default = None)
+    parser.add_argument("--bins-resolution", dest = "binsResolution", type = float, help = "Cell size of the --bins grid in degrees; finer grids are also written added up to 1 degree (default = 1)", default = 1)
+    parser.add_argument("--bins-healpix", dest = "binsHealpix", type = int, help = "Also count --bins HEALPix maps at this order (0 - 12) and write every coarser order too: <catalog>_hpx_<order>.npy and .json (default = None)", default = None)
+    parser.add_argument("--pool-size", dest = "poolSize", type = int, help = "Most connections each process's connection pool has checked out at once (default = 4)", default = None)
     args = None
     try:
         args = parser.parse_args(in_args[1:])
@@ -371,6 +400,12 @@ def ingestDB():
     """
     tNames = ['ucac4', 'ucac4_errors_flags', 'ucac4_not_visible', 'ucac4_errors_flags_not_visible']
     args = parseArguments(sys.argv) 
+    if args.metrics:
+        instrument.configure(args.metrics, args.metricsFormat)
+    if args.bins:
+        density.configure(args.bins, args.binsResolution, args.binsHealpix)
+    if args.poolSize:
+        connpool.setPoolSize(args.poolSize)
     numFiles = args.fNum
     killConnections(args.dName)
     createDatabase(args.dName)
@@ -378,7 +413,7 @@ def ingestDB():
         for i in range(len(tNames)):
             print("Dropping Tables")
             dropTable(databaseName = args.dName, tableName = tNames[i])
-            createTable(databaseName = args.dName, tableName = tNames[i])
+            createTable(databaseName = args.dName, tableName = tNames[i], spatial = args.spatial)
     if args.mIns != None: #manually insert files
         files = args.mIns.split(",")
         nums = np.arange(int(files[0]),int(files[1])+1,1)
@@ -388,9 +423,17 @@ def ingestDB():
         nums = random.sample(range(1, 901), args.fNum)
     else: #insert a specified number of files
         nums = np.arange(1,901,int(900/args.fNum))    
-    for i in tqdm(range(1,numFiles+1)):
-        insertTable(databaseName = args.dName, fileNum = nums[i-1], tableNames = tNames, path = args.fPath)
+    if args.parsers > 1:
+        parse = functools.partial(parseBatches, tableNames = tNames, path = args.fPath, spatial = args.spatial)
+        connect = functools.partial(connectToDatabase, db_name = args.dName, local_infile = args.bulk)
+        tasks = [int(num) for num in nums[:numFiles]]
+        pipeline.runPipeline(tasks, parse, connect, parsers = args.parsers, writers = args.writers, bulk = args.bulk, catalog = "ucac4")
+    else:
+        for i in tqdm(range(1,numFiles+1)):
+            insertTable(databaseName = args.dName, fileNum = nums[i-1], tableNames = tNames, path = args.fPath, bulk = args.bulk, spatial = args.spatial)
     print(f"Zone Files Inserted: {nums}")
+    for path in density.save():
+        print(f"Density bins written to {path}")
 
 if __name__ == "__main__":
     ingestDB()
@@ -0,0 +1,114 @@
+import os
+import numpy as np
+from ucac4 import ZONE_DTYPE, decodeZone
+
+class UCAC4Reader:
+    """
+    Random access reader for the UCAC4 u4b zone files. Zones are memory-mapped and the
+    u4index.asc index (n0 nn zn j per line: star offset and count of RA bin j in zone zn)
+    is used to read only the records of the RA bins that overlap a query.
+    Zones are 0.2 deg of declination starting at -90, RA bins are 0.25 deg starting at 0.
+    """
+    def __init__(self, path = "u4b", indexFile = None):
+        """
+        Args:
+            path (str): Path to the u4b folder with the z### files.
+            indexFile (str): Path to u4index.asc (default = u4i/u4index.asc next to the u4b folder).
+        """
+        if indexFile == None:
+            indexFile = os.path.join(os.path.dirname(os.path.abspath(path)), "u4i", "u4index.asc")
+        self.path = path
+        self.offsets, self.counts = readIndex(indexFile)
+        self.zones = {}
+
+    def zone(self, zoneNum):
+        """
+        Returns the memory-mapped records of a zone file.
+        Args:
+            zoneNum (int): Zone number (1-900).
+        Returns:
+            Numpy memmap: ZONE_DTYPE records of the zone.
+        """
+        if zoneNum not in self.zones:
+            fileName = "{:>03}".format(zoneNum)
+            self.zones[zoneNum] = np.memmap(f'{self.path}/z{fileName}', dtype = ZONE_DTYPE, mode = 'r')
+        return self.zones[zoneNum]
+
+    def binRecords(self, zoneNum, firstBin, lastBin):
+        """
+        Returns the records of a contiguous range of RA bins in one zone.
+        Args:
+            zoneNum (int): Zone number (1-900).
+            firstBin (int): First RA bin (1-1440).
+            lastBin (int): Last RA bin (1-1440), inclusive.
+        Returns:
+            Numpy memmap: View of the zone records in those bins.
+        """
+        start = self.offsets[zoneNum - 1, firstBin - 1]
+        end = self.offsets[zoneNum - 1, lastBin - 1] + self.counts[zoneNum - 1, lastBin - 1]
+        if end <= start:
+            return np.zeros(0, dtype = ZONE_DTYPE)
+        return self.zone(zoneNum)[start:end]
+
+    def queryBox(self, raMin, raMax, decMin, decMax):
+        """
+        Returns the records inside an RA/Dec box. If raMin > raMax the box wraps through RA 0.
+        Args:
+            raMin (float): Minimum RA in degrees.
+            raMax (float): Maximum RA in degrees.
+            decMin (float): Minimum Dec in degrees.
+            decMax (float): Maximum Dec in degrees.
+        Returns:
+            Numpy array: ZONE_DTYPE records in the box.
+        """
+        if raMin > raMax:
+            return np.concatenate([self.queryBox(raMin, 360., decMin, decMax), self.queryBox(0., raMax, decMin, decMax)])
+        firstZone = min(max(int((decMin + 90) / 0.2) + 1, 1), 900)
+        lastZone = min(max(int((decMax + 90) / 0.2) + 1, 1), 900)
+        firstBin = min(max(int(raMin / 0.25) + 1, 1), 1440)
+        lastBin = min(max(int(raMax / 0.25) + 1, 1), 1440)
+        # records store RA and south pole distance in mas
+        raLow, raHigh = raMin * 3600000, raMax * 3600000
+        spdLow, spdHigh = (decMin + 90) * 3600000, (decMax + 90) * 3600000
+        parts = []
+        for zoneNum in range(firstZone, lastZone + 1):
+            records = self.binRecords(zoneNum, firstBin, lastBin)
+            keep = (records['ra'] >= raLow) & (records['ra'] <= raHigh) & (records['spd'] >= spdLow) & (records['spd'] <= spdHigh)
+            parts.append(np.asarray(records[keep]))
+        if len(parts) == 0:
+            return np.zeros(0, dtype = ZONE_DTYPE)
+        return np.concatenate(parts)
+
+    def queryRows(self, raMin, raMax, decMin, decMax):
+        """
+        Returns the stars inside an RA/Dec box as ucac4 and ucac4_errors_flags row tuples.
+        Args:
+            raMin (float): Minimum RA in degrees.
+            raMax (float): Maximum RA in degrees.
+            decMin (float): Minimum Dec in degrees.
+            decMax (float): Maximum Dec in degrees.
+        Returns:
+            Tuple: (List, List) - ucac4 rows, ucac4_errors_flags rows
+        """
+        return decodeZone(self.queryBox(raMin, raMax, decMin, decMax))
+
+    def close(self):
+        """
+        Releases the memory-mapped zone files.
+        """
+        self.zones = {}
+
+def readIndex(indexFile = "u4index.asc"):
+    """
+    Reads the u4index.asc file.
+    Args:
+        indexFile (str): Path to u4index.asc.
+    Returns:
+        Tuple: (Numpy array, Numpy array) - 900x1440 star offsets and star counts per zone and RA bin
+    """
+    index = np.loadtxt(indexFile, dtype = np.int64, ndmin = 2)
+    offsets = np.zeros((900, 1440), dtype = np.int64)
+    counts = np.zeros((900, 1440), dtype = np.int64)
+    offsets[index[:, 2] - 1, index[:, 3] - 1] = index[:, 0]
+    counts[index[:, 2] - 1, index[:, 3] - 1] = index[:, 1]
+    return offsets, counts